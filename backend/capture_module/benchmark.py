@@ -0,0 +1,101 @@
+# capture_module/benchmark.py
+import argparse
+import gc
+import sys
+import time
+import tracemalloc
+from collections import OrderedDict
+
+from .flow_state import FlowState
+from .packet_decoder import PacketInfo, TCP_ACK, TCP_PSH, TCP_SYN
+from .packet_processor import update_flow
+
+
+def _synthetic_packets(num_flows, packets_per_flow, start_time=1_700_000_000.0):
+    """Yields (PacketInfo, timestamp) for num_flows TCP flows with alternating directions."""
+    for i in range(num_flows):
+        src_ip = f"10.{(i >> 16) & 0xFF}.{(i >> 8) & 0xFF}.{i & 0xFF}"
+        src_port = 1024 + i % 60000
+        for n in range(packets_per_flow):
+            timestamp = start_time + i * 0.001 + n * 0.01
+            flags = TCP_SYN if n == 0 else TCP_ACK | TCP_PSH
+            if n % 2 == 0:
+                yield PacketInfo(src_ip, '192.168.1.5', 6, src_port, 443, 60 + n, 40, flags, 64240), timestamp
+            else:
+                yield PacketInfo('192.168.1.5', src_ip, 6, 443, src_port, 1500, 40, flags, 65535), timestamp
+
+
+def measure_flow_memory(num_flows=100_000, packets_per_flow=4):
+    """
+    Measures the memory held per active flow (flow key + FlowState + dict slot).
+
+    Returns:
+        Dictionary with bytes per flow for FlowState and for the same fields kept in a plain dict.
+    """
+    gc.collect()
+    tracemalloc.start()
+    active_flows = OrderedDict()
+    baseline = tracemalloc.get_traced_memory()[0]
+    for info, timestamp in _synthetic_packets(num_flows, packets_per_flow):
+        update_flow(info, timestamp, active_flows)
+    slots_bytes = tracemalloc.get_traced_memory()[0] - baseline
+
+    # Same flow values in per-flow dicts (the layout used before FlowState)
+    before_dicts = tracemalloc.get_traced_memory()[0]
+    as_dicts = [{name: getattr(flow, name) for name in FlowState.__slots__} for flow in active_flows.values()]
+    dict_bytes = tracemalloc.get_traced_memory()[0] - before_dicts
+    tracemalloc.stop()
+    del as_dicts
+
+    flows = len(active_flows)
+    slots_object_bytes = sys.getsizeof(next(iter(active_flows.values())))
+    return {
+        'flows': flows,
+        'flowstate_bytes_per_flow': slots_bytes / flows,
+        'dict_bytes_per_flow': (slots_bytes - slots_object_bytes * flows + dict_bytes) / flows,
+    }
+
+
+def measure_update_rate(num_flows=10_000, packets_per_flow=20):
+    """Measures update_flow throughput in packets per second."""
+    packets = list(_synthetic_packets(num_flows, packets_per_flow))
+    active_flows = OrderedDict()
+    start = time.perf_counter()
+    for info, timestamp in packets:
+        update_flow(info, timestamp, active_flows)
+    elapsed = time.perf_counter() - start
+    return len(packets) / elapsed
+
+
+def measure_timeout_check(num_flows=100_000, expired=100):
+    """
+    Times one idle-timeout check on a table of num_flows flows where only
+    `expired` of them have timed out.
+    """
+    from . import capture_manager, config
+
+    class _NullWriter:
+        def writerow(self, row):
+            pass
+
+    capture_manager.active_flows = OrderedDict()
+    for info, timestamp in _synthetic_packets(num_flows, 1):
+        update_flow(info, timestamp, capture_manager.active_flows)
+    first_seen = next(iter(capture_manager.active_flows.values())).last_seen
+    check_time = first_seen + config.IDLE_TIMEOUT + expired * 0.001 - 0.0005
+    start = time.perf_counter()
+    capture_manager.check_flow_timeouts(_NullWriter(), check_time)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Capture module micro-benchmarks.")
+    parser.add_argument('--flows', type=int, default=100_000, help="Number of concurrent flows to simulate.")
+    args = parser.parse_args()
+
+    memory = measure_flow_memory(args.flows)
+    print(f"Active flows:            {memory['flows']}")
+    print(f"FlowState bytes/flow:    {memory['flowstate_bytes_per_flow']:.0f}")
+    print(f"Dict-layout bytes/flow:  {memory['dict_bytes_per_flow']:.0f}")
+    print(f"update_flow throughput:  {measure_update_rate():,.0f} packets/s")
+    print(f"Timeout check (100 of {args.flows} expired): {measure_timeout_check(args.flows) * 1000:.2f} ms")
@@ -0,0 +1,127 @@
+# capture_module/capture_filter.py
+import ctypes
+import ipaddress
+import socket
+import struct
+import sys
+
+from . import config
+
+# Linux PF_PACKET socket option returning struct tpacket_stats {tp_packets, tp_drops}
+SOL_PACKET = 263
+PACKET_STATISTICS = 6
+
+
+def _net_terms(nets):
+    """Returns BPF `net` primitives for the valid CIDRs in `nets`."""
+    terms = []
+    for net in nets:
+        try:
+            terms.append(f"net {ipaddress.ip_network(net, strict=False)}")
+        except ValueError:
+            print(f"WARNING: Ignoring invalid network '{net}' in capture filter settings.", file=sys.stderr)
+    return terms
+
+
+def _port_terms(ports):
+    """Returns BPF `port`/`portrange` primitives for the valid ports or 'low-high' ranges in `ports`."""
+    terms = []
+    for port in ports:
+        try:
+            low, _, high = str(port).partition('-')
+            low, high = int(low), int(high or low)
+            if not 0 <= low <= high <= 65535:
+                raise ValueError
+        except ValueError:
+            print(f"WARNING: Ignoring invalid port '{port}' in capture filter settings.", file=sys.stderr)
+            continue
+        terms.append(f"port {low}" if low == high else f"portrange {low}-{high}")
+    return terms
+
+
+def build_bpf_filter():
+    """
+    Combines CAPTURE_BPF_FILTER with the allow/deny network and port lists from
+    config into one BPF expression, so the kernel drops unwanted traffic before
+    it is copied to userspace.
+
+    Returns:
+        The BPF expression, or None if no filtering is configured.
+    """
+    clauses = []
+    if config.CAPTURE_BPF_FILTER:
+        clauses.append(f"({config.CAPTURE_BPF_FILTER})")
+    for terms, negate in ((_net_terms(config.CAPTURE_ALLOW_NETS), False),
+                          (_net_terms(config.CAPTURE_DENY_NETS), True),
+                          (_port_terms(config.CAPTURE_ALLOW_PORTS), False),
+                          (_port_terms(config.CAPTURE_DENY_PORTS), True)):
+        if terms:
+            clause = " or ".join(terms)
+            clauses.append(f"not ({clause})" if negate else f"({clause})")
+    return " and ".join(clauses) or None
+
+
+def open_live_socket(iface, bpf_filter):
+    """
+    Opens a Scapy L2 listening socket with the BPF filter attached in the kernel.
+    Falls back to an unfiltered socket (with a warning) if the filter cannot be
+    compiled, e.g. when libpcap is not installed.
+
+    Returns:
+        Tuple (socket, filter actually applied or None).
+    """
+    from scapy.all import conf
+    from scapy.error import Scapy_Exception
+
+    if bpf_filter:
+        try:
+            return conf.L2listen(iface=iface, filter=bpf_filter), bpf_filter
+        except (ImportError, Scapy_Exception) as e:
+            print(f"WARNING: Could not apply capture filter '{bpf_filter}': {e}", file=sys.stderr)
+            print("WARNING: Capturing unfiltered; non-TCP/UDP packets are dropped in Python and the "
+                  "allow/deny lists are not applied.", file=sys.stderr)
+    return conf.L2listen(iface=iface), None
+
+
+def read_socket_stats(sock):
+    """
+    Reads the capture statistics of a live socket: packets that passed the filter
+    and packets the kernel dropped because the receive buffer was full.
+
+    Args:
+        sock: Socket returned by open_live_socket().
+
+    Returns:
+        Dictionary with 'received', 'dropped' and 'if_dropped' counts, or None if
+        the socket type does not expose statistics.
+    """
+    pcap_fd = getattr(sock, 'pcap_fd', None)
+    if pcap_fd is not None: # libpcap/Npcap socket
+        try:
+            from scapy.libs.winpcapy import pcap_stat, pcap_stats
+            stats = pcap_stat()
+            if pcap_stats(pcap_fd.pcap, ctypes.byref(stats)) != 0:
+                return None
+            return {'received': stats.ps_recv, 'dropped': stats.ps_drop, 'if_dropped': stats.ps_ifdrop}
+        except (ImportError, OSError, AttributeError):
+            return None
+    native = getattr(sock, 'ins', None)
+    if isinstance(native, socket.socket) and native.family == getattr(socket, 'AF_PACKET', None):
+        try:
+            # tp_packets already includes tp_drops; counters reset on every read
+            packets, drops = struct.unpack('II', native.getsockopt(SOL_PACKET, PACKET_STATISTICS, 8))
+        except OSError:
+            return None
+        return {'received': packets, 'dropped': drops, 'if_dropped': 0}
+    return None
+
+
+def print_socket_stats(stats):
+    """Prints the kept/dropped summary for stats returned by read_socket_stats()."""
+    if stats is None:
+        print("Capture statistics are not available for this socket type.")
+        return
+    kept = stats['received'] - stats['dropped']
+    print(f"Kernel capture stats: {stats['received']} packets matched the filter, "
+          f"{kept} delivered, {stats['dropped']} dropped (buffer full), "
+          f"{stats['if_dropped']} dropped by the interface.")
@@ -1,13 +1,13 @@
 # capture_module/capture_manager.py
 import time
-import csv
 import os
 import sys
-from collections import defaultdict
+import threading
+from collections import defaultdict, OrderedDict
 
 # Scapy needs root/admin privileges
 try:
-    from scapy.all import sniff, IP, TCP, UDP, Ether
+    from scapy.all import sniff, conf, RawPcapReader, RawPcapNgReader, IP, TCP, UDP, Ether
 except ImportError:
     print("ERROR: Scapy library not found.", file=sys.stderr)
     print("Please run: pip install scapy", file=sys.stderr)
@@ -19,88 +19,183 @@ except OSError as e:
      sys.exit(1)
 
 from . import config
-from .packet_processor import process_packet
+from .packet_processor import process_packet, process_raw_packet
+from .packet_decoder import DLT_EN10MB
+from .capture_filter import build_bpf_filter, open_live_socket, read_socket_stats, print_socket_stats
 from .feature_calculator import calculate_final_features
+from .flow_sink import open_flow_sink, flow_output_path
 
-# Global dictionary to store active flows (managed within this module)
-active_flows = {}
+# Global table of active flows (managed within this module). Ordered from least to most
+# recently updated: update_flow moves a flow to the end on every packet, so idle flows
+# collect at the front and the timeout check only visits flows that actually expired.
+active_flows = OrderedDict()
 # Global packet counter (managed within this module)
 packet_count = 0
+# Set by request_stop() (e.g. from the backend service) to end a running capture early
+stop_requested = threading.Event()
 
-def check_flow_timeouts(writer, current_time):
+def request_stop():
+    """Asks a running start_capture() to stop; remaining flows are still exported."""
+    stop_requested.set()
+
+def export_flow(writer, key, flow_state):
+    """
+    Calculates the final features of one flow and hands them to the flow sink.
+
+    Returns:
+        True if the row was written, False otherwise.
+    """
+    final_features = calculate_final_features(flow_state, key)
+    try:
+        writer.writerow(final_features)
+        return True
+    except Exception as e:
+        print(f"ERROR: Failed to write flow {key}: {e}", file=sys.stderr)
+        return False
+
+def check_flow_timeouts(writer, current_time, quiet=False):
     """
-    Checks for timed-out flows, calculates their features, writes them to CSV,
-    and removes them from active_flows.
+    Checks for timed-out flows, calculates their features, writes them to the
+    flow sink, and removes them from active_flows.
 
     Args:
-        writer: csv.DictWriter instance for the output file.
+        writer: FlowSink (or anything with writerow) receiving the flow rows.
         current_time: The current timestamp.
+        quiet: Skip the progress banner (flow workers report totals at the end instead).
 
     Returns:
-        True if any flows timed out and were written, False otherwise.
+        Number of timed-out flows written (0 if none timed out).
     """
     global active_flows
     timed_out_keys = []
-    flows_written = False
+    flows_written = 0
 
-    for key, flow_state in list(active_flows.items()): # Iterate over a copy of keys
-        if current_time - flow_state['last_seen'] > config.IDLE_TIMEOUT:
-            timed_out_keys.append(key)
+    for key, flow_state in active_flows.items():
+        if current_time - flow_state.last_seen <= config.IDLE_TIMEOUT:
+            break # Every flow after this one was updated more recently
+        timed_out_keys.append(key)
 
     if timed_out_keys:
-        print(f"\n--- Processing {len(timed_out_keys)} timed-out flows ---")
+        if not quiet:
+            print(f"\n--- Processing {len(timed_out_keys)} timed-out flows ---")
         for key in timed_out_keys:
-            if key in active_flows: # Check again in case of race conditions (unlikely here)
-                flow_state = active_flows.pop(key)
-                final_features = calculate_final_features(flow_state, key)
-                try:
-                    writer.writerow(final_features)
-                    # print(f"Saved flow {final_features.get('Flow ID', key)} to {config.OUTPUT_CSV_FILE}")
-                    flows_written = True
-                except Exception as e:
-                    print(f"ERROR: Failed to write flow {key} to CSV: {e}", file=sys.stderr)
-        print("-----------------------------------------------\n") 
+            flow_state = active_flows.pop(key, None)
+            if flow_state is not None and export_flow(writer, key, flow_state):
+                flows_written += 1
+        if not quiet:
+            print("-----------------------------------------------\n")
     return flows_written
 
-def process_remaining_flows(writer):
+def process_remaining_flows(writer, quiet=False):
     """
     Processes all flows remaining in active_flows at the end of capture.
 
     Args:
-        writer: csv.DictWriter instance for the output file.
+        writer: FlowSink (or anything with writerow) receiving the flow rows.
+        quiet: Skip the progress messages (flow workers report totals at the end instead).
+
+    Returns:
+        Number of remaining flows written.
     """
     global active_flows
-    remaining_keys = list(active_flows.keys())
-    if remaining_keys:
-        print(f"\n--- Processing {len(remaining_keys)} remaining flows ---")
+    flows_written = 0
+    if active_flows:
+        if not quiet:
+            print(f"\n--- Processing {len(active_flows)} remaining flows ---")
         while active_flows: # Process until empty
             key, flow_state = active_flows.popitem() # Efficiently get and remove
-            final_features = calculate_final_features(flow_state, key)
-            try:
-                writer.writerow(final_features)
-            except Exception as e:
-                print(f"ERROR: Failed to write remaining flow {key} to CSV: {e}", file=sys.stderr)
-        print(f"Finished writing remaining flows to {config.OUTPUT_CSV_FILE}")
-    else:
+            if export_flow(writer, key, flow_state):
+                flows_written += 1
+        if not quiet:
+            print(f"Finished writing remaining flows to {getattr(writer, 'path', 'the flow sink')}")
+    elif not quiet:
         print("\nNo remaining flows in memory to process.")
+    return flows_written
+
 
+def read_raw_pcap(pcap_path):
+    """
+    Streams raw frames from a .pcap/.pcapng file without dissecting them.
 
-def start_capture():
+    Yields:
+        Tuples (frame_bytes, linktype, timestamp).
+    """
+    with RawPcapReader(pcap_path) as reader:
+        if isinstance(reader, RawPcapNgReader):
+            for data, meta in reader:
+                if stop_requested.is_set():
+                    break
+                yield data, meta.linktype, ((meta.tshigh << 32) + meta.tslow) / meta.tsresol
+        else:
+            linktype = reader.linktype
+            ticks = 1_000_000_000 if reader.nano else 1_000_000
+            for data, meta in reader:
+                if stop_requested.is_set():
+                    break
+                # Integer arithmetic keeps the timestamp identical to Scapy's packet.time
+                yield data, linktype, (meta.sec * ticks + meta.usec) / ticks
+
+def sniff_raw(sock, timeout):
+    """
+    Reads raw frames from an open live socket for `timeout` seconds, skipping the
+    Scapy dissection that sniff() performs on every packet.
+
+    Yields:
+        Tuples (frame_bytes, linktype, timestamp).
+    """
+    deadline = time.time() + timeout
+    while not stop_requested.is_set():
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            break
+        if not sock.select([sock], min(remaining, 0.5)): # Wake up regularly to notice request_stop()
+            continue
+        cls, data, ts = sock.recv_raw()
+        if data is None:
+            continue
+        linktype = conf.l2types.layer2num.get(cls, DLT_EN10MB)
+        yield data, linktype, ts if ts is not None else time.time()
+
+
+def start_capture(pcap_path=None, flow_sink=None):
     """
     Main function to start the packet capture process.
+
+    Args:
+        pcap_path: Optional path to a .pcap/.pcapng file. When given, packets are
+                   replayed from the file at full disk speed instead of sniffing
+                   a live interface, and all timing (IATs, flow timeouts) follows
+                   the packets' capture timestamps.
+        flow_sink: Optional FlowSink receiving the finished flows (e.g. a QueueFlowSink
+                   feeding the streaming predictor). Defaults to the FLOW_OUTPUT_FORMAT
+                   file sink. The sink is closed when the capture ends.
     """
     global active_flows, packet_count
-    active_flows = {} # Reset state if called multiple times
+    active_flows = OrderedDict() # Reset state if called multiple times
     packet_count = 0
+    stop_requested.clear()
+    pcap_path = pcap_path or config.PCAP_FILE
+    offline = pcap_path is not None
 
-    print(f"Starting packet capture on interface: {config.INTERFACE if config.INTERFACE else 'default'}...")
-    print(f"Capture duration: {config.CAPTURE_DURATION} seconds")
-    print(f"Idle timeout: {config.IDLE_TIMEOUT} seconds")
-    print(f"Output CSV: {config.OUTPUT_CSV_FILE}")
+    if offline:
+        if not os.path.isfile(pcap_path):
+            print(f"ERROR: Capture file '{pcap_path}' not found.", file=sys.stderr)
+            return
+        print(f"Replaying packets from capture file: {pcap_path}...")
+    else:
+        print(f"Starting packet capture on interface: {config.INTERFACE if config.INTERFACE else 'default'}...")
+        print(f"Capture duration: {config.CAPTURE_DURATION} seconds")
+    print(f"Idle timeout: {config.IDLE_TIMEOUT} seconds, active timeout: {config.ACTIVE_TIMEOUT} seconds")
+    if flow_sink is not None:
+        output_path = flow_sink.path
+        print(f"Output: {output_path}")
+    else:
+        output_path = flow_output_path(config.OUTPUT_CSV_FILE, config.FLOW_OUTPUT_FORMAT.lower())
+        print(f"Output ({config.FLOW_OUTPUT_FORMAT}): {output_path}")
     print("Press Ctrl+C to stop early.")
 
     # Ensure the output directory exists (if OUTPUT_CSV_FILE includes a path)
-    output_dir = os.path.dirname(config.OUTPUT_CSV_FILE)
+    output_dir = os.path.dirname(output_path) if flow_sink is None else ''
     if output_dir and not os.path.exists(output_dir):
         try:
             os.makedirs(output_dir)
@@ -109,39 +204,78 @@ def start_capture():
             print(f"ERROR: Could not create output directory '{output_dir}': {e}", file=sys.stderr)
             return 
 
-    csvfile = None 
     writer = None
+    live_socket = None
 
     try:
-        with open(config.OUTPUT_CSV_FILE, 'w', newline='', encoding='utf-8') as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=config.CSV_HEADER)
-            writer.writeheader()
-            print("CSV header written.")
-            csvfile.flush()
-            last_timeout_check = time.time()
-            start_sniff_time = time.time()
-            def packet_callback_wrapper(packet):
-                nonlocal last_timeout_check, writer, csvfile, start_sniff_time
-                global packet_count
-                process_packet(packet, active_flows)
-                packet_count += 1
-                current_time = time.time()
-                elapsed = current_time - start_sniff_time
+        writer = flow_sink if flow_sink is not None else open_flow_sink(output_path)
+        if writer is None:
+            return
+        last_timeout_check = None # Packet-clock time of the last timeout scan
+        start_sniff_time = time.time()
+        def after_packet(current_time, exported):
+            nonlocal last_timeout_check, writer, start_sniff_time
+            global packet_count
+            packet_count += 1
+            if exported is not None:
+                # Flow finished by this packet (idle gap or ACTIVE_TIMEOUT): hand its record to the sink
+                export_flow(writer, *exported)
+            # Timeouts follow the packet clock so replayed captures expire flows exactly as they did live
+            if last_timeout_check is None:
+                last_timeout_check = current_time
+            if offline:
+                if packet_count % config.REPLAY_PROGRESS_INTERVAL == 0:
+                    print(f"\rProcessed: {packet_count} packets. Active flows: {len(active_flows)}.", end="")
+            else:
+                elapsed = time.time() - start_sniff_time
                 remaining = max(0, config.CAPTURE_DURATION - elapsed)
                 print(f"\rProcessed: {packet_count} packets. Active flows: {len(active_flows)}. Time left: {remaining:.0f}s", end="")
-                if packet_count % 1000 == 0 or current_time - last_timeout_check > 5.0:
-                    if check_flow_timeouts(writer, current_time):
-                        csvfile.flush() 
-                    last_timeout_check = current_time
+            if packet_count % 1000 == 0 or current_time - last_timeout_check > 5.0:
+                check_flow_timeouts(writer, current_time)
+                writer.poll() # Write out buffered flows once FLOW_SINK_FLUSH_INTERVAL has passed
+                last_timeout_check = current_time
+        def packet_callback_wrapper(packet):
+            exported = process_packet(packet, active_flows)
+            after_packet(float(packet.time), exported)
+
+        if not offline:
+            # The BPF filter runs in the kernel: filtered-out frames are never copied to Python
+            live_socket, bpf_filter = open_live_socket(config.INTERFACE, build_bpf_filter())
+            print(f"Capture filter: {bpf_filter if bpf_filter else 'none'}")
+
+        if config.FAST_DECODER or config.CAPTURE_WORKERS > 1:
+            # Byte-level decoding: no Scapy packet objects in the hot path
+            if offline:
+                raw_source = read_raw_pcap(pcap_path)
+            else:
+                print(f"\nSniffing for {config.CAPTURE_DURATION} seconds...")
+                raw_source = sniff_raw(live_socket, config.CAPTURE_DURATION)
+            if config.CAPTURE_WORKERS > 1:
+                from .sharded_capture import run_sharded_capture
+                # Workers export their own timed-out and remaining flows through the merged writer
+                packet_count = run_sharded_capture(raw_source, writer, config.CAPTURE_WORKERS)
+            else:
+                for data, linktype, timestamp in raw_source:
+                    exported = process_raw_packet(data, timestamp, active_flows, linktype)
+                    after_packet(timestamp, exported)
+        elif offline:
+            sniff(offline=pcap_path, prn=packet_callback_wrapper, store=False,
+                  stop_filter=lambda _: stop_requested.is_set())
+        else:
             print(f"\nSniffing for {config.CAPTURE_DURATION} seconds...")
-            sniff(prn=packet_callback_wrapper, store=False, iface=config.INTERFACE, timeout=config.CAPTURE_DURATION)
+            sniff(opened_socket=live_socket, prn=packet_callback_wrapper, store=False, timeout=config.CAPTURE_DURATION,
+                  stop_filter=lambda _: stop_requested.is_set())
 
+        if stop_requested.is_set():
+            print("\n\nCapture stopped on request.")
+        if offline:
+            print(f"\n\nReplay finished in {time.time() - start_sniff_time:.2f} seconds.")
+        else:
             print(f"\n\nCapture finished after {config.CAPTURE_DURATION} seconds or timeout.")
-            print(f"Total packets processed: {packet_count}")
+            print_socket_stats(read_socket_stats(live_socket))
+        print(f"Total packets processed: {packet_count}")
 
-            if writer and csvfile and not csvfile.closed:
-                process_remaining_flows(writer)
-                csvfile.flush()
+        process_remaining_flows(writer)
 
     except PermissionError:
         print("\nERROR: Permission denied.", file=sys.stderr)
@@ -151,20 +285,24 @@ def start_capture():
          if "No such device" in str(e) or "Interface not found" in str(e) :
               print(f"\nERROR: Network interface '{config.INTERFACE}' not found. Check available interfaces.", file=sys.stderr)
          elif "Permission denied" in str(e): # Could be file write permission
-              print(f"\nERROR: Permission denied writing to '{config.OUTPUT_CSV_FILE}'. Check permissions.", file=sys.stderr)
+              print(f"\nERROR: Permission denied writing to '{output_path}'. Check permissions.", file=sys.stderr)
          else:
               print(f"\nERROR: OSError during capture: {e}", file=sys.stderr)
     except KeyboardInterrupt:
         print("\nCapture stopped by user (Ctrl+C).")
         # Process remaining flows even if stopped early
-        if writer and csvfile and not csvfile.closed:
+        if writer is not None and not writer.closed:
             print("Processing remaining flows before exit...")
             process_remaining_flows(writer)
-            csvfile.flush()
     except Exception as e:
         print(f"\nERROR: An unexpected error occurred during capture: {e}", file=sys.stderr)
         import traceback
         traceback.print_exc()
     finally:
+        if live_socket is not None:
+            live_socket.close()
+        if writer is not None:
+            writer.close() # Writes the last buffered batch (and the Parquet/Arrow footer)
+            print(f"Wrote {writer.rows_written} flows to {output_path}")
         print("Capture process cleanup complete.")
 
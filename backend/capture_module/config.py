@@ -4,8 +4,27 @@ import time
 # --- Capture Settings ---
 INTERFACE = None # Auto-select or specify, e.g., "eth0", "Wi-Fi"
 IDLE_TIMEOUT = 60 # Seconds before a flow is considered inactive
+ACTIVE_TIMEOUT = 120 # Seconds: a flow still running after this long is exported and restarted (CICFlowMeter flow timeout)
+ACTIVITY_TIMEOUT = 5.0 # Seconds of silence that end an active period (Active */Idle * features)
 CAPTURE_DURATION = 10 # Seconds to capture packets (adjust as needed)
-OUTPUT_CSV_FILE = 'network_flows.csv' # Relative path within backend/
+OUTPUT_CSV_FILE = 'network_flows.csv' # Relative path within backend/ (extension follows FLOW_OUTPUT_FORMAT)
+FLOW_OUTPUT_FORMAT = 'csv' # 'csv', 'parquet' or 'arrow' (Arrow IPC); the binary formats need pyarrow
+FLOW_SINK_BATCH_SIZE = 1000 # Finished flows buffered before they are written out
+FLOW_SINK_FLUSH_INTERVAL = 5.0 # Seconds: buffered flows are written out at least this often
+PCAP_FILE = None # Path to a .pcap/.pcapng file to replay instead of sniffing live
+REPLAY_PROGRESS_INTERVAL = 10000 # Print replay progress every N packets
+FAST_DECODER = True # Decode headers from raw bytes (packet_decoder) instead of full Scapy dissection
+CAPTURE_WORKERS = 1 # >1: shard flow tracking across this many worker processes (sharded_capture)
+SHARD_BATCH_SIZE = 512 # Packets (and finished flow rows) sent between processes per message
+SHARD_QUEUE_DEPTH = 64 # Max batches queued per worker before the reader blocks
+SHARD_LIVENESS_TIMEOUT = 1.0 # Seconds blocked on a worker's queue before checking the worker is still alive
+
+# --- Capture Filter (live capture only, applied in the kernel) ---
+CAPTURE_BPF_FILTER = "(ip or ip6) and (tcp or udp)" # Base BPF expression; None/"" captures everything
+CAPTURE_ALLOW_NETS = [] # CIDRs, e.g. ["10.0.0.0/8", "2001:db8::/32"]: only capture traffic to/from these
+CAPTURE_DENY_NETS = [] # CIDRs never captured, e.g. a backup server's subnet
+CAPTURE_ALLOW_PORTS = [] # Ports or "low-high" ranges: only capture traffic on these
+CAPTURE_DENY_PORTS = [] # Ports or ranges never captured, e.g. [22] to skip your own SSH session
 
 # --- CSV Header Definition ---
 # IMPORTANT: Must match keys in the dictionary returned by feature_calculator.calculate_final_features
@@ -28,7 +47,8 @@ CSV_HEADER = [
     'Subflow Fwd Pkts', 'Subflow Fwd Byts', 'Subflow Bwd Pkts', 'Subflow Bwd Byts',
     'Init Fwd Win Byts', 'Init Bwd Win Byts', 'Fwd Act Data Pkts', 'Fwd Seg Size Min',
     'Active Mean', 'Active Std', 'Active Max', 'Active Min', 'Idle Mean',
-    'Idle Std', 'Idle Max', 'Idle Min', 'Protocol_0', 'Protocol_6', 'Protocol_17'
+    'Idle Std', 'Idle Max', 'Idle Min', 'Protocol_0', 'Protocol_6', 'Protocol_17',
+    'Timestamp Epoch', # Not a model feature: lets the prediction module skip parsing 'Timestamp'
 ]
 
 # --- Placeholder Values ---
@@ -37,7 +57,5 @@ PLACEHOLDER_FEATURES = [
     'Fwd Byts/b Avg', 'Fwd Pkts/b Avg', 'Fwd Blk Rate Avg',
     'Bwd Byts/b Avg', 'Bwd Pkts/b Avg', 'Bwd Blk Rate Avg',
     'Subflow Fwd Pkts', 'Subflow Fwd Byts', 'Subflow Bwd Pkts', 'Subflow Bwd Byts',
-    'Active Mean', 'Active Std', 'Active Max', 'Active Min',
-    'Idle Mean', 'Idle Std', 'Idle Max', 'Idle Min'
 ]
 DEFAULT_PLACEHOLDER_VALUE = 0
@@ -1,69 +1,56 @@
 # capture_module/feature_calculator.py
 import time
-import statistics
 from .config import CSV_HEADER, PLACEHOLDER_FEATURES, DEFAULT_PLACEHOLDER_VALUE
 
-def _safe_stat(func, data, default=0):
-    """Safely compute statistics, handling empty or single-element lists."""
-    if not data:
-        return default
-    if len(data) < 2 and func in (statistics.stdev, statistics.variance):
-        return default # Standard deviation/variance require at least 2 points
-    try:
-        return func(data)
-    except statistics.StatisticsError:
-        return default # Should not happen with checks above, but just in case
-    except ZeroDivisionError:
-         return default # e.g. for mean of empty list if check failed
-
 def calculate_final_features(flow_state, flow_key_tuple):
     """
     Calculates derived network flow features from the flow state.
 
     Args:
-        flow_state: Dictionary containing the aggregated state of the flow.
+        flow_state: FlowState holding the aggregated state of the flow.
         flow_key_tuple: The tuple key used to identify the flow.
 
     Returns:
         A dictionary where keys match the CSV_HEADER.
     """
     features = {}
-    flow_duration_sec = flow_state['last_seen'] - flow_state['start_time']
+    flow_duration_sec = flow_state.last_seen - flow_state.start_time
     flow_duration_sec_safe = flow_duration_sec if flow_duration_sec > 0 else 1e-9
 
     # --- Basic Flow Identifiers ---
-    features['Flow ID'] = flow_state.get('flow_id', '-'.join(map(str, flow_key_tuple)))
-    features['Src IP'] = flow_state['src_ip']
-    features['Src Port'] = flow_state['src_port']
-    features['Dst IP'] = flow_state['dst_ip']
-    features['Dst Port'] = flow_state['dst_port']
-    features['Protocol'] = flow_state['protocol']
-    features['Timestamp'] = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(flow_state['last_seen']))
+    features['Flow ID'] = flow_state.flow_id
+    features['Src IP'] = flow_state.src_ip
+    features['Src Port'] = flow_state.src_port
+    features['Dst IP'] = flow_state.dst_ip
+    features['Dst Port'] = flow_state.dst_port
+    features['Protocol'] = flow_state.protocol
+    features['Timestamp'] = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(flow_state.last_seen))
+    features['Timestamp Epoch'] = float(flow_state.last_seen) # Same instant as Timestamp, in seconds; read without string parsing
 
     # --- Duration and Packet Counts ---
     features['Flow Duration'] = flow_duration_sec * 1_000_000 # Microseconds often expected
-    features['Tot Fwd Pkts'] = flow_state['fwd_packet_count']
-    features['Tot Bwd Pkts'] = flow_state['bwd_packet_count']
-    features['TotLen Fwd Pkts'] = flow_state['fwd_total_bytes']
-    features['TotLen Bwd Pkts'] = flow_state['bwd_total_bytes']
+    features['Tot Fwd Pkts'] = flow_state.fwd_packet_count
+    features['Tot Bwd Pkts'] = flow_state.bwd_packet_count
+    features['TotLen Fwd Pkts'] = flow_state.fwd_total_bytes
+    features['TotLen Bwd Pkts'] = flow_state.bwd_total_bytes
 
     # --- Packet Length Statistics ---
-    fwd_pkts = flow_state['fwd_pkt_lengths']
-    bwd_pkts = flow_state['bwd_pkt_lengths']
-    all_pkts = fwd_pkts + bwd_pkts
-    features['Fwd Pkt Len Max'] = max(fwd_pkts) if fwd_pkts else 0
-    features['Fwd Pkt Len Min'] = min(fwd_pkts) if fwd_pkts else 0
-    features['Fwd Pkt Len Mean'] = _safe_stat(statistics.mean, fwd_pkts)
-    features['Fwd Pkt Len Std'] = _safe_stat(statistics.stdev, fwd_pkts)
-    features['Bwd Pkt Len Max'] = max(bwd_pkts) if bwd_pkts else 0
-    features['Bwd Pkt Len Min'] = min(bwd_pkts) if bwd_pkts else 0
-    features['Bwd Pkt Len Mean'] = _safe_stat(statistics.mean, bwd_pkts)
-    features['Bwd Pkt Len Std'] = _safe_stat(statistics.stdev, bwd_pkts)
-    features['Pkt Len Min'] = min(all_pkts) if all_pkts else 0
-    features['Pkt Len Max'] = max(all_pkts) if all_pkts else 0
-    features['Pkt Len Mean'] = _safe_stat(statistics.mean, all_pkts)
-    features['Pkt Len Std'] = _safe_stat(statistics.stdev, all_pkts)
-    features['Pkt Len Var'] = _safe_stat(statistics.variance, all_pkts)
+    fwd_pkts = flow_state.fwd_pkt_len_stats
+    bwd_pkts = flow_state.bwd_pkt_len_stats
+    all_pkts = flow_state.pkt_len_stats
+    features['Fwd Pkt Len Max'] = fwd_pkts.max
+    features['Fwd Pkt Len Min'] = fwd_pkts.min
+    features['Fwd Pkt Len Mean'] = fwd_pkts.average()
+    features['Fwd Pkt Len Std'] = fwd_pkts.stdev()
+    features['Bwd Pkt Len Max'] = bwd_pkts.max
+    features['Bwd Pkt Len Min'] = bwd_pkts.min
+    features['Bwd Pkt Len Mean'] = bwd_pkts.average()
+    features['Bwd Pkt Len Std'] = bwd_pkts.stdev()
+    features['Pkt Len Min'] = all_pkts.min
+    features['Pkt Len Max'] = all_pkts.max
+    features['Pkt Len Mean'] = all_pkts.average()
+    features['Pkt Len Std'] = all_pkts.stdev()
+    features['Pkt Len Var'] = all_pkts.variance()
     features['Pkt Size Avg'] = features['Pkt Len Mean'] # Often synonymous
     features['Fwd Seg Size Avg'] = features['Fwd Pkt Len Mean'] # Approximation
     features['Bwd Seg Size Avg'] = features['Bwd Pkt Len Mean'] # Approximation
@@ -77,53 +64,69 @@ def calculate_final_features(flow_state, flow_key_tuple):
     features['Bwd Pkts/s'] = features['Tot Bwd Pkts'] / flow_duration_sec_safe
 
     # --- Inter-Arrival Time (IAT) Statistics (in Microseconds) ---
-    # Multiply by 1e6 for microseconds
-    all_iats = [(t - s) * 1_000_000 for s, t in zip(flow_state['all_timestamps_ordered'], flow_state['all_timestamps_ordered'][1:])]
-    fwd_iats = [(t - s) * 1_000_000 for s, t in zip(flow_state['fwd_timestamps'], flow_state['fwd_timestamps'][1:])]
-    bwd_iats = [(t - s) * 1_000_000 for s, t in zip(flow_state['bwd_timestamps'], flow_state['bwd_timestamps'][1:])]
-
-    features['Flow IAT Mean'] = _safe_stat(statistics.mean, all_iats)
-    features['Flow IAT Std'] = _safe_stat(statistics.stdev, all_iats)
-    features['Flow IAT Max'] = max(all_iats) if all_iats else 0
-    features['Flow IAT Min'] = min(all_iats) if all_iats else 0
-
-    features['Fwd IAT Tot'] = sum(fwd_iats)
-    features['Fwd IAT Mean'] = _safe_stat(statistics.mean, fwd_iats)
-    features['Fwd IAT Std'] = _safe_stat(statistics.stdev, fwd_iats)
-    features['Fwd IAT Max'] = max(fwd_iats) if fwd_iats else 0
-    features['Fwd IAT Min'] = min(fwd_iats) if fwd_iats else 0
-
-    features['Bwd IAT Tot'] = sum(bwd_iats)
-    features['Bwd IAT Mean'] = _safe_stat(statistics.mean, bwd_iats)
-    features['Bwd IAT Std'] = _safe_stat(statistics.stdev, bwd_iats)
-    features['Bwd IAT Max'] = max(bwd_iats) if bwd_iats else 0
-    features['Bwd IAT Min'] = min(bwd_iats) if bwd_iats else 0
+    # Accumulated per packet in packet_processor, already in microseconds
+    all_iats = flow_state.flow_iat_stats
+    fwd_iats = flow_state.fwd_iat_stats
+    bwd_iats = flow_state.bwd_iat_stats
+
+    features['Flow IAT Mean'] = all_iats.average()
+    features['Flow IAT Std'] = all_iats.stdev()
+    features['Flow IAT Max'] = all_iats.max
+    features['Flow IAT Min'] = all_iats.min
+
+    features['Fwd IAT Tot'] = fwd_iats.total
+    features['Fwd IAT Mean'] = fwd_iats.average()
+    features['Fwd IAT Std'] = fwd_iats.stdev()
+    features['Fwd IAT Max'] = fwd_iats.max
+    features['Fwd IAT Min'] = fwd_iats.min
+
+    features['Bwd IAT Tot'] = bwd_iats.total
+    features['Bwd IAT Mean'] = bwd_iats.average()
+    features['Bwd IAT Std'] = bwd_iats.stdev()
+    features['Bwd IAT Max'] = bwd_iats.max
+    features['Bwd IAT Min'] = bwd_iats.min
 
     # --- Header and Flag Features ---
-    features['Fwd Header Len'] = flow_state['fwd_header_bytes']
-    features['Bwd Header Len'] = flow_state['bwd_header_bytes']
-    features['Fwd PSH Flags'] = flow_state['fwd_psh_flags']
-    features['Fwd URG Flags'] = flow_state['fwd_urg_flags']
-    features['Bwd PSH Flags'] = flow_state['bwd_psh_flags']
-    features['Bwd URG Flags'] = flow_state['bwd_urg_flags']
-    features['FIN Flag Cnt'] = flow_state['fin_flag_count']
-    features['SYN Flag Cnt'] = flow_state['syn_flag_count']
-    features['RST Flag Cnt'] = flow_state['rst_flag_count']
-    features['PSH Flag Cnt'] = flow_state['psh_flag_count'] # Overall PSH
-    features['ACK Flag Cnt'] = flow_state['ack_flag_count']
-    features['URG Flag Cnt'] = flow_state['urg_flag_count'] # Overall URG
-    features['CWE Flag Count'] = flow_state['cwe_flag_count']
-    features['ECE Flag Cnt'] = flow_state['ece_flag_count']
+    features['Fwd Header Len'] = flow_state.fwd_header_bytes
+    features['Bwd Header Len'] = flow_state.bwd_header_bytes
+    features['Fwd PSH Flags'] = flow_state.fwd_psh_flags
+    features['Fwd URG Flags'] = flow_state.fwd_urg_flags
+    features['Bwd PSH Flags'] = flow_state.bwd_psh_flags
+    features['Bwd URG Flags'] = flow_state.bwd_urg_flags
+    features['FIN Flag Cnt'] = flow_state.fin_flag_count
+    features['SYN Flag Cnt'] = flow_state.syn_flag_count
+    features['RST Flag Cnt'] = flow_state.rst_flag_count
+    features['PSH Flag Cnt'] = flow_state.psh_flag_count # Overall PSH
+    features['ACK Flag Cnt'] = flow_state.ack_flag_count
+    features['URG Flag Cnt'] = flow_state.urg_flag_count # Overall URG
+    features['CWE Flag Count'] = flow_state.cwe_flag_count
+    features['ECE Flag Cnt'] = flow_state.ece_flag_count
 
     # --- Other Features ---
     features['Down/Up Ratio'] = features['Tot Bwd Pkts'] / features['Tot Fwd Pkts'] if features['Tot Fwd Pkts'] > 0 else 0
-    features['Init Fwd Win Byts'] = flow_state['src_init_win_bytes']
-    features['Init Bwd Win Byts'] = flow_state['dst_init_win_bytes']
-    features['Fwd Act Data Pkts'] = flow_state['fwd_data_pkt_count'] # Packets with payload > 0
-    features['Fwd Seg Size Min'] = flow_state['fwd_min_seg_size'] if flow_state['fwd_min_seg_size'] != float('inf') else 0
+    features['Init Fwd Win Byts'] = flow_state.src_init_win_bytes
+    features['Init Bwd Win Byts'] = flow_state.dst_init_win_bytes
+    features['Fwd Act Data Pkts'] = flow_state.fwd_data_pkt_count # Packets with payload > 0
+    features['Fwd Seg Size Min'] = flow_state.fwd_min_seg_size if flow_state.fwd_min_seg_size != float('inf') else 0
+
+    # --- Active/Idle Periods (in Microseconds) ---
+    active = flow_state.active_stats
+    if flow_state.last_seen > flow_state.active_start:
+        # Include the still-open active period without modifying the flow state
+        active = active.copy()
+        active.add((flow_state.last_seen - flow_state.active_start) * 1_000_000)
+    idle = flow_state.idle_stats
+    features['Active Mean'] = active.average()
+    features['Active Std'] = active.stdev()
+    features['Active Max'] = active.max
+    features['Active Min'] = active.min
+    features['Idle Mean'] = idle.average()
+    features['Idle Std'] = idle.stdev()
+    features['Idle Max'] = idle.max
+    features['Idle Min'] = idle.min
 
     # --- Protocol One-Hot Encoding ---
-    proto = flow_state['protocol']
+    proto = flow_state.protocol
     features['Protocol_0'] = 1 if proto == 0 else 0 # HOPOPT
     features['Protocol_6'] = 1 if proto == 6 else 0 # TCP
     features['Protocol_17'] = 1 if proto == 17 else 0 # UDP
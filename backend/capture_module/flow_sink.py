@@ -0,0 +1,217 @@
+# capture_module/flow_sink.py
+import csv
+import os
+import sys
+import time
+
+from . import config
+
+# File extension written by each FLOW_OUTPUT_FORMAT
+FLOW_FILE_EXTENSIONS = {'csv': '.csv', 'parquet': '.parquet', 'arrow': '.arrow'}
+
+# Columns stored as text / 64-bit integers in the columnar formats; every other column is float64
+STRING_COLUMNS = ('Flow ID', 'Src IP', 'Dst IP', 'Timestamp')
+INTEGER_COLUMNS = (
+    'Src Port', 'Dst Port', 'Protocol', 'Tot Fwd Pkts', 'Tot Bwd Pkts',
+    'TotLen Fwd Pkts', 'TotLen Bwd Pkts', 'Fwd Pkt Len Max', 'Fwd Pkt Len Min',
+    'Bwd Pkt Len Max', 'Bwd Pkt Len Min', 'Pkt Len Min', 'Pkt Len Max', 'Fwd PSH Flags', 'Fwd URG Flags',
+    'Bwd PSH Flags', 'Bwd URG Flags', 'Fwd Header Len', 'Bwd Header Len',
+    'FIN Flag Cnt', 'SYN Flag Cnt', 'RST Flag Cnt', 'PSH Flag Cnt', 'ACK Flag Cnt',
+    'URG Flag Cnt', 'CWE Flag Count', 'ECE Flag Cnt', 'Init Fwd Win Byts',
+    'Init Bwd Win Byts', 'Fwd Act Data Pkts', 'Fwd Seg Size Min', 'Protocol_0', 'Protocol_6', 'Protocol_17',
+)
+
+
+def flow_output_path(path, output_format):
+    """Returns `path` with the file extension of `output_format` (e.g. network_flows.parquet)."""
+    base, extension = os.path.splitext(path)
+    return base + FLOW_FILE_EXTENSIONS.get(output_format, extension)
+
+
+class FlowSink:
+    """
+    Buffers finished flow rows in per-column lists and writes them out in batches,
+    every `batch_size` flows or `flush_interval` seconds, instead of one row at a time.
+
+    Offers writerow/writerows like csv.DictWriter, so export code can use either.
+    Subclasses implement _write_batch() and _close().
+    """
+    def __init__(self, path, fieldnames, batch_size, flush_interval):
+        self.path = path
+        self.fieldnames = list(fieldnames)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.columns = {name: [] for name in self.fieldnames}
+        self.pending = 0
+        self.rows_written = 0
+        self.last_flush = time.monotonic()
+        self.closed = False
+
+    def writerow(self, row):
+        """Buffers one flow row (a dict keyed by column name)."""
+        for name, values in self.columns.items():
+            values.append(row.get(name))
+        self.pending += 1
+        if self.pending >= self.batch_size:
+            self.flush()
+
+    def writerows(self, rows):
+        """Buffers several flow rows."""
+        for row in rows:
+            self.writerow(row)
+
+    def poll(self):
+        """Flushes buffered rows if FLOW_SINK_FLUSH_INTERVAL has passed since the last write-out."""
+        if self.pending and time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Writes all buffered rows to the output file."""
+        if self.pending:
+            self._write_batch(self.columns)
+            self.rows_written += self.pending
+            self.columns = {name: [] for name in self.fieldnames}
+            self.pending = 0
+        self.last_flush = time.monotonic()
+
+    def close(self):
+        """Flushes remaining rows and finalizes the output file."""
+        if self.closed:
+            return
+        try:
+            self.flush()
+        finally:
+            self.closed = True
+            self._close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _write_batch(self, columns):
+        raise NotImplementedError
+
+    def _close(self):
+        raise NotImplementedError
+
+
+class CsvFlowSink(FlowSink):
+    """Writes flows as CSV text (the original output format)."""
+    def __init__(self, path, fieldnames, batch_size, flush_interval):
+        super().__init__(path, fieldnames, batch_size, flush_interval)
+        self.file = open(path, 'w', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(self.fieldnames)
+        self.file.flush()
+
+    def _write_batch(self, columns):
+        # DictWriter writes None as an empty field; keep that for unset values
+        self.writer.writerows(zip(*(['' if v is None else v for v in columns[name]] for name in self.fieldnames)))
+        self.file.flush()
+
+    def _close(self):
+        self.file.close()
+
+
+class _ArrowFlowSink(FlowSink):
+    """Shared part of the Arrow-based sinks: converts column buffers to a typed RecordBatch."""
+    def __init__(self, path, fieldnames, batch_size, flush_interval):
+        super().__init__(path, fieldnames, batch_size, flush_interval)
+        import pyarrow as pa
+        self.pa = pa
+        self.schema = pa.schema([
+            (name, pa.string() if name in STRING_COLUMNS else pa.int64() if name in INTEGER_COLUMNS else pa.float64())
+            for name in self.fieldnames
+        ])
+
+    def _record_batch(self, columns):
+        return self.pa.RecordBatch.from_arrays(
+            [self.pa.array(columns[field.name], type=field.type) for field in self.schema],
+            schema=self.schema,
+        )
+
+
+class ParquetFlowSink(_ArrowFlowSink):
+    """Writes flows to a Parquet file, one row group per flushed batch."""
+    def __init__(self, path, fieldnames, batch_size, flush_interval):
+        super().__init__(path, fieldnames, batch_size, flush_interval)
+        import pyarrow.parquet as pq
+        self.writer = pq.ParquetWriter(path, self.schema)
+
+    def _write_batch(self, columns):
+        self.writer.write_batch(self._record_batch(columns))
+
+    def _close(self):
+        self.writer.close()
+
+
+class ArrowFlowSink(_ArrowFlowSink):
+    """Writes flows to an Arrow IPC (Feather v2) file."""
+    def __init__(self, path, fieldnames, batch_size, flush_interval):
+        super().__init__(path, fieldnames, batch_size, flush_interval)
+        self.writer = self.pa.ipc.new_file(path, self.schema)
+
+    def _write_batch(self, columns):
+        self.writer.write_batch(self._record_batch(columns))
+
+    def _close(self):
+        self.writer.close()
+
+
+class QueueFlowSink(FlowSink):
+    """
+    Streams flows to an in-process consumer (e.g. a predictor) instead of a file:
+    every batch of column buffers is put on `batch_queue`, and None marks the end
+    of the capture. Rows can also be forwarded to an `archive` sink on disk.
+    """
+    def __init__(self, batch_queue, fieldnames, batch_size, flush_interval, archive=None):
+        super().__init__(archive.path if archive is not None else '<stream>', fieldnames, batch_size, flush_interval)
+        self.batch_queue = batch_queue
+        self.archive = archive
+
+    def writerow(self, row):
+        if self.archive is not None:
+            self.archive.writerow(row)
+        super().writerow(row)
+
+    def poll(self):
+        if self.archive is not None:
+            self.archive.poll()
+        super().poll()
+
+    def _write_batch(self, columns):
+        self.batch_queue.put(columns) # Blocks while the consumer is STREAM_QUEUE_DEPTH batches behind
+
+    def _close(self):
+        self.batch_queue.put(None)
+        if self.archive is not None:
+            self.archive.close()
+
+
+_SINKS = {'csv': CsvFlowSink, 'parquet': ParquetFlowSink, 'arrow': ArrowFlowSink}
+
+
+def open_flow_sink(path=None, output_format=None):
+    """
+    Opens the flow sink configured by FLOW_OUTPUT_FORMAT.
+
+    Args:
+        path: Output path; defaults to OUTPUT_CSV_FILE with the format's extension.
+        output_format: 'csv', 'parquet' or 'arrow'; defaults to FLOW_OUTPUT_FORMAT.
+
+    Returns:
+        A FlowSink, or None if the format is unknown or its library is missing.
+    """
+    output_format = (output_format or config.FLOW_OUTPUT_FORMAT).lower()
+    if output_format not in _SINKS:
+        print(f"ERROR: Unknown FLOW_OUTPUT_FORMAT '{output_format}'. Use one of: {', '.join(_SINKS)}", file=sys.stderr)
+        return None
+    path = path or flow_output_path(config.OUTPUT_CSV_FILE, output_format)
+    try:
+        return _SINKS[output_format](path, config.CSV_HEADER, config.FLOW_SINK_BATCH_SIZE, config.FLOW_SINK_FLUSH_INTERVAL)
+    except ImportError:
+        print(f"ERROR: The '{output_format}' flow output format requires pyarrow.", file=sys.stderr)
+        print("Please run: pip install pyarrow", file=sys.stderr)
+        return None
@@ -1,24 +1,144 @@
 # capture_module/flow_state.py
 import time
+import math
 
-def initialize_flow_state():
-    """Initializes a dictionary to store the state of a network flow."""
-    current_time = time.time()
-    return {
-        'start_time': current_time,
-        'last_seen': current_time,
-        'src_ip': None, 'dst_ip': None, 'src_port': None, 'dst_port': None, 'protocol': None,
-        'fwd_packet_count': 0, 'fwd_total_bytes': 0, 'fwd_timestamps': [], 'fwd_pkt_lengths': [],
-        'fwd_header_bytes': 0, 'fwd_psh_flags': 0, 'fwd_urg_flags': 0,
-        'bwd_packet_count': 0, 'bwd_total_bytes': 0, 'bwd_timestamps': [], 'bwd_pkt_lengths': [],
-        'bwd_header_bytes': 0, 'bwd_psh_flags': 0, 'bwd_urg_flags': 0,
-        'fin_flag_count': 0, 'syn_flag_count': 0, 'rst_flag_count': 0,
-        'psh_flag_count': 0, 'ack_flag_count': 0, 'urg_flag_count': 0,
-        'cwe_flag_count': 0, 'ece_flag_count': 0,
-        'all_timestamps_ordered': [],
-        'flow_id': None, 'src_init_win_bytes': -1, 'dst_init_win_bytes': -1,
-        'fwd_data_pkt_count': 0, 'fwd_min_seg_size': float('inf'),
-    }
+class RunningStats:
+    """
+    Constant-memory accumulator for count/sum/min/max/mean/M2 (Welford's algorithm).
+    Replaces keeping every packet length or timestamp of a flow in a list.
+    """
+    __slots__ = ('count', 'total', 'min', 'max', 'mean', 'm2')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.min = 0
+        self.max = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, value):
+        """Adds one observation."""
+        self.count += 1
+        self.total += value
+        if self.count == 1:
+            self.min = self.max = value
+        elif value < self.min:
+            self.min = value
+        elif value > self.max:
+            self.max = value
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def copy(self):
+        """Returns an independent copy of the accumulator."""
+        clone = RunningStats()
+        clone.count, clone.total, clone.min, clone.max, clone.mean, clone.m2 = (
+            self.count, self.total, self.min, self.max, self.mean, self.m2)
+        return clone
+
+    def average(self):
+        """Mean of the observations, 0 if there are none."""
+        return self.total / self.count if self.count else 0
+
+    def variance(self):
+        """Sample variance (n - 1 denominator), 0 with fewer than two observations."""
+        return self.m2 / (self.count - 1) if self.count > 1 else 0
+
+    def stdev(self):
+        """Sample standard deviation, 0 with fewer than two observations."""
+        return math.sqrt(self.variance()) if self.count > 1 else 0
+
+
+class FlowState:
+    """
+    State of one active network flow.
+
+    Uses __slots__ instead of a per-flow dict: with hundreds of thousands of
+    concurrent flows the dict overhead dominated memory. Packet/byte totals and
+    the flow ID are derived on demand rather than stored.
+    """
+    __slots__ = (
+        'start_time', 'last_seen',
+        'src_ip', 'dst_ip', 'src_port', 'dst_port', 'protocol',
+        'fwd_last_seen', 'fwd_pkt_len_stats', 'fwd_iat_stats',
+        'fwd_header_bytes', 'fwd_psh_flags', 'fwd_urg_flags',
+        'bwd_last_seen', 'bwd_pkt_len_stats', 'bwd_iat_stats',
+        'bwd_header_bytes', 'bwd_psh_flags', 'bwd_urg_flags',
+        'fin_flag_count', 'syn_flag_count', 'rst_flag_count',
+        'psh_flag_count', 'ack_flag_count', 'urg_flag_count',
+        'cwe_flag_count', 'ece_flag_count',
+        'pkt_len_stats', 'flow_iat_stats',
+        'src_init_win_bytes', 'dst_init_win_bytes',
+        'fwd_data_pkt_count', 'fwd_min_seg_size',
+        'active_start', 'active_stats', 'idle_stats',
+    )
+
+    def __init__(self, start_time):
+        self.start_time = start_time
+        self.last_seen = start_time
+        self.src_ip = self.dst_ip = self.src_port = self.dst_port = self.protocol = None
+        self.fwd_last_seen = None
+        self.fwd_pkt_len_stats = RunningStats()
+        self.fwd_iat_stats = RunningStats()
+        self.fwd_header_bytes = self.fwd_psh_flags = self.fwd_urg_flags = 0
+        self.bwd_last_seen = None
+        self.bwd_pkt_len_stats = RunningStats()
+        self.bwd_iat_stats = RunningStats()
+        self.bwd_header_bytes = self.bwd_psh_flags = self.bwd_urg_flags = 0
+        self.fin_flag_count = self.syn_flag_count = self.rst_flag_count = 0
+        self.psh_flag_count = self.ack_flag_count = self.urg_flag_count = 0
+        self.cwe_flag_count = self.ece_flag_count = 0
+        self.pkt_len_stats = RunningStats()
+        self.flow_iat_stats = RunningStats()
+        self.src_init_win_bytes = -1
+        self.dst_init_win_bytes = -1
+        self.fwd_data_pkt_count = 0
+        self.fwd_min_seg_size = float('inf')
+        # Active/idle periods (CICFlowMeter): the current active period runs from
+        # active_start to last_seen; closed periods are accumulated in microseconds.
+        self.active_start = start_time
+        self.active_stats = RunningStats()
+        self.idle_stats = RunningStats()
+
+    def restart(self, start_time):
+        """Returns a fresh FlowState for the same endpoints, used after an active timeout."""
+        flow = FlowState(start_time)
+        flow.src_ip, flow.dst_ip = self.src_ip, self.dst_ip
+        flow.src_port, flow.dst_port, flow.protocol = self.src_port, self.dst_port, self.protocol
+        return flow
+
+    @property
+    def fwd_packet_count(self):
+        return self.fwd_pkt_len_stats.count
+
+    @property
+    def fwd_total_bytes(self):
+        return self.fwd_pkt_len_stats.total
+
+    @property
+    def bwd_packet_count(self):
+        return self.bwd_pkt_len_stats.count
+
+    @property
+    def bwd_total_bytes(self):
+        return self.bwd_pkt_len_stats.total
+
+    @property
+    def flow_id(self):
+        return generate_flow_id(self.src_ip, self.src_port, self.dst_ip, self.dst_port, self.protocol)
+
+
+def initialize_flow_state(start_time=None):
+    """
+    Creates the FlowState for a new network flow.
+
+    Args:
+        start_time: Timestamp of the flow's first packet. Defaults to the
+                    current wall-clock time when not provided.
+    """
+    return FlowState(start_time if start_time is not None else time.time())
 
 def get_flow_key(packet, ip_layer):
     """Generates a unique, order-independent key for a flow."""
@@ -36,6 +156,10 @@ def get_flow_key(packet, ip_layer):
     else:
         return None # Ignore non-TCP/UDP for flow tracking
 
+    return make_flow_key(src_ip, src_port, dst_ip, dst_port, proto)
+
+def make_flow_key(src_ip, src_port, dst_ip, dst_port, proto):
+    """Builds the order-independent flow key from already decoded header fields."""
     # Ensure consistent key order
     flow_key_part1 = (src_ip, src_port)
     flow_key_part2 = (dst_ip, dst_port)
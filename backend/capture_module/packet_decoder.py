@@ -0,0 +1,194 @@
+# capture_module/packet_decoder.py
+import socket
+import struct
+from collections import namedtuple
+
+from scapy.all import IP, IPv6, TCP, UDP
+
+# --- Link-layer types (pcap DLT_* / LINKTYPE_* values) ---
+DLT_NULL = 0
+DLT_EN10MB = 1
+DLT_RAW = 101
+DLT_RAW_ALT = 12 # DLT_RAW as written by some BSD/OpenBSD captures
+DLT_LINUX_SLL = 113
+DLT_IPV4 = 228
+DLT_IPV6 = 229
+SUPPORTED_LINKTYPES = (DLT_NULL, DLT_EN10MB, DLT_RAW, DLT_RAW_ALT, DLT_LINUX_SLL, DLT_IPV4, DLT_IPV6)
+
+# --- TCP flag bits (byte 13 of the TCP header) ---
+TCP_FIN = 0x01
+TCP_SYN = 0x02
+TCP_RST = 0x04
+TCP_PSH = 0x08
+TCP_ACK = 0x10
+TCP_URG = 0x20
+TCP_ECE = 0x40
+TCP_CWR = 0x80
+
+ETH_P_IP = 0x0800
+ETH_P_IPV6 = 0x86DD
+ETH_P_VLAN = (0x8100, 0x88A8, 0x9100)
+
+# Fields needed by the flow tracker, extracted once per packet.
+# tcp_flags is the raw flag byte (None for UDP); window is -1 for UDP.
+PacketInfo = namedtuple('PacketInfo', [
+    'src_ip', 'dst_ip', 'proto', 'src_port', 'dst_port',
+    'packet_len', 'header_len', 'tcp_flags', 'window',
+])
+
+_unpack_ports = struct.Struct('!HH').unpack_from
+_unpack_u16 = struct.Struct('!H').unpack_from
+_inet_ntoa = socket.inet_ntoa
+
+
+def decode_raw_packet(data, linktype=DLT_EN10MB):
+    """
+    Decodes the Ethernet/IPv4/IPv6/TCP/UDP headers of a raw frame without Scapy.
+
+    Args:
+        data: The captured frame as bytes (or a memoryview).
+        linktype: pcap link-layer type of the frame.
+
+    Returns:
+        A PacketInfo for TCP/UDP packets, or None for anything the flow tracker
+        ignores (non-IP, other transports, non-first fragments, truncated headers).
+    """
+    data_len = len(data)
+
+    # --- Link layer ---
+    if linktype == DLT_EN10MB:
+        if data_len < 14: return None
+        ethertype = _unpack_u16(data, 12)[0]
+        offset = 14
+        while ethertype in ETH_P_VLAN: # 802.1Q / QinQ tags
+            if data_len < offset + 4: return None
+            ethertype = _unpack_u16(data, offset + 2)[0]
+            offset += 4
+    elif linktype == DLT_LINUX_SLL:
+        if data_len < 16: return None
+        ethertype = _unpack_u16(data, 14)[0]
+        offset = 16
+    elif linktype == DLT_NULL:
+        if data_len < 4: return None
+        # Address family is in host byte order of the capturing machine
+        family = data[0] or data[3]
+        ethertype = ETH_P_IP if family == 2 else ETH_P_IPV6 if family in (10, 24, 28, 30) else None
+        offset = 4
+    elif linktype in (DLT_RAW, DLT_RAW_ALT, DLT_IPV4, DLT_IPV6):
+        if data_len < 1: return None
+        version = data[0] >> 4
+        ethertype = ETH_P_IP if version == 4 else ETH_P_IPV6 if version == 6 else None
+        offset = 0
+    else:
+        return None
+
+    # --- Network layer ---
+    if ethertype == ETH_P_IP:
+        if data_len < offset + 20: return None
+        ip_header_len = (data[offset] & 0x0F) * 4
+        # Scapy does not dissect the transport header of non-first fragments
+        if _unpack_u16(data, offset + 6)[0] & 0x1FFF: return None
+        proto = data[offset + 9]
+        src_ip = _inet_ntoa(bytes(data[offset + 12:offset + 16]))
+        dst_ip = _inet_ntoa(bytes(data[offset + 16:offset + 20]))
+    elif ethertype == ETH_P_IPV6:
+        if data_len < offset + 40: return None
+        ip_header_len = 40
+        proto = data[offset + 6] # Next header; extension headers are not followed
+        src_ip = socket.inet_ntop(socket.AF_INET6, bytes(data[offset + 8:offset + 24]))
+        dst_ip = socket.inet_ntop(socket.AF_INET6, bytes(data[offset + 24:offset + 40]))
+    else:
+        return None
+
+    # --- Transport layer ---
+    l4 = offset + ip_header_len
+    if proto == 6:
+        if data_len < l4 + 20: return None
+        src_port, dst_port = _unpack_ports(data, l4)
+        header_len = ip_header_len + (data[l4 + 12] >> 4) * 4
+        tcp_flags = data[l4 + 13]
+        window = _unpack_u16(data, l4 + 14)[0]
+    elif proto == 17:
+        if data_len < l4 + 8: return None
+        src_port, dst_port = _unpack_ports(data, l4)
+        header_len = ip_header_len + 8 # UDP header is fixed 8 bytes
+        tcp_flags = None
+        window = -1
+    else:
+        return None # Ignore non-TCP/UDP for flow tracking
+
+    return PacketInfo(src_ip, dst_ip, proto, src_port, dst_port, data_len, header_len, tcp_flags, window)
+
+
+def decode_scapy_packet(packet):
+    """
+    Extracts the same PacketInfo fields from an already dissected Scapy packet.
+
+    Args:
+        packet: The Scapy packet object.
+
+    Returns:
+        A PacketInfo for TCP/UDP packets, or None if the packet should be ignored.
+    """
+    if packet.haslayer(IP):
+        ip_layer = packet.getlayer(IP)
+        proto = ip_layer.proto
+        ip_header_len = ip_layer.ihl * 4
+        if packet.haslayer(TCP):
+            l4_layer = packet.getlayer(TCP)
+        elif packet.haslayer(UDP):
+            l4_layer = packet.getlayer(UDP)
+        else:
+            return None # Ignore non-TCP/UDP for flow tracking
+    elif packet.haslayer(IPv6):
+        ip_layer = packet.getlayer(IPv6)
+        proto = ip_layer.nh
+        ip_header_len = 40
+        l4_layer = ip_layer.payload
+        if not isinstance(l4_layer, (TCP, UDP)):
+            return None
+    else:
+        return None
+
+    if isinstance(l4_layer, TCP):
+        header_len = ip_header_len + l4_layer.dataofs * 4
+        tcp_flags = int(l4_layer.flags) & 0xFF
+        window = l4_layer.window
+    else:
+        header_len = ip_header_len + 8 # UDP header is fixed 8 bytes
+        tcp_flags = None
+        window = -1
+
+    return PacketInfo(ip_layer.src, ip_layer.dst, proto, l4_layer.sport, l4_layer.dport,
+                      len(packet), header_len, tcp_flags, window)
+
+
+def compare_decoders(pcap_path):
+    """
+    Parity check: decodes every packet of a capture file with both the byte-level
+    decoder and Scapy, and reports any packet where the results differ.
+
+    Args:
+        pcap_path: Path to a .pcap/.pcapng file.
+
+    Returns:
+        Tuple (packets_checked, list of (packet_index, raw_result, scapy_result) mismatches).
+    """
+    from scapy.all import RawPcapReader, conf
+
+    mismatches = []
+    checked = 0
+    with RawPcapReader(pcap_path) as reader:
+        for index, (data, meta) in enumerate(reader):
+            linktype = getattr(meta, 'linktype', None)
+            if linktype is None:
+                linktype = reader.linktype
+            layer = conf.l2types.get(linktype)
+            if layer is None or linktype not in SUPPORTED_LINKTYPES:
+                continue
+            fast = decode_raw_packet(data, linktype)
+            slow = decode_scapy_packet(layer(data))
+            checked += 1
+            if fast != slow:
+                mismatches.append((index, fast, slow))
+    return checked, mismatches
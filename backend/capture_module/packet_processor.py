@@ -1,7 +1,12 @@
 # capture_module/packet_processor.py
 import time
-from scapy.all import IP, TCP, UDP
-from .flow_state import initialize_flow_state, get_flow_key, generate_flow_id
+from scapy.all import conf
+from . import config
+from .flow_state import initialize_flow_state, make_flow_key
+from .packet_decoder import (
+    decode_raw_packet, decode_scapy_packet, DLT_EN10MB, SUPPORTED_LINKTYPES,
+    TCP_FIN, TCP_SYN, TCP_RST, TCP_PSH, TCP_ACK, TCP_URG, TCP_ECE, TCP_CWR,
+)
 
 def process_packet(packet, active_flows):
     """
@@ -9,97 +14,139 @@ def process_packet(packet, active_flows):
 
     Args:
         packet: The Scapy packet object.
-        active_flows: Dictionary holding the state of active flows.
+        active_flows: OrderedDict holding the state of active flows.
+
+    Returns:
+        (flow_key, FlowState) of a flow finished by this packet (see update_flow), or None.
+    """
+    info = decode_scapy_packet(packet)
+    if info is None: return None # Ignore if not TCP/UDP
+    # Use the capture timestamp so live sniffing and pcap replay share one clock
+    current_time = float(packet.time) if packet.time is not None else time.time()
+    return update_flow(info, current_time, active_flows)
+
+def process_raw_packet(data, timestamp, active_flows, linktype=DLT_EN10MB):
+    """
+    Fast path of process_packet: decodes the headers straight from the raw frame
+    bytes instead of building a Scapy packet.
+
+    Args:
+        data: The captured frame bytes.
+        timestamp: Capture timestamp of the frame (seconds since the epoch).
+        active_flows: OrderedDict holding the state of active flows.
+        linktype: pcap link-layer type of the frame.
+
+    Returns:
+        (flow_key, FlowState) of a flow finished by this packet (see update_flow), or None.
+    """
+    info = decode_frame(data, linktype)
+    if info is None: return None
+    return update_flow(info, timestamp, active_flows)
+
+def decode_frame(data, linktype=DLT_EN10MB):
+    """Decodes a raw frame into a PacketInfo, falling back to Scapy for unusual link types."""
+    if linktype in SUPPORTED_LINKTYPES:
+        return decode_raw_packet(data, linktype)
+    return decode_scapy_packet(conf.l2types.get(linktype, conf.raw_layer)(data))
+
+def update_flow(info, current_time, active_flows):
+    """
+    Updates (or creates) the flow state for one decoded packet.
+
+    Args:
+        info: PacketInfo produced by one of the decoders in packet_decoder.
+        current_time: Capture timestamp of the packet.
+        active_flows: OrderedDict of active flows, kept in least-recently-updated order.
+
+    Returns:
+        (flow_key, FlowState) of a finished record, or None. A record is finished when
+        the flow has been idle longer than IDLE_TIMEOUT (this packet starts a new flow)
+        or running longer than ACTIVE_TIMEOUT (the flow continues in a fresh state).
     """
-    current_time = time.time()
-
-    if not packet.haslayer(IP): return
-    ip_layer = packet.getlayer(IP)
-
-    flow_key = get_flow_key(packet, ip_layer)
-    if flow_key is None: return # Ignore if not TCP/UDP or key couldn't be generated
-
-    src_ip = ip_layer.src
-    dst_ip = ip_layer.dst
-    proto = ip_layer.proto
-    src_port, dst_port, tcp_flags = None, None, None
-    packet_len = len(packet) # Total packet length
-    ip_header_len = ip_layer.ihl * 4
-    header_len = ip_header_len
-    init_win = -1
-
-    if packet.haslayer(TCP):
-        tcp_layer = packet.getlayer(TCP)
-        src_port, dst_port = tcp_layer.sport, tcp_layer.dport
-        tcp_flags = tcp_layer.flags
-        header_len += tcp_layer.dataofs * 4
-        init_win = tcp_layer.window
-    elif packet.haslayer(UDP):
-        udp_layer = packet.getlayer(UDP)
-        src_port, dst_port = udp_layer.sport, udp_layer.dport
-        header_len += 8 # UDP header is fixed 8 bytes
-    # No else needed because get_flow_key already filtered
+    src_ip, dst_ip, proto, src_port, dst_port, packet_len, header_len, tcp_flags, init_win = info
+    flow_key = make_flow_key(src_ip, src_port, dst_ip, dst_port, proto)
 
     actual_payload_len = packet_len - header_len
     if actual_payload_len < 0: actual_payload_len = 0 # Ensure non-negative
 
     # --- Flow Initialization or Update ---
-    if flow_key not in active_flows:
-        active_flows[flow_key] = initialize_flow_state()
-        flow = active_flows[flow_key]
-        # Store the actual first packet's direction info
-        flow['src_ip'] = src_ip
-        flow['dst_ip'] = dst_ip
-        flow['src_port'] = src_port
-        flow['dst_port'] = dst_port
-        flow['protocol'] = proto
-        flow['flow_id'] = generate_flow_id(src_ip, src_port, dst_ip, dst_port, proto)
+    exported = None
+    flow = active_flows.get(flow_key)
+    if flow is not None:
+        if current_time - flow.last_seen > config.IDLE_TIMEOUT:
+            # Idle gap not yet caught by the periodic check: the old flow is finished and this
+            # packet starts a new one, so results don't depend on when the check happens to run
+            exported = (flow_key, active_flows.pop(flow_key))
+            flow = None
+        elif current_time - flow.start_time > config.ACTIVE_TIMEOUT:
+            # Long-lived flow (e.g. a C2 beacon): hand back the record so far and keep tracking it
+            exported = (flow_key, flow)
+            active_flows[flow_key] = flow = flow.restart(current_time)
+            active_flows.move_to_end(flow_key)
+        else:
+            active_flows.move_to_end(flow_key) # Keep the table ordered by last activity for timeouts
+    if flow is None:
+        active_flows[flow_key] = flow = initialize_flow_state(current_time)
+        # Store the actual first packet's direction info (the flow ID is derived from these)
+        flow.src_ip = src_ip
+        flow.dst_ip = dst_ip
+        flow.src_port = src_port
+        flow.dst_port = dst_port
+        flow.protocol = proto
         # Capture initial window size based on first packet's direction
         if proto == 6: # TCP
-             flow['src_init_win_bytes'] = init_win # Assume first packet is forward
-    else:
-        flow = active_flows[flow_key]
+             flow.src_init_win_bytes = init_win # Assume first packet is forward
 
-    flow['last_seen'] = current_time
-    flow['all_timestamps_ordered'].append(current_time)
+    # IATs are accumulated in microseconds as each packet arrives (no timestamp lists)
+    if flow.pkt_len_stats.count:
+        flow.flow_iat_stats.add((current_time - flow.last_seen) * 1_000_000)
+        # A silence longer than ACTIVITY_TIMEOUT closes the current active period
+        if current_time - flow.last_seen > config.ACTIVITY_TIMEOUT:
+            if flow.last_seen > flow.active_start:
+                flow.active_stats.add((flow.last_seen - flow.active_start) * 1_000_000)
+            flow.idle_stats.add((current_time - flow.last_seen) * 1_000_000)
+            flow.active_start = current_time
+    flow.last_seen = current_time
+    flow.pkt_len_stats.add(packet_len)
 
     # Determine direction relative to the *first* packet seen for this flow
-    is_forward = (src_ip == flow['src_ip'] and src_port == flow['src_port'])
+    is_forward = (src_ip == flow.src_ip and src_port == flow.src_port)
 
     # --- Update Flow Statistics ---
     if is_forward:
-        flow['fwd_packet_count'] += 1
-        flow['fwd_total_bytes'] += packet_len
-        flow['fwd_timestamps'].append(current_time)
-        flow['fwd_pkt_lengths'].append(packet_len)
-        flow['fwd_header_bytes'] += header_len
-        if actual_payload_len > 0: flow['fwd_data_pkt_count'] += 1
+        if flow.fwd_last_seen is not None:
+            flow.fwd_iat_stats.add((current_time - flow.fwd_last_seen) * 1_000_000)
+        flow.fwd_last_seen = current_time
+        flow.fwd_pkt_len_stats.add(packet_len)
+        flow.fwd_header_bytes += header_len
+        if actual_payload_len > 0: flow.fwd_data_pkt_count += 1
         if tcp_flags is not None:
-            if 'P' in tcp_flags: flow['fwd_psh_flags'] += 1
-            if 'U' in tcp_flags: flow['fwd_urg_flags'] += 1
+            if tcp_flags & TCP_PSH: flow.fwd_psh_flags += 1
+            if tcp_flags & TCP_URG: flow.fwd_urg_flags += 1
         # Update Fwd Min Segment Size (using header length as approximation)
-        if proto == 6: flow['fwd_min_seg_size'] = min(flow['fwd_min_seg_size'], header_len)
+        if proto == 6: flow.fwd_min_seg_size = min(flow.fwd_min_seg_size, header_len)
     else: # Backward direction
         # Capture initial window size for backward direction if not already set
-        if flow['bwd_packet_count'] == 0 and proto == 6 and flow['dst_init_win_bytes'] == -1:
-             flow['dst_init_win_bytes'] = init_win
-        flow['bwd_packet_count'] += 1
-        flow['bwd_total_bytes'] += packet_len
-        flow['bwd_timestamps'].append(current_time)
-        flow['bwd_pkt_lengths'].append(packet_len)
-        flow['bwd_header_bytes'] += header_len
+        if flow.bwd_packet_count == 0 and proto == 6 and flow.dst_init_win_bytes == -1:
+             flow.dst_init_win_bytes = init_win
+        if flow.bwd_last_seen is not None:
+            flow.bwd_iat_stats.add((current_time - flow.bwd_last_seen) * 1_000_000)
+        flow.bwd_last_seen = current_time
+        flow.bwd_pkt_len_stats.add(packet_len)
+        flow.bwd_header_bytes += header_len
         if tcp_flags is not None:
-             if 'P' in tcp_flags: flow['bwd_psh_flags'] += 1
-             if 'U' in tcp_flags: flow['bwd_urg_flags'] += 1
+             if tcp_flags & TCP_PSH: flow.bwd_psh_flags += 1
+             if tcp_flags & TCP_URG: flow.bwd_urg_flags += 1
 
     # Update overall TCP flags count
-    if tcp_flags is not None:
-        if 'F' in tcp_flags: flow['fin_flag_count'] += 1
-        if 'S' in tcp_flags: flow['syn_flag_count'] += 1
-        if 'R' in tcp_flags: flow['rst_flag_count'] += 1
-        if 'P' in tcp_flags: flow['psh_flag_count'] += 1
-        if 'A' in tcp_flags: flow['ack_flag_count'] += 1
-        if 'U' in tcp_flags: flow['urg_flag_count'] += 1
-        if 'C' in tcp_flags: flow['cwe_flag_count'] += 1
-        if 'E' in tcp_flags: flow['ece_flag_count'] += 1
+    if tcp_flags:
+        if tcp_flags & TCP_FIN: flow.fin_flag_count += 1
+        if tcp_flags & TCP_SYN: flow.syn_flag_count += 1
+        if tcp_flags & TCP_RST: flow.rst_flag_count += 1
+        if tcp_flags & TCP_PSH: flow.psh_flag_count += 1
+        if tcp_flags & TCP_ACK: flow.ack_flag_count += 1
+        if tcp_flags & TCP_URG: flow.urg_flag_count += 1
+        if tcp_flags & TCP_CWR: flow.cwe_flag_count += 1
+        if tcp_flags & TCP_ECE: flow.ece_flag_count += 1
 
+    return exported
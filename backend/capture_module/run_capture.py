@@ -1,14 +1,29 @@
 # capture_module/run_capture.py
 import sys
 import os
+import argparse
 
 # Add backend directory to sys.path to allow imports from sibling modules if needed
 # Or adjust based on how you run your scripts
 # sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from .capture_manager import start_capture
+from .packet_decoder import compare_decoders
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Capture network flows from a live interface or a pcap file.")
+    parser.add_argument('--pcap', help="Replay packets from a .pcap/.pcapng file instead of sniffing live.")
+    parser.add_argument('--check-decoder', metavar='PCAP',
+                        help="Compare the byte-level decoder against Scapy on a capture file and exit.")
+    args = parser.parse_args()
+
+    if args.check_decoder:
+        checked, mismatches = compare_decoders(args.check_decoder)
+        for index, fast, slow in mismatches[:20]:
+            print(f"Packet #{index}: raw decoder={fast} scapy={slow}")
+        print(f"Decoder parity: {checked - len(mismatches)}/{checked} packets identical.")
+        sys.exit(1 if mismatches else 0)
+
     print("--- Running Network Capture Module ---")
-    start_capture()
+    start_capture(pcap_path=args.pcap)
     print("--- Network Capture Module Finished ---")
@@ -0,0 +1,219 @@
+# capture_module/sharded_capture.py
+import multiprocessing
+import queue
+import signal
+import sys
+import threading
+from collections import OrderedDict
+
+from . import config
+from . import capture_manager
+from .flow_state import make_flow_key
+from .packet_processor import decode_frame, update_flow
+
+# Message sent on a worker's packet queue: a list of (PacketInfo, timestamp) tuples,
+# a float (packet-clock tick, used to run idle-timeout checks on quiet shards),
+# or None (end of capture). Workers send lists of flow rows on the row queue, then
+# a (shard number, totals) tuple when they are done.
+
+
+class ShardWorkerError(RuntimeError):
+    """A flow worker process died, so its shard of the capture cannot be completed."""
+
+
+class _RowQueueWriter:
+    """
+    FlowSink stand-in used inside a worker: collects finished flow rows and
+    ships them to the merged writer in batches.
+    """
+    def __init__(self, row_queue, batch_size):
+        self.row_queue = row_queue
+        self.batch_size = batch_size
+        self.rows = []
+        self.rows_written = 0
+
+    def writerow(self, row):
+        self.rows.append(row)
+        self.rows_written += 1
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.rows:
+            self.row_queue.put(self.rows)
+            self.rows = []
+
+
+def _flow_worker(shard, packet_queue, row_queue):
+    """
+    Worker process: owns one shard of the flow table and updates it from the
+    packet batches dispatched by the reader.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN) # Ctrl+C is handled by the reader
+    # check_flow_timeouts/process_remaining_flows work on capture_manager.active_flows,
+    # which in this process holds only this worker's shard.
+    capture_manager.active_flows = active_flows = OrderedDict()
+    writer = _RowQueueWriter(row_queue, config.SHARD_BATCH_SIZE)
+    # Reported once by the reader at shutdown instead of a banner per timeout check in every worker
+    totals = {'packets': 0, 'timed_out': 0, 'remaining': 0}
+    try:
+        while True:
+            message = packet_queue.get()
+            if message is None:
+                break
+            if isinstance(message, float):
+                totals['timed_out'] += capture_manager.check_flow_timeouts(writer, message, quiet=True)
+                writer.flush()
+                continue
+            for info, timestamp in message:
+                exported = update_flow(info, timestamp, active_flows)
+                if exported is not None:
+                    capture_manager.export_flow(writer, *exported)
+                totals['packets'] += 1
+                if totals['packets'] % 1000 == 0:
+                    totals['timed_out'] += capture_manager.check_flow_timeouts(writer, timestamp, quiet=True)
+            writer.flush()
+        totals['remaining'] = capture_manager.process_remaining_flows(writer, quiet=True)
+        writer.flush()
+    finally:
+        totals['flows'] = writer.rows_written
+        row_queue.put((shard, totals)) # Tell the merged writer this worker is done
+
+
+def _put(packet_queue, message, worker, shard):
+    """
+    Puts a message on a worker's bounded packet queue. Raises ShardWorkerError
+    instead of blocking forever if the queue stays full because the worker died.
+    """
+    while True:
+        try:
+            packet_queue.put(message, timeout=config.SHARD_LIVENESS_TIMEOUT)
+            return
+        except queue.Full:
+            if not worker.is_alive():
+                raise ShardWorkerError(f"Flow worker {shard} exited unexpectedly (exit code {worker.exitcode}).")
+
+
+def _merge_rows(row_queue, writer, workers, worker_totals):
+    """
+    Writer thread: feeds row batches from all workers into the single flow sink
+    until every worker has said it is done, or has died without saying so.
+    The totals each finished worker reports are stored in worker_totals by shard.
+    """
+    finished = set()
+    suspected = set()
+    while len(finished) < len(workers):
+        try:
+            rows = row_queue.get(timeout=config.SHARD_LIVENESS_TIMEOUT)
+        except queue.Empty:
+            dead = {shard for shard, worker in enumerate(workers) if shard not in finished and not worker.is_alive()}
+            # A worker's rows are all in the pipe once it has exited, so one more quiet timeout means they are lost
+            lost = dead & suspected
+            if lost:
+                print(f"ERROR: Flow worker(s) {', '.join(map(str, sorted(lost)))} exited without finishing; "
+                      f"their flows are lost.", file=sys.stderr)
+                finished |= lost
+            suspected = dead - lost
+            continue
+        if isinstance(rows, tuple):
+            shard, totals = rows
+            finished.add(shard)
+            worker_totals[shard] = totals
+            continue
+        try:
+            writer.writerows(rows)
+            writer.poll()
+        except Exception as e:
+            print(f"ERROR: Failed to write {len(rows)} flows: {e}", file=sys.stderr)
+
+
+def _print_worker_totals(worker_totals):
+    """Prints one line per finished worker: packets handled and flows exported, by reason."""
+    if worker_totals:
+        print() # End the "Dispatched" progress line
+    for shard, totals in sorted(worker_totals.items()):
+        split = totals['flows'] - totals['timed_out'] - totals['remaining']
+        print(f"Flow worker {shard}: {totals['packets']} packets, {totals['flows']} flows "
+              f"({totals['timed_out']} idle timeouts, {split} split by a later packet, "
+              f"{totals['remaining']} exported at the end).")
+
+
+def run_sharded_capture(raw_source, writer, num_workers):
+    """
+    Reader side of the sharded pipeline. Decodes each frame, picks a worker by the
+    hash of the (direction independent) flow key and dispatches packets in batches,
+    so every packet of a flow is handled by the same worker.
+
+    Args:
+        raw_source: Iterable of (frame_bytes, linktype, timestamp), e.g. read_raw_pcap().
+        writer: FlowSink for the merged output file.
+        num_workers: Number of flow-tracking worker processes.
+
+    Returns:
+        Number of packets read.
+    """
+    packet_queues = [multiprocessing.Queue(maxsize=config.SHARD_QUEUE_DEPTH) for _ in range(num_workers)]
+    row_queue = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=_flow_worker, args=(shard, packet_queue, row_queue), daemon=True)
+               for shard, packet_queue in enumerate(packet_queues)]
+    for worker in workers:
+        worker.start()
+    worker_totals = {}
+    merger = threading.Thread(target=_merge_rows, args=(row_queue, writer, workers, worker_totals), daemon=True)
+    merger.start()
+    print(f"Started {num_workers} flow worker processes.")
+
+    batches = [[] for _ in range(num_workers)]
+    batch_size = config.SHARD_BATCH_SIZE
+    packet_count = 0
+    last_tick = None
+
+    def dispatch(shard, message):
+        _put(packet_queues[shard], message, workers[shard], shard)
+
+    def flush_batches():
+        for shard, batch in enumerate(batches):
+            if batch:
+                dispatch(shard, batch)
+                batches[shard] = []
+
+    try:
+        for data, linktype, timestamp in raw_source:
+            packet_count += 1
+            info = decode_frame(data, linktype)
+            if info is not None:
+                shard = hash(make_flow_key(info.src_ip, info.src_port, info.dst_ip, info.dst_port, info.proto)) % num_workers
+                batch = batches[shard]
+                batch.append((info, timestamp))
+                if len(batch) >= batch_size:
+                    dispatch(shard, batch)
+                    batches[shard] = []
+            if last_tick is None:
+                last_tick = timestamp
+            elif timestamp - last_tick > 5.0:
+                # Advance every shard's clock so idle flows expire even on workers without new packets
+                flush_batches()
+                for shard in range(num_workers):
+                    dispatch(shard, float(timestamp))
+                last_tick = timestamp
+            if packet_count % config.REPLAY_PROGRESS_INTERVAL == 0:
+                print(f"\rDispatched: {packet_count} packets to {num_workers} workers.", end="")
+    finally:
+        for shard, batch in enumerate(batches):
+            try:
+                if batch:
+                    dispatch(shard, batch)
+                dispatch(shard, None)
+            except ShardWorkerError:
+                pass # Reported below
+        merger.join()
+        for shard, worker in enumerate(workers):
+            worker.join()
+            if worker.exitcode != 0:
+                # Nobody reads this queue any more: don't wait at exit for its buffered batches to be sent
+                packet_queues[shard].cancel_join_thread()
+        _print_worker_totals(worker_totals)
+    failed = [f"{shard} (exit code {worker.exitcode})" for shard, worker in enumerate(workers) if worker.exitcode != 0]
+    if failed:
+        raise ShardWorkerError(f"Flow worker(s) {', '.join(failed)} failed; the flow file is incomplete.")
+    return packet_count
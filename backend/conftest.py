@@ -0,0 +1,3 @@
+# backend/conftest.py
+# Lets the tests in backend/tests import the backend packages (capture_module, prediction_module)
+# the same way the scripts do when run from backend/.
@@ -0,0 +1,189 @@
+# prediction_module/alert_suppression.py
+"""
+Groups suspicious flows into incidents keyed by (Src IP, Dst IP, Dst Port,
+Prediction) so a noisy attacker produces one alert row with a hit count instead
+of thousands of identical ones.
+"""
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from . import config
+
+INCIDENT_KEY = ('Src IP', 'Dst IP', 'Dst Port', 'Prediction')
+# Columns added to every emitted incident row
+INCIDENT_COLUMNS = ('Hit Count', 'First Seen', 'Last Seen')
+
+
+class _Incident:
+    __slots__ = ('hits', 'emitted_hits', 'first_seen', 'last_seen', 'last_active', 'row')
+
+    def __init__(self, hits, first_seen, last_seen, now, row):
+        self.hits = hits
+        self.emitted_hits = 0
+        self.first_seen = first_seen
+        self.last_seen = last_seen
+        self.last_active = now
+        self.row = row # (frame, position) of the incident's first flow in _row_frames, kept only with keep_rows
+
+
+class AlertSuppressor:
+    """
+    Time-bounded LRU of incidents. observe() emits a row for an incident when it
+    is new (never seen, or idle for more than window_seconds) or escalated (its
+    hit count grew by escalation_factor since it was last emitted), and
+    suppresses it otherwise. At most max_incidents are kept; the least recently
+    active is evicted first.
+
+    With keep_rows, the first flow of every incident is kept so
+    incidents_frame() can return all of them with their final counts. Rows of
+    expired and evicted incidents are released as the kept rows are compacted.
+    """
+    def __init__(self, window_seconds=None, max_incidents=None, escalation_factor=None, keep_rows=False):
+        self.window_seconds = math.inf if window_seconds is None else window_seconds
+        self.max_incidents = max_incidents
+        self.escalation_factor = escalation_factor or config.ALERT_ESCALATION_FACTOR
+        self.keep_rows = keep_rows
+        self.incidents = OrderedDict() # Incident key -> _Incident, least recently active first
+        self._row_frames = [] # First flows of new incidents, one DataFrame per observed batch (keep_rows)
+        self._released_rows = 0 # Rows in _row_frames whose incident expired or was evicted
+        self.lock = threading.Lock() # Shared by the streaming scorer and reporting threads
+        self.flows_seen = 0
+        self.rows_emitted = 0
+        self.evicted = 0
+
+    def observe(self, suspicious_df, now=None):
+        """
+        Adds a batch of suspicious flows.
+
+        Args:
+            suspicious_df: Suspicious flows with the INCIDENT_KEY columns.
+            now: Current time in epoch seconds (defaults to time.time()).
+
+        Returns:
+            DataFrame with one row per new or escalated incident (its first flow in
+            this batch) plus INCIDENT_COLUMNS; empty if everything was suppressed.
+        """
+        keys = [column for column in INCIDENT_KEY if column in suspicious_df.columns]
+        if suspicious_df.empty or not keys:
+            return suspicious_df.iloc[:0] if keys else suspicious_df
+        now = time.time() if now is None else now
+        grouped = suspicious_df.groupby(keys, sort=False, dropna=False, observed=True) # IP columns may be categorical
+        first_rows = grouped.head(1) # Groups in order of first appearance, like the aggregates below
+        hits = grouped.size().tolist()
+        if 'Timestamp' in suspicious_df.columns:
+            first_seen = grouped['Timestamp'].first().tolist()
+            last_seen = grouped['Timestamp'].last().tolist()
+        else:
+            first_seen = last_seen = [None] * len(hits)
+        key_values = first_rows[keys]
+        missing = key_values.isna()
+        if missing.to_numpy().any(): # NaN != NaN, so missing key values are stored as None to match across batches
+            key_values = key_values.astype(object).where(~missing, None)
+        group_keys = list(key_values.itertuples(index=False, name=None))
+
+        emitted_positions, emitted, new_positions = [], [], []
+        with self.lock:
+            self._expire(now)
+            frame_number = len(self._row_frames)
+            for position, key in enumerate(group_keys):
+                incident = self.incidents.get(key)
+                if incident is None:
+                    row = (frame_number, len(new_positions)) if self.keep_rows else None
+                    new_positions.append(position)
+                    incident = self.incidents[key] = _Incident(hits[position], first_seen[position],
+                                                               last_seen[position], now, row)
+                else:
+                    incident.hits += hits[position]
+                    incident.last_seen = last_seen[position]
+                    incident.last_active = now
+                    self.incidents.move_to_end(key)
+                if incident.hits >= incident.emitted_hits * self.escalation_factor and incident.hits > incident.emitted_hits:
+                    incident.emitted_hits = incident.hits
+                    emitted_positions.append(position)
+                    emitted.append((incident.hits, incident.first_seen, incident.last_seen))
+            while self.max_incidents is not None and len(self.incidents) > self.max_incidents:
+                self._drop_oldest()
+                self.evicted += 1
+            if self.keep_rows and new_positions:
+                self._row_frames.append(first_rows.iloc[new_positions])
+            if self._released_rows > len(self.incidents): # Amortized: compacts after as many releases as kept rows
+                self._compact_rows()
+            self.flows_seen += len(suspicious_df)
+            self.rows_emitted += len(emitted)
+
+        result = first_rows.iloc[emitted_positions].copy()
+        for column, values in zip(INCIDENT_COLUMNS, zip(*emitted) if emitted else ((), (), ())):
+            result[column] = list(values)
+        result['Hit Count'] = result['Hit Count'].astype('int64')
+        return result
+
+    def _expire(self, now):
+        """Drops incidents idle for longer than the window (the least recently active are first)."""
+        while self.incidents:
+            incident = next(iter(self.incidents.values()))
+            if now - incident.last_active <= self.window_seconds:
+                break
+            self._drop_oldest()
+
+    def _drop_oldest(self):
+        _, incident = self.incidents.popitem(last=False)
+        if incident.row is not None:
+            self._released_rows += 1
+
+    def _kept_rows(self, incidents):
+        """Returns the first flows of the given incidents (which must all have kept rows), in order."""
+        offsets = np.cumsum([0] + [len(frame) for frame in self._row_frames])
+        return pd.concat(self._row_frames, ignore_index=True).take(
+            [offsets[frame] + position for frame, position in (incident.row for incident in incidents)])
+
+    def _compact_rows(self):
+        """Replaces the kept row frames with one frame holding only the rows of open incidents."""
+        incidents = [incident for incident in self.incidents.values() if incident.row is not None]
+        self._row_frames = [self._kept_rows(incidents).reset_index(drop=True)] if incidents else []
+        for position, incident in enumerate(incidents):
+            incident.row = (0, position)
+        self._released_rows = 0
+
+    def incidents_frame(self):
+        """Returns every kept incident (first flow + INCIDENT_COLUMNS with final counts), most hits first."""
+        with self.lock:
+            incidents = [incident for incident in self.incidents.values() if incident.row is not None]
+            if not incidents:
+                return pd.DataFrame(columns=list(INCIDENT_COLUMNS))
+            rows = self._kept_rows(incidents)
+            rows['Hit Count'] = np.array([incident.hits for incident in incidents], dtype=np.int64)
+            rows['First Seen'] = [incident.first_seen for incident in incidents]
+            rows['Last Seen'] = [incident.last_seen for incident in incidents]
+        return rows.sort_values('Hit Count', ascending=False, kind='stable', ignore_index=True)
+
+
+_shared_suppressor = None
+_shared_lock = threading.Lock()
+
+
+def get_alert_suppressor():
+    """
+    Returns the process-wide suppressor for live notifications (Telegram, streamed
+    UI alerts), so an attacker keeps being suppressed across batches and scans.
+    """
+    global _shared_suppressor
+    with _shared_lock:
+        if _shared_suppressor is None:
+            _shared_suppressor = AlertSuppressor(config.ALERT_SUPPRESSION_WINDOW, config.ALERT_SUPPRESSION_MAX_INCIDENTS)
+        return _shared_suppressor
+
+
+def suppress_alerts(suspicious_df):
+    """Filters suspicious flows through the shared suppressor (unchanged if ALERT_SUPPRESSION is off)."""
+    if not config.ALERT_SUPPRESSION or suspicious_df is None or suspicious_df.empty:
+        return suspicious_df
+    incidents = get_alert_suppressor().observe(suspicious_df)
+    if len(incidents) < len(suspicious_df):
+        logging.info(f"Alert suppression: {len(suspicious_df)} suspicious flows -> {len(incidents)} new or escalated incidents.")
+    return incidents
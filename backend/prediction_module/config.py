@@ -16,6 +16,17 @@ PROJECT_ROOT = CURRENT_FILE_PATH.parent.parent.parent
 
 MODEL_PATH = PROJECT_ROOT / 'model' / 'xgboost_model.pkl'
 SCALER_PATH = PROJECT_ROOT / 'model' / 'scaler.pkl'
+# Model with the scaler folded into its split thresholds (python -m prediction_module.model_fusion).
+# Used instead of model + scaler when it exists and is newer than both.
+FUSED_MODEL_PATH = PROJECT_ROOT / 'model' / 'xgboost_model_fused.pkl'
+USE_FUSED_MODEL = True
+# MODEL_PATH/FUSED_MODEL_PATH may also point to XGBoost native .json/.ubj files
+# (python -m prediction_module.native_model --export ../model/xgboost_model.ubj), or to NumPy
+# node arrays scored without xgboost (python -m prediction_module.tree_ensemble --export ../model/xgboost_model.npz).
+
+# --- XGBoost Inference ---
+XGBOOST_NATIVE_INFERENCE = True # Score with the Booster's inplace_predict on float32 instead of the sklearn wrapper
+XGBOOST_NTHREAD = None # Threads per prediction call; None = XGBoost default (all cores)
 
 BACKEND_DIR = CURRENT_FILE_PATH.parent.parent # /path/to/your_project/backend
 
@@ -27,19 +38,92 @@ RESULTS_DIR = os.path.join(BACKEND_DIR, 'results')
 # --- Input/Output CSV Paths ---
 # Input CSV is the output of the capture module
 NETWORK_FLOWS_CSV_PATH = os.path.join(BACKEND_DIR, 'network_flows.csv') 
+# Format written by the capture module (capture_module.config.FLOW_OUTPUT_FORMAT): 'csv', 'parquet' or 'arrow'.
+# The binary formats are read from the same path with a .parquet/.arrow extension.
+NETWORK_FLOWS_FORMAT = 'csv'
+# Flows loaded, scored and written per chunk, so memory stays bounded on day-long captures.
+# None loads the whole file at once. Rolling-window state carries over from one chunk to the next.
+PREDICTION_CHUNK_ROWS = 100000
+# dtype of the float flow columns when loading. float32 halves memory and is what the model scores;
+# 'float64' keeps the exact microsecond values (e.g. Flow Duration) in the result CSVs.
+FLOW_FLOAT_DTYPE = 'float32'
 
 _input_filename = os.path.basename(NETWORK_FLOWS_CSV_PATH)
 
 # Lưu file output vào thư mục RESULTS_DIR đã định nghĩa
 PREDICTIONS_OUTPUT_CSV_PATH = os.path.join(RESULTS_DIR, _input_filename.replace('.csv', '_Predictions.csv'))
 SUSPICIOUS_OUTPUT_CSV_PATH = os.path.join(RESULTS_DIR, 'Suspicious_' + _input_filename.replace('.csv', '_Predictions.csv'))
+# Compact scan summary (traffic by class, label/protocol counts, top IPs, alert sample) loaded by the UI
+SUMMARY_JSON_PATH = os.path.join(RESULTS_DIR, 'summary.json')
+SUMMARY_TOP_N = 5 # Source/destination IPs listed in the summary
+SUMMARY_MAX_ALERTS = 200 # Alert rows (incidents, most hits first) embedded in the summary
+
+# --- Results Store (results_store.py) ---
+# Append-only SQLite database (WAL mode) of every scored flow and scan run; the UI pages through it via server.py.
+RESULTS_DB_ENABLED = True
+RESULTS_DB_PATH = os.path.join(RESULTS_DIR, 'results.db')
+RESULTS_DB_STORE_FEATURES = True # Also keep each flow's numeric features (float32 blob, ~320 bytes per flow)
+RESULTS_DB_RETENTION_DAYS = 30 # Scans stored longer ago than this are deleted with their flows; None keeps everything
+RESULTS_DB_RETENTION_INTERVAL_HOURS = 6 # Retention and compaction run after a scan at most this often
+RESULTS_DB_DELETE_BATCH_ROWS = 50000 # Rows deleted per retention transaction
+RESULTS_DB_MAX_PAGE_SIZE = 1000 # Max flows returned by one query_flows page
+RESULTS_DB_BUSY_TIMEOUT = 30 # Seconds a write waits for another writer's transaction
+# The full predictions CSV is rewritten every scan; with the results store enabled it is only written if set
+PREDICTIONS_CSV_OUTPUT = False
 
 # --- Feature Engineering Settings (Optional) ---
 # Enable/disable dynamic feature calculation if your model needs them
 CALCULATE_DYNAMIC_FEATURES = False # Set to True if model uses time_since_last or rolling features
 ROLLING_WINDOW_MINUTES = 2 # Used only if CALCULATE_DYNAMIC_FEATURES is True and model needs rolling features
+ROLLING_MAX_SOURCES = 50000 # Source IPs kept in the rolling-feature state; the least recently active is evicted first
+ROLLING_MAX_EVENTS_PER_SOURCE = 10000 # Flows held per source inside one window; older ones are dropped past this
+
+# --- Streaming Mode (main.py --stream) ---
+# Flows are scored in micro-batches while the capture is still running instead of after it.
+STREAM_BATCH_SIZE = 256 # Max flows per scored micro-batch
+STREAM_FLUSH_INTERVAL = 1.0 # Seconds: a partial batch is scored at least this often while flows arrive
+STREAM_QUEUE_DEPTH = 64 # Max batches waiting for the scorer before capture blocks
+STREAM_ARCHIVE_FLOWS = True # Also write the flows to the capture module's flow file
+STREAM_TELEGRAM_ALERTS = False # Queue Telegram alerts for a batch's suspicious flows as soon as it is scored
+
+# --- Telegram Alerts (send_telegram_messege.py) ---
+# Alerts are queued and sent by a background thread as one digest per (Src IP, Prediction) and window.
+TELEGRAM_REPORT_ALERTS = False # Also alert on the suspicious flows of batch runs (analyze_and_save_results)
+TELEGRAM_API_BASE = 'https://api.telegram.org' # Point at a local stub server to test without Telegram
+TELEGRAM_QUEUE_SIZE = 10000 # Max flows waiting to be coalesced; more are dropped (and counted) instead of blocking
+TELEGRAM_DIGEST_WINDOW = 10.0 # Seconds flows of one (Src IP, Prediction) are collected into one message
+TELEGRAM_MAX_MESSAGES_PER_FLUSH = 10 # Digests sent per window; the rest are summarized in one extra message
+TELEGRAM_RATE_PER_SECOND = 1.0 # Average messages per second (Telegram allows about 1/s per chat)
+TELEGRAM_BURST = 5 # Messages that may be sent back to back before the rate applies
+TELEGRAM_HTTP_TIMEOUT = 10 # Seconds per sendMessage request
+TELEGRAM_MAX_RETRIES = 3 # Retries of a message rejected with HTTP 429 (after its retry_after)
+TELEGRAM_SHUTDOWN_TIMEOUT = 30 # Seconds a finishing run waits for pending alerts to be sent
+
+# --- Alert Suppression (alert_suppression.py) ---
+# Suspicious flows are grouped into incidents keyed by (Src IP, Dst IP, Dst Port, Prediction).
+ALERT_SUPPRESSION = True # Suspicious CSV/email get one row per incident with Hit Count; live alerts only new/escalated incidents
+ALERT_SUPPRESSION_WINDOW = 900 # Seconds an incident stays open after its last hit; later hits start a new incident
+ALERT_SUPPRESSION_MAX_INCIDENTS = 50000 # Incidents tracked for live alerts; the least recently active is evicted first
+ALERT_ESCALATION_FACTOR = 10 # An open incident is alerted again when its hit count grows this many times
+
+# --- Email Notifications (send_email_notification.py) ---
+EMAIL_ASYNC_NOTIFICATIONS = True # Queue the results email for a background worker instead of sending it inline
+EMAIL_DEBOUNCE_SECONDS = 5.0 # Runs finishing within this many seconds of each other share one digest email
+EMAIL_QUEUE_SIZE = 100 # Max reports waiting for the worker; more are dropped instead of blocking
+EMAIL_SMTP_TIMEOUT = 30 # Seconds for SMTP connect and each command
+EMAIL_SMTP_IDLE_TIMEOUT = 120 # Seconds the authenticated SMTP connection is kept open without mail
+EMAIL_SHUTDOWN_TIMEOUT = 60 # Seconds a finishing run waits for its pending email to be sent
+
+# --- Backend Service (server.py) ---
+# Long-running process that keeps the model loaded between scans; bound to localhost only.
+SERVICE_HOST = '127.0.0.1'
+SERVICE_PORT = 8765
+# Every request must carry the per-launch secret Electron passes in this environment variable, in this header
+SERVICE_TOKEN_ENV = 'APT_BACKEND_TOKEN'
+SERVICE_TOKEN_HEADER = 'X-Backend-Token'
 
 # --- Prediction Settings ---
+SINGLE_PASS_INFERENCE = True # Derive labels from predict_proba (argmax) instead of a second model.predict pass
 BENIGN_LABELS = ['Benign', 0, 'BENIGN'] # Case-insensitive check might be better later
 
 # --- Logging Configuration ---
@@ -1,16 +1,150 @@
 # prediction_module/feature_engineer.py
-import pandas as pd
 import logging
+from collections import OrderedDict, deque
+
+import numpy as np
+import pandas as pd
+
 from . import config # Import config to check flags/settings
 
-def calculate_dynamic_features(df, timestamp_col, renamed_cols_map):
+
+class _SourceState:
+    """Per-source state: last flow time and the (timestamp, value) events inside the rolling window."""
+    __slots__ = ('last_seen', 'events', 'window_sum', 'tail_time', 'tail_count', 'tail_sum')
+
+    def __init__(self):
+        self.last_seen = None
+        self.events = deque()
+        self.window_sum = 0.0
+        # Events sharing the newest timestamp; excluded from a flow's own window (closed='left')
+        self.tail_time = None
+        self.tail_count = 0
+        self.tail_sum = 0.0
+
+
+class RollingFeatureEngine:
+    """
+    Incremental per-source-IP features, updated one flow at a time in O(1)
+    amortized: seconds since the previous flow of the same source, and the
+    count and value sum of that source's flows in the preceding window
+    [t - window, t). State persists across calls, so micro-batches of a stream
+    (or chunks of a file) see the same values as one pass over all flows.
+
+    Memory is bounded: at most `max_sources` sources are kept (the least
+    recently active is dropped first) and at most `max_events` events per source.
+    A flow arriving later than newer flows of its source is placed in order,
+    but only events still held in the window are counted for it.
+    """
+    def __init__(self, window_seconds, max_sources, max_events):
+        self.window_ns = int(window_seconds * 1e9) # Timestamps are integer epoch nanoseconds, so differences are exact
+        self.max_sources = max_sources
+        self.max_events = max_events
+        self.sources = OrderedDict() # Src IP -> _SourceState, least recently active first
+        self.evicted_sources = 0
+        self.truncated_windows = 0
+
+    def update(self, source, timestamp, value=0.0):
+        """
+        Adds one flow and returns its features.
+
+        Args:
+            source: Source IP of the flow.
+            timestamp: Flow time in integer epoch nanoseconds.
+            value: Value summed over the window (e.g. forward packets).
+
+        Returns:
+            Tuple (seconds since the source's previous flow, flows in the window, value sum in the window).
+        """
+        state = self.sources.get(source)
+        if state is None:
+            state = self.sources[source] = _SourceState()
+            if len(self.sources) > self.max_sources:
+                self.sources.popitem(last=False)
+                self.evicted_sources += 1
+        else:
+            self.sources.move_to_end(source)
+
+        if state.last_seen is None:
+            time_since_last = 0.0
+        else:
+            time_since_last = max(timestamp - state.last_seen, 0) / 1e9
+        state.last_seen = timestamp if state.last_seen is None else max(state.last_seen, timestamp)
+
+        events = state.events
+        window_start = timestamp - self.window_ns
+        if state.tail_time is None or timestamp >= state.tail_time:
+            while events and events[0][0] < window_start:
+                state.window_sum -= events.popleft()[1]
+            count, total = len(events), state.window_sum
+            if timestamp == state.tail_time:
+                count -= state.tail_count
+                total -= state.tail_sum
+                state.tail_count += 1
+                state.tail_sum += value
+            else:
+                state.tail_time, state.tail_count, state.tail_sum = timestamp, 1, value
+            events.append((timestamp, value))
+        else: # Late flow: scan the held window and insert it in time order
+            count, total, position = 0, 0.0, len(events)
+            for index, (event_time, event_value) in enumerate(events):
+                if event_time >= timestamp:
+                    position = min(position, index)
+                    if event_time > timestamp:
+                        break
+                elif event_time >= window_start:
+                    count += 1
+                    total += event_value
+            events.insert(position, (timestamp, value))
+        state.window_sum += value
+
+        if len(events) > self.max_events:
+            event_time, event_value = events.popleft()
+            state.window_sum -= event_value
+            if event_time == state.tail_time:
+                state.tail_count -= 1
+                state.tail_sum -= event_value
+            self.truncated_windows += 1
+        return time_since_last, count, total
+
+    def compute(self, sources, timestamps, values=None):
+        """
+        Updates the engine with a batch of flows, in time order, and returns
+        their features in the original row order.
+
+        Args:
+            sources: Source IP per flow.
+            timestamps: datetime64 Series/array of flow times.
+            values: Values summed over the window, or None.
+
+        Returns:
+            Tuple of float64 arrays (time_since_last, rolling_count, rolling_sum).
+        """
+        nanoseconds = pd.to_datetime(timestamps).to_numpy(dtype='datetime64[ns]').astype(np.int64)
+        order = np.argsort(nanoseconds, kind='stable')
+        sources = np.asarray(sources, dtype=object)[order].tolist()
+        values = [0.0] * len(order) if values is None else np.asarray(values, dtype=np.float64)[order].tolist()
+        features = np.empty((len(order), 3))
+        features[order] = np.array([self.update(source, timestamp, value)
+                                    for source, timestamp, value in zip(sources, nanoseconds[order].tolist(), values)]).reshape(-1, 3)
+        return features[:, 0], features[:, 1], features[:, 2]
+
+
+def create_feature_engine():
+    """Returns a RollingFeatureEngine configured from ROLLING_* settings."""
+    return RollingFeatureEngine(config.ROLLING_WINDOW_MINUTES * 60, config.ROLLING_MAX_SOURCES,
+                                config.ROLLING_MAX_EVENTS_PER_SOURCE)
+
+
+def calculate_dynamic_features(df, timestamp_col, renamed_cols_map, engine=None):
     """
     Calculates time-based or rolling window features if enabled in config.
 
     Args:
-        df: Preprocessed DataFrame, sorted by timestamp.
+        df: Preprocessed DataFrame (any row order; rows keep their order).
         timestamp_col: Name of the datetime timestamp column.
         renamed_cols_map: Dictionary mapping original to cleaned column names.
+        engine: RollingFeatureEngine holding per-source state from earlier batches
+            of the same stream/file; a fresh one is used if None.
 
     Returns:
         DataFrame with added dynamic features.
@@ -24,67 +158,40 @@ def calculate_dynamic_features(df, timestamp_col, renamed_cols_map):
          return df # Return original df, prediction might fail later if features are expected
 
     logging.info("Calculating dynamic features...")
-    df = df.sort_values(by=timestamp_col).reset_index(drop=True)
-
-    # --- Example 1: Time Since Last Flow from Source IP ---
-    feature_time_since = 'time_since_last_flow_src_sec'
     src_ip_col_original = 'Src IP'
     src_ip_col = renamed_cols_map.get(src_ip_col_original, src_ip_col_original)
+    if src_ip_col not in df.columns:
+        logging.warning(f"  Cannot calculate dynamic features: Source IP column '{src_ip_col}' not found.")
+        # If these features are critical for the model, align_features fills them with 0
+        return df
 
-    if src_ip_col in df.columns:
-        logging.info(f"  Calculating '{feature_time_since}' based on '{src_ip_col}'...")
-        df[feature_time_since] = df.groupby(src_ip_col)[timestamp_col].diff().dt.total_seconds()
-        # Fill NaN for the first occurrence of each IP, clip negative (shouldn't happen with diff)
-        df[feature_time_since] = df[feature_time_since].fillna(0).clip(lower=0)
-        logging.info(f"  Finished calculating '{feature_time_since}'.")
-    else:
-        logging.warning(f"  Cannot calculate '{feature_time_since}': Source IP column '{src_ip_col}' not found.")
-        # If this feature is critical for the model, you might need to add a dummy column later
-        # or handle its absence in the align_features step. For now, we just skip calculation.
-
-    # --- Example 2: Rolling Window Features (e.g., count, sum over X minutes) ---
+    engine = engine if engine is not None else create_feature_engine()
     # Check if any rolling features are expected (you might need a more robust check based on model needs)
     needs_rolling = any('roll' in feature for feature in config.EXPECTED_FEATURES or [])
+    feature_to_sum_original = 'Total Fwd Packets' # Check original name
+    feature_to_sum = renamed_cols_map.get(feature_to_sum_original, feature_to_sum_original)
+    values = df[feature_to_sum] if needs_rolling and feature_to_sum in df.columns else None
 
-    if needs_rolling and src_ip_col in df.columns:
-        window_str = f"{config.ROLLING_WINDOW_MINUTES}min"
-        logging.info(f"  Calculating rolling window features (window: {window_str}) based on '{src_ip_col}'...")
-        # Set timestamp as index for rolling operations
-        df_indexed = df.set_index(timestamp_col)
-        grouped_src_indexed = df_indexed.groupby(src_ip_col)
+    time_since_last, rolling_count, rolling_sum = engine.compute(df[src_ip_col], df[timestamp_col], values)
 
-        # Rolling Count Example
+    # --- Time Since Last Flow from Source IP ---
+    feature_time_since = 'time_since_last_flow_src_sec'
+    df[feature_time_since] = time_since_last
+    logging.info(f"  Finished calculating '{feature_time_since}' based on '{src_ip_col}'.")
+
+    # --- Rolling Window Features (count and sum over ROLLING_WINDOW_MINUTES) ---
+    if needs_rolling:
         feature_roll_count = f'flow_count_roll{config.ROLLING_WINDOW_MINUTES}m_src'
-        # Check if model actually needs this specific feature
-        # if feature_roll_count in (config.EXPECTED_FEATURES or []): # Check against expected list
-        logging.info(f"    Calculating rolling count: {feature_roll_count}")
-        # Use a reliable column for counting (like the group key itself or index)
-        rolling_count_result = grouped_src_indexed[src_ip_col].rolling(window=window_str, closed='left').count()
-        rolling_count_result = rolling_count_result.reset_index(level=0, drop=True) # Drop the src_ip level index
-        df_indexed[feature_roll_count] = rolling_count_result.fillna(0) # Fill NaNs at the start of windows
-
-        # Rolling Sum Example (e.g., sum of 'Total Fwd Packets')
-        feature_to_sum_original = 'Total Fwd Packets' # Check original name
-        feature_to_sum = renamed_cols_map.get(feature_to_sum_original, feature_to_sum_original)
+        df[feature_roll_count] = rolling_count
         feature_roll_sum = f'sum_fwd_pkts_roll{config.ROLLING_WINDOW_MINUTES}m_src'
-
-        if feature_to_sum in df_indexed.columns:
-            # if feature_roll_sum in (config.EXPECTED_FEATURES or []): # Check if needed
-            logging.info(f"    Calculating rolling sum: {feature_roll_sum} from '{feature_to_sum}'")
-            rolling_sum_result = grouped_src_indexed[feature_to_sum].rolling(window=window_str, closed='left').sum()
-            rolling_sum_result = rolling_sum_result.reset_index(level=0, drop=True)
-            df_indexed[feature_roll_sum] = rolling_sum_result.fillna(0)
+        if values is not None:
+            df[feature_roll_sum] = rolling_sum
         else:
             logging.warning(f"    Cannot calculate rolling sum '{feature_roll_sum}': Column '{feature_to_sum}' not found.")
+        logging.info(f"  Finished calculating rolling window features ({config.ROLLING_WINDOW_MINUTES}min window).")
 
-        # Add more rolling calculations (mean, std, nunique) here if needed...
-
-        # Reset index to bring timestamp back as a column
-        df = df_indexed.reset_index()
-        logging.info("  Finished calculating rolling window features.")
-
-    elif needs_rolling and src_ip_col not in df.columns:
-         logging.warning(f"  Cannot calculate rolling features: Source IP column '{src_ip_col}' not found.")
-
+    if engine.evicted_sources or engine.truncated_windows:
+        logging.warning(f"  Rolling feature state is at its limits: {engine.evicted_sources} idle sources evicted, "
+                        f"{engine.truncated_windows} window events dropped (ROLLING_MAX_SOURCES / ROLLING_MAX_EVENTS_PER_SOURCE).")
     logging.info("Dynamic feature calculation finished.")
     return df
@@ -1,13 +1,62 @@
 # prediction_module/loader.py
+import numpy as np
 import pandas as pd
 import joblib
 import os
 import logging
 from . import config
+from .native_model import as_native_model, load_model_file
+from capture_module.config import CSV_HEADER
+from capture_module.flow_sink import FLOW_FILE_EXTENSIONS, INTEGER_COLUMNS, STRING_COLUMNS
+
+
+# Model/scaler/features already loaded in this process, keyed by file paths and modification times.
+# Lets a long-running process (server.py) score many scans without reloading from disk.
+_model_cache = {}
 
 
 def load_model_scaler():
-    """Loads the trained model and scaler."""
+    """
+    Loads the trained model and scaler, reusing the copies already loaded in this
+    process unless the files changed on disk.
+
+    Returns:
+        Tuple (model, scaler, expected_features), or (None, None, None) on failure.
+    """
+    try:
+        cache_key = (str(config.MODEL_PATH), os.path.getmtime(config.MODEL_PATH),
+                     str(config.SCALER_PATH), os.path.getmtime(config.SCALER_PATH),
+                     _fused_model_mtime())
+    except OSError:
+        cache_key = None # Missing file: let the loader below report it
+    if cache_key is not None and cache_key in _model_cache:
+        logging.info("Using model and scaler already loaded in this process.")
+        return _model_cache[cache_key]
+
+    loaded = _load_model_scaler_from_disk()
+    if loaded[0] is not None and config.XGBOOST_NATIVE_INFERENCE:
+        model = as_native_model(loaded[0], config.XGBOOST_NTHREAD)
+        if model is not loaded[0]:
+            logging.info("Using the native XGBoost booster (inplace_predict on float32) for inference.")
+        loaded = (model,) + loaded[1:]
+    if cache_key is not None and loaded[0] is not None:
+        _model_cache.clear()
+        _model_cache[cache_key] = loaded
+    return loaded
+
+
+def _fused_model_mtime():
+    """Returns the modification time of the fused model, or None if it is disabled or missing."""
+    if not config.USE_FUSED_MODEL or not os.path.exists(config.FUSED_MODEL_PATH):
+        return None
+    return os.path.getmtime(config.FUSED_MODEL_PATH)
+
+
+def _load_model_scaler_from_disk(allow_fused=True):
+    """
+    Loads the trained model and scaler. If an up-to-date fused model exists
+    (see model_fusion.py) it is returned instead, with None as the scaler.
+    """
     logging.info("Loading model and scaler...")
     if not os.path.exists(config.MODEL_PATH):
         logging.error(f"Model file not found at '{config.MODEL_PATH}'")
@@ -17,7 +66,7 @@ def load_model_scaler():
         return None, None, None
 
     try:
-        model = joblib.load(config.MODEL_PATH)
+        model = load_model_file(config.MODEL_PATH)
         scaler = joblib.load(config.SCALER_PATH)
         logging.info(f"Successfully loaded model from: {config.MODEL_PATH}")
         logging.info(f"Successfully loaded scaler from: {config.SCALER_PATH}")
@@ -35,6 +84,15 @@ def load_model_scaler():
                 return None, None, None
         else:
              logging.info(f"Using manually defined EXPECTED_FEATURES list from config ({len(expected_features)} features).")
+
+        fused_mtime = _fused_model_mtime() if allow_fused else None
+        if fused_mtime is not None:
+            if fused_mtime >= max(os.path.getmtime(config.MODEL_PATH), os.path.getmtime(config.SCALER_PATH)):
+                model = load_model_file(config.FUSED_MODEL_PATH)
+                logging.info(f"Using fused model (scaling folded into the trees) from: {config.FUSED_MODEL_PATH}")
+                return model, None, expected_features
+            logging.warning(f"Fused model '{config.FUSED_MODEL_PATH}' is older than the model or scaler; ignoring it. "
+                            "Re-run: python -m prediction_module.model_fusion")
         return model, scaler, expected_features
 
     except FileNotFoundError: 
@@ -44,25 +102,161 @@ def load_model_scaler():
         logging.error(f"Error loading model/scaler: {e}", exc_info=True)
         return None, None, None
 
-def load_data():
-    """Loads the network flow data from the CSV file."""
-    logging.info(f"Loading network flow data from: {config.NETWORK_FLOWS_CSV_PATH}")
-    if not os.path.exists(config.NETWORK_FLOWS_CSV_PATH):
-        logging.error(f"Input CSV file not found: '{config.NETWORK_FLOWS_CSV_PATH}'")
+# Columns with many repeated values, stored as pandas categoricals
+CATEGORICAL_COLUMNS = ('Src IP', 'Dst IP')
+# Columns that need float64 whatever FLOW_FLOAT_DTYPE is (float32 epoch seconds are off by minutes)
+FLOAT64_COLUMNS = ('Timestamp Epoch',)
+
+
+def flow_dtypes(integer_dtype='int32'):
+    """
+    Returns the pinned dtype of every capture-module column: categoricals for IP
+    addresses, strings for the flow ID and timestamp, `integer_dtype` for counts,
+    ports and flags, and FLOW_FLOAT_DTYPE (float32 by default) for every other feature.
+    """
+    dtypes = {}
+    for name in CSV_HEADER:
+        if name in CATEGORICAL_COLUMNS:
+            dtypes[name] = 'category'
+        elif name in STRING_COLUMNS:
+            dtypes[name] = 'str'
+        elif name in INTEGER_COLUMNS:
+            dtypes[name] = integer_dtype
+        elif name in FLOAT64_COLUMNS:
+            dtypes[name] = 'float64'
+        else:
+            dtypes[name] = config.FLOW_FLOAT_DTYPE
+    return dtypes
+
+
+def _pin_dtypes(df, dtypes):
+    """
+    Casts the known columns of a DataFrame (a CSV chunk, or read from Parquet/Arrow)
+    to the pinned dtypes. An integer column is only made int32 if this chunk's
+    values are whole, present and fit; otherwise it becomes FLOW_FLOAT_DTYPE
+    (int64 columns out of int32 range stay int64) instead of failing or wrapping around.
+    """
+    int32_info = np.iinfo(np.int32)
+    known = {}
+    for name, dtype in dtypes.items():
+        if name not in df.columns or dtype == 'str':
+            continue
+        if dtype == 'int32' and len(df):
+            values = df[name]
+            in_range = int32_info.min <= values.min() and values.max() <= int32_info.max
+            if pd.api.types.is_integer_dtype(values):
+                if not in_range:
+                    continue # Keep int64 rather than wrap around
+            elif not in_range or values.isna().any() or (values.to_numpy() % 1 != 0).any():
+                dtype = config.FLOW_FLOAT_DTYPE
+        known[name] = dtype
+    return df.astype(known, copy=False) if known else df
+
+
+def _read_csv(flows_path, chunk_rows=None):
+    """
+    pd.read_csv with pinned dtypes. Integer columns are parsed as float64 and
+    narrowed by _pin_dtypes for each chunk, so a missing or oversized value
+    anywhere in the file only widens that chunk's column instead of failing
+    the scan part-way through.
+    """
+    dtypes = flow_dtypes()
+    reader = pd.read_csv(flows_path, dtype=flow_dtypes('float64'), chunksize=chunk_rows)
+    if chunk_rows is None:
+        return _pin_dtypes(reader, dtypes)
+    return (_pin_dtypes(chunk, dtypes) for chunk in reader)
+
+
+def iter_data_chunks(data_format=None, flows_path=None, chunk_rows=None):
+    """
+    Reads the network flow file in chunks of at most `chunk_rows` flows, so only
+    one chunk is held in memory at a time. Columns get the pinned flow_dtypes().
+
+    Args:
+        data_format: 'csv', 'parquet' or 'arrow'. Defaults to config.NETWORK_FLOWS_FORMAT.
+        flows_path: File to read. Defaults to the configured flow file for the format.
+        chunk_rows: Flows per chunk. Defaults to config.PREDICTION_CHUNK_ROWS.
+
+    Yields:
+        DataFrames of flows. Raises OSError/ValueError if the file cannot be read.
+    """
+    data_format = (data_format or config.NETWORK_FLOWS_FORMAT).lower()
+    flows_path = flows_path or get_flows_path(data_format)
+    chunk_rows = chunk_rows or config.PREDICTION_CHUNK_ROWS
+    logging.info(f"Streaming network flow data ({data_format}) from: {flows_path} in chunks of {chunk_rows} flows")
+    dtypes = flow_dtypes()
+    if data_format == 'parquet':
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(flows_path).iter_batches(batch_size=chunk_rows):
+            yield _pin_dtypes(batch.to_pandas(), dtypes)
+    elif data_format == 'arrow':
+        import pyarrow as pa
+        with pa.memory_map(flows_path) as source: # Record batches are read straight from the mapped file
+            reader = pa.ipc.open_file(source)
+            for index in range(reader.num_record_batches):
+                table = pa.Table.from_batches([reader.get_batch(index)])
+                for start in range(0, table.num_rows, chunk_rows):
+                    yield _pin_dtypes(table.slice(start, chunk_rows).to_pandas(), dtypes)
+    else:
+        try:
+            yield from _read_csv(flows_path, chunk_rows)
+        except pd.errors.EmptyDataError:
+            return
+
+
+def get_flows_path(data_format=None):
+    """Returns the path of the network flow file for the given (or configured) format."""
+    data_format = (data_format or config.NETWORK_FLOWS_FORMAT).lower()
+    extension = FLOW_FILE_EXTENSIONS.get(data_format)
+    if extension is None:
+        return config.NETWORK_FLOWS_CSV_PATH
+    return os.path.splitext(config.NETWORK_FLOWS_CSV_PATH)[0] + extension
+
+def load_data(data_format=None, flows_path=None):
+    """
+    Loads the network flow data written by the capture module.
+
+    CSV is parsed as text; Parquet and Arrow IPC files are read with their stored
+    column types, so feature values are not round-tripped through text. Known
+    columns are pinned to flow_dtypes() either way.
+
+    Args:
+        data_format: 'csv', 'parquet' or 'arrow'. Defaults to config.NETWORK_FLOWS_FORMAT.
+        flows_path: File to read. Defaults to the configured flow file for the format.
+
+    Returns:
+        DataFrame with one row per flow, an empty DataFrame for an empty file, or None on error.
+    """
+    data_format = (data_format or config.NETWORK_FLOWS_FORMAT).lower()
+    if data_format not in FLOW_FILE_EXTENSIONS:
+        logging.error(f"Unknown network flow format '{data_format}'. Use one of: {', '.join(FLOW_FILE_EXTENSIONS)}")
+        return None
+    flows_path = flows_path or get_flows_path(data_format)
+    logging.info(f"Loading network flow data ({data_format}) from: {flows_path}")
+    if not os.path.exists(flows_path):
+        logging.error(f"Input flow file not found: '{flows_path}'")
         return None
 
     try:
-        df = pd.read_csv(config.NETWORK_FLOWS_CSV_PATH)
-        logging.info(f"Successfully loaded {len(df)} rows from CSV.")
+        if data_format == 'parquet':
+            df = _pin_dtypes(pd.read_parquet(flows_path), flow_dtypes())
+        elif data_format == 'arrow':
+            df = _pin_dtypes(pd.read_feather(flows_path), flow_dtypes())
+        else:
+            df = _read_csv(flows_path)
+        logging.info(f"Successfully loaded {len(df)} rows from {data_format} file.")
         if df.empty:
-            logging.warning("Loaded CSV file is empty.")
+            logging.warning("Loaded flow file is empty.")
         return df
     except FileNotFoundError: # Redundant check, but safe
-        logging.error(f"FileNotFoundError loading CSV: '{config.NETWORK_FLOWS_CSV_PATH}'")
+        logging.error(f"FileNotFoundError loading flow file: '{flows_path}'")
         return None
     except pd.errors.EmptyDataError:
-        logging.warning(f"Input CSV file is empty: '{config.NETWORK_FLOWS_CSV_PATH}'")
+        logging.warning(f"Input CSV file is empty: '{flows_path}'")
         return pd.DataFrame() # Return empty DataFrame
+    except ImportError as e:
+        logging.error(f"Reading {data_format} flow files requires pyarrow (pip install pyarrow): {e}")
+        return None
     except Exception as e:
-        logging.error(f"Error reading CSV file '{config.NETWORK_FLOWS_CSV_PATH}': {e}", exc_info=True)
+        logging.error(f"Error reading flow file '{flows_path}': {e}", exc_info=True)
         return None
@@ -0,0 +1,225 @@
+# prediction_module/model_fusion.py
+"""
+Folds the MinMaxScaler into the split thresholds of the XGBoost model, so the
+fused model scores raw aligned features and inference skips scaler.transform.
+
+Usage (from backend/): python -m prediction_module.model_fusion
+"""
+import copy
+import json
+import logging
+import sys
+
+import numpy as np
+import pandas as pd
+
+from . import config
+from .native_model import save_model_file
+
+# float32 bit patterns mapped to int64 keys that sort in the same order as the float values
+_FLOAT32_MAX_KEY = int(np.array(np.finfo(np.float32).max, dtype=np.float32).view(np.int32))
+
+
+def _keys_to_float32(keys):
+    bits = np.where(keys >= 0, keys, (-keys - 1) | -0x80000000) # Negative floats: sign bit + mirrored magnitude
+    return bits.astype(np.int32).view(np.float32)
+
+
+def _scale_features(scaler, feature_indices, values):
+    """
+    Scales values[i] as feature feature_indices[i] exactly as the prediction
+    pipeline does: scaler.transform on float32 input, read back as float32.
+    """
+    num_features = scaler.n_features_in_
+    X = np.zeros((len(values), num_features), dtype=np.float32)
+    rows = np.arange(len(values))
+    X[rows, feature_indices] = values
+    if hasattr(scaler, 'feature_names_in_'):
+        X = pd.DataFrame(X, columns=scaler.feature_names_in_, copy=False)
+    return np.asarray(scaler.transform(X), dtype=np.float32)[rows, feature_indices]
+
+
+def fused_thresholds(scaler, feature_indices, thresholds):
+    """
+    Maps split thresholds on scaled features back to thresholds on raw features.
+
+    XGBoost sends a row left when float32(x_scaled) < threshold. Scaling is
+    monotone, so the raw values going left are exactly those below the smallest
+    float32 x whose scaled value reaches the threshold. That x is found by binary
+    search over all finite float32 values, so the fused split makes the same
+    decision as the original one for every input.
+
+    Args:
+        scaler: Fitted MinMaxScaler (positive scale, clip=False).
+        feature_indices: Feature index of each split.
+        thresholds: Split threshold of each split (on scaled values).
+
+    Returns:
+        float32 array of raw-feature thresholds (+inf where every finite value goes left).
+    """
+    feature_indices = np.asarray(feature_indices, dtype=np.intp)
+    thresholds = np.asarray(thresholds, dtype=np.float32)
+    low = np.full(len(thresholds), -_FLOAT32_MAX_KEY - 1, dtype=np.int64) # Key of the lowest finite float32
+    high = np.full(len(thresholds), _FLOAT32_MAX_KEY + 1, dtype=np.int64) # One past the largest finite float32
+    while True:
+        active = low < high
+        if not active.any():
+            break
+        middle = (low + high) // 2
+        reaches = np.zeros(len(thresholds), dtype=bool)
+        reaches[active] = _scale_features(scaler, feature_indices[active],
+                                          _keys_to_float32(middle[active])) >= thresholds[active]
+        high = np.where(active & reaches, middle, high)
+        low = np.where(active & ~reaches, middle + 1, low)
+    fused = np.full(len(thresholds), np.inf, dtype=np.float32)
+    found = low <= _FLOAT32_MAX_KEY
+    fused[found] = _keys_to_float32(low[found])
+    return fused
+
+
+def check_fusable(model, scaler):
+    """Returns None if the scaler can be folded into the model, else the reason it cannot."""
+    if not hasattr(model, 'get_booster'):
+        return f"model type {type(model).__name__} is not an XGBoost model"
+    if not all(hasattr(scaler, name) for name in ('scale_', 'min_', 'n_features_in_')):
+        return f"scaler type {type(scaler).__name__} is not a MinMaxScaler"
+    if getattr(scaler, 'clip', False):
+        return "scaler uses clip=True, which is not monotone-invertible"
+    if not np.all(scaler.scale_ > 0):
+        return "scaler has non-positive scale factors"
+    if model.get_booster().num_features() != scaler.n_features_in_:
+        return "model and scaler disagree on the number of features"
+    return None
+
+
+def fuse_scaler_into_model(model, scaler):
+    """
+    Builds a copy of the XGBoost model whose split thresholds act on raw
+    (unscaled) features: fused.predict(X) == model.predict(scaler.transform(X)).
+
+    Args:
+        model: Fitted XGBoost sklearn model.
+        scaler: Fitted MinMaxScaler used to train the model.
+
+    Returns:
+        The fused model.
+
+    Raises:
+        ValueError: If the scaler cannot be folded into the model (see check_fusable).
+    """
+    reason = check_fusable(model, scaler)
+    if reason:
+        raise ValueError(f"Cannot fuse scaler into model: {reason}")
+
+    model_json = json.loads(model.get_booster().save_raw('json'))
+    trees = model_json['learner']['gradient_booster']['model']['trees']
+    split_nodes = [] # (tree, node) of every internal node
+    for tree in trees:
+        for node, left_child in enumerate(tree['left_children']):
+            if left_child != -1: # Leaves store their weight in split_conditions
+                split_nodes.append((tree, node))
+    if any(tree['split_type'][node] != 0 for tree, node in split_nodes):
+        raise ValueError("Cannot fuse scaler into model: it contains categorical splits")
+
+    feature_indices = [tree['split_indices'][node] for tree, node in split_nodes]
+    thresholds = [tree['split_conditions'][node] for tree, node in split_nodes]
+    logging.info(f"Fusing scaler into {len(split_nodes)} splits of {len(trees)} trees...")
+    for (tree, node), threshold in zip(split_nodes, fused_thresholds(scaler, feature_indices, thresholds)):
+        tree['split_conditions'][node] = float(threshold)
+
+    fused = copy.deepcopy(model)
+    fused.get_booster().load_model(bytearray(json.dumps(model_json), 'utf-8'))
+    return fused
+
+
+def build_validation_set(model, scaler, fused, X_real=None, num_rows=20000, seed=0):
+    """
+    Builds raw feature rows that exercise every split boundary: each value is a
+    fused threshold, the float32 just below it, or a value from X_real.
+    """
+    model_json = json.loads(fused.get_booster().save_raw('json'))
+    probes = [[] for _ in range(scaler.n_features_in_)]
+    for tree in model_json['learner']['gradient_booster']['model']['trees']:
+        for node, left_child in enumerate(tree['left_children']):
+            threshold = np.float32(tree['split_conditions'][node])
+            if left_child != -1 and np.isfinite(threshold):
+                probes[tree['split_indices'][node]] += [threshold, np.nextafter(threshold, np.float32(-np.inf))]
+    if X_real is not None and len(X_real):
+        for feature, column in enumerate(np.asarray(X_real, dtype=np.float32).T):
+            probes[feature] += list(column)
+    rng = np.random.default_rng(seed)
+    X = np.zeros((num_rows, scaler.n_features_in_), dtype=np.float32)
+    for feature, values in enumerate(probes):
+        if values:
+            X[:, feature] = rng.choice(np.asarray(values, dtype=np.float32), size=num_rows)
+    if X_real is not None and len(X_real):
+        X = np.vstack([np.asarray(X_real, dtype=np.float32), X])
+    return X
+
+
+def verify_fused_model(model, scaler, fused, X):
+    """
+    Checks that the fused model is bit-for-bit equivalent to scaler + model on X.
+
+    Returns:
+        Tuple (equivalent, number of differing rows).
+    """
+    X_scaled = scaler.transform(pd.DataFrame(X, columns=scaler.feature_names_in_)
+                                if hasattr(scaler, 'feature_names_in_') else X)
+    expected = model.get_booster().inplace_predict(np.asarray(X_scaled, dtype=np.float32), predict_type='margin')
+    actual = fused.get_booster().inplace_predict(X, predict_type='margin')
+    differing = int(np.count_nonzero(np.any(np.atleast_2d(expected != actual).reshape(len(X), -1), axis=1)))
+    return differing == 0, differing
+
+
+def _load_validation_rows(scaler, expected_features):
+    """Returns the aligned rows of the current network flow file, or None if it cannot be used."""
+    from .loader import load_data
+    from .preprocessor import preprocess_data
+    from .predictor import align_features
+
+    df = load_data()
+    if df is None or df.empty:
+        return None
+    df_processed, _, renamed_cols_map = preprocess_data(df, expected_features)
+    if df_processed is None:
+        return None
+    df_aligned = align_features(df_processed, expected_features, renamed_cols_map)
+    return None if df_aligned is None else df_aligned.to_numpy(dtype=np.float32, copy=True)
+
+
+def prepare_fused_model():
+    """
+    Fuses the scaler into the model, verifies it and saves it to FUSED_MODEL_PATH.
+
+    Returns:
+        True if the fused model was verified and saved, False otherwise.
+    """
+    from .loader import _load_model_scaler_from_disk
+
+    model, scaler, expected_features = _load_model_scaler_from_disk(allow_fused=False)
+    if model is None:
+        return False
+    try:
+        fused = fuse_scaler_into_model(model, scaler)
+    except ValueError as e:
+        logging.error(str(e))
+        return False
+
+    X_real = _load_validation_rows(scaler, expected_features)
+    X = build_validation_set(model, scaler, fused, X_real)
+    equivalent, differing = verify_fused_model(model, scaler, fused, X)
+    real_rows = 0 if X_real is None else len(X_real)
+    if not equivalent:
+        logging.error(f"Fused model differs from scaler + model on {differing} of {len(X)} validation rows. Not saved.")
+        return False
+    logging.info(f"Fused model matches scaler + model bit-for-bit on {len(X)} validation rows "
+                 f"({real_rows} captured flows, {len(X) - real_rows} split-boundary probes).")
+    save_model_file(fused, config.FUSED_MODEL_PATH)
+    logging.info(f"Saved fused model to: {config.FUSED_MODEL_PATH}")
+    return True
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=config.LOGGING_LEVEL, format=config.LOGGING_FORMAT)
+    sys.exit(0 if prepare_fused_model() else 1)
@@ -0,0 +1,183 @@
+# prediction_module/native_model.py
+"""
+Native XGBoost inference: runs the model's Booster directly with inplace_predict
+on contiguous float32 data instead of going through the sklearn wrapper, and
+reads/writes models in XGBoost's own JSON/UBJ formats as well as pickle.
+
+Usage (from backend/):
+    python -m prediction_module.native_model --export ../model/xgboost_model.ubj
+    python -m prediction_module.native_model --benchmark
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+import joblib
+import numpy as np
+from scipy.special import softmax
+
+from . import config
+
+# Model file extensions loaded/saved with XGBoost's native serializer instead of pickle
+NATIVE_MODEL_EXTENSIONS = ('.json', '.ubj')
+
+
+class NativeXGBoostModel:
+    """
+    Exposes predict/predict_proba/classes_ like XGBClassifier, computed straight
+    from the Booster: no feature-name validation, no DataFrame handling and no
+    float64 copy. inplace_predict is thread-safe, so one instance can serve the
+    streaming scorer and the backend service at the same time.
+    """
+    def __init__(self, booster, classes=None, nthread=None):
+        self.booster = booster
+        self.objective = json.loads(booster.save_config())['learner']['objective']['name']
+        if classes is None:
+            num_class = int(json.loads(booster.save_config())['learner']['learner_model_param']['num_class'])
+            classes = np.arange(max(num_class, 2)) # Binary models report num_class 0
+        self.classes_ = np.asarray(classes)
+        if nthread is not None:
+            self.booster.set_param({'nthread': nthread})
+
+    def get_booster(self):
+        return self.booster
+
+    def predict_proba(self, X):
+        """Returns class probabilities, shape (rows, classes), matching XGBClassifier.predict_proba."""
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        if self.objective == 'multi:softmax':
+            # The booster outputs class indices for softmax; the sklearn wrapper applies softmax to the margins
+            return softmax(self.booster.inplace_predict(X, predict_type='margin'), axis=1)
+        probabilities = self.booster.inplace_predict(X)
+        if probabilities.ndim == 1: # binary:logistic -> [P(class 0), P(class 1)]
+            return np.vstack((1 - probabilities, probabilities)).T
+        return probabilities
+
+    def predict(self, X):
+        """Returns class labels (entries of classes_)."""
+        return self.classes_.take(np.argmax(self.predict_proba(X), axis=1))
+
+
+def as_native_model(model, nthread=None):
+    """
+    Wraps an XGBoost sklearn model in a NativeXGBoostModel.
+
+    Args:
+        model: Loaded model (any type).
+        nthread: Threads used by inplace_predict; None keeps XGBoost's default.
+
+    Returns:
+        The NativeXGBoostModel, or `model` unchanged if it is not an XGBoost sklearn model.
+    """
+    if isinstance(model, NativeXGBoostModel):
+        if nthread is not None:
+            model.booster.set_param({'nthread': nthread})
+        return model
+    if not hasattr(model, 'get_booster') or not hasattr(model, 'classes_'):
+        return model
+    return NativeXGBoostModel(model.get_booster(), model.classes_, nthread)
+
+
+def load_model_file(path):
+    """
+    Loads a model saved as pickle/joblib, as XGBoost JSON/UBJ (returned as a
+    NativeXGBoostModel) or as NumPy node arrays (.npz, returned as a TreeEnsemble).
+    """
+    if os.path.splitext(str(path))[1].lower() == '.npz':
+        from .tree_ensemble import TreeEnsemble
+        return TreeEnsemble.load(path)
+    if os.path.splitext(str(path))[1].lower() in NATIVE_MODEL_EXTENSIONS:
+        import xgboost
+        booster = xgboost.Booster()
+        booster.load_model(str(path))
+        classes = booster.attr('classes')
+        return NativeXGBoostModel(booster, json.loads(classes) if classes else None)
+    return joblib.load(path)
+
+
+def save_model_file(model, path):
+    """Saves a model as pickle/joblib, or as XGBoost JSON/UBJ when `path` has a .json/.ubj extension."""
+    if os.path.splitext(str(path))[1].lower() in NATIVE_MODEL_EXTENSIONS:
+        booster = model.get_booster().copy()
+        booster.set_attr(classes=json.dumps(np.asarray(model.classes_).tolist()))
+        booster.save_model(str(path))
+    else:
+        joblib.dump(model, path)
+
+
+def _time_rows_per_second(score, X, batch_size, min_seconds=0.5):
+    """Scores X in batches of batch_size until min_seconds have passed; returns rows/s."""
+    batches = [X[start:start + batch_size] for start in range(0, len(X), batch_size)]
+    score(batches[0]) # Warm-up
+    rows = 0
+    started = time.perf_counter()
+    while True:
+        for batch in batches:
+            score(batch)
+            rows += len(batch)
+            elapsed = time.perf_counter() - started
+            if elapsed >= min_seconds:
+                return rows / elapsed
+
+
+def run_benchmark(batch_sizes=(1, 64, 4096, 100000)):
+    """
+    Compares rows/s of the pickled sklearn model (fed float64 DataFrames) with the
+    native Booster path (contiguous float32) at several batch sizes.
+    """
+    import pandas as pd
+    from .loader import _load_model_scaler_from_disk, load_data
+    from .predictor import align_features
+    from .preprocessor import preprocess_data
+
+    model, scaler, expected_features = _load_model_scaler_from_disk(allow_fused=False)
+    if model is None:
+        return False
+    native = as_native_model(model, config.XGBOOST_NTHREAD)
+    if native is model:
+        print(f"ERROR: {type(model).__name__} is not an XGBoost sklearn model; nothing to compare.", file=sys.stderr)
+        return False
+
+    df = load_data()
+    df_processed, _, renamed_cols_map = preprocess_data(df, expected_features)
+    aligned = align_features(df_processed, expected_features, renamed_cols_map)
+    rows = np.asarray(scaler.transform(aligned), dtype=np.float32)
+    X = rows[np.random.default_rng(0).integers(0, len(rows), size=max(batch_sizes))]
+    X_frame = pd.DataFrame(X.astype(float), columns=expected_features)
+
+    print(f"{'batch':>8} {'pickle+sklearn rows/s':>22} {'native rows/s':>15} {'speedup':>8}")
+    for batch_size in batch_sizes:
+        sklearn_rate = _time_rows_per_second(model.predict_proba, X_frame, batch_size)
+        native_rate = _time_rows_per_second(native.predict_proba, X, batch_size)
+        print(f"{batch_size:>8} {sklearn_rate:>22,.0f} {native_rate:>15,.0f} {native_rate / sklearn_rate:>7.2f}x")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Native XGBoost model tools.")
+    parser.add_argument('--export', metavar='PATH',
+                        help="Save MODEL_PATH in XGBoost's native format (.json or .ubj) at PATH.")
+    parser.add_argument('--benchmark', action='store_true',
+                        help="Compare pickle+sklearn and native inference throughput.")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING, format=config.LOGGING_FORMAT)
+
+    if args.export:
+        if os.path.splitext(args.export)[1].lower() not in NATIVE_MODEL_EXTENSIONS:
+            print(f"ERROR: Export path must end in {' or '.join(NATIVE_MODEL_EXTENSIONS)}.", file=sys.stderr)
+            return 1
+        model = load_model_file(config.MODEL_PATH)
+        save_model_file(model, args.export)
+        print(f"Saved {config.MODEL_PATH} as {args.export}. Set MODEL_PATH to it in prediction_module/config.py.")
+    if args.benchmark:
+        return 0 if run_benchmark() else 1
+    if not (args.export or args.benchmark):
+        parser.print_help()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
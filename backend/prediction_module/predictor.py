@@ -2,6 +2,10 @@
 import pandas as pd
 import numpy as np
 import logging
+import threading
+from functools import lru_cache
+
+from . import config
 
 def align_features(df, expected_features):
     logging.info(f"Aligning DataFrame columns with {len(expected_features)} expected features...")
@@ -76,92 +80,125 @@ def make_predictions(df_aligned, model, scaler):
         return None, None # Indicate failure
 
 
-# --- THÊM renamed_cols_map LÀM THAM SỐ ---
-def align_features(df, expected_features, renamed_cols_map):
+# Rows copied per tile when aligning a batch (tile of ~80 float32 features stays within L2 cache)
+_ALIGN_TILE_ROWS = 4096
+
+
+class AlignmentPlan:
     """
-    Aligns DataFrame columns with the list of features expected by the model,
-    considering potential column name cleaning.
-    Adds missing columns with 0, ensures correct order.
+    Precomputed mapping from one input column layout to the model's feature order.
+    Built once per (input columns, expected_features, renamed_cols_map) signature;
+    aligning a batch then copies each source column straight into a reused float32
+    matrix (one per thread, grown to the largest batch seen), with no temporaries.
     """
-    logging.info(f"Aligning DataFrame columns with {len(expected_features)} expected features...")
-
-    # Tạo một map ngược: cleaned_name -> original_name (nếu cần tham chiếu ngược)
-    # Hoặc tạo map: original_expected_name -> current_cleaned_name
-    original_to_cleaned_map = {v: k for k, v in renamed_cols_map.items()} # Ngược lại map ban đầu
-
-    # Tìm tên cột hiện tại (đã được làm sạch) tương ứng với tên cột mong đợi (gốc)
-    current_feature_names_to_select = []
-    missing_original_features = []
-    available_cleaned_columns = set(df.columns.tolist())
-
-    for expected_col_original in expected_features:
-        # Tìm tên đã được làm sạch tương ứng trong map
-        # Giả sử renamed_cols_map là {original: cleaned}
-        cleaned_name = renamed_cols_map.get(expected_col_original)
-
-        # Nếu không tìm thấy trong map (có thể tên gốc không có ký tự đặc biệt)
-        # thì thử dùng chính tên gốc xem có trong cột hiện tại không
-        if cleaned_name is None:
-             # Trường hợp tên gốc và tên mong đợi giống nhau và không bị clean
-             if expected_col_original in available_cleaned_columns:
-                  cleaned_name = expected_col_original
-             # Trường hợp tên mong đợi gốc KHÔNG CÓ trong map đổi tên VÀ cũng không có trong cột hiện tại
-             # -> thực sự thiếu feature này từ nguồn
-             elif expected_col_original not in available_cleaned_columns:
-                 missing_original_features.append(expected_col_original)
-                 continue # Bỏ qua feature này
-
-        # Nếu tên đã clean được tìm thấy (từ map hoặc trực tiếp) VÀ nó có trong các cột hiện tại của df
-        if cleaned_name is not None and cleaned_name in available_cleaned_columns:
-            current_feature_names_to_select.append(cleaned_name)
-        # Nếu tên đã clean được tìm thấy nhưng lại không có trong df (lạ?) hoặc tên gốc bị thiếu
-        else:
-             missing_original_features.append(expected_col_original)
+    __slots__ = ('expected_features', 'positions', 'missing_features', '_local')
+
+    def __init__(self, columns, expected_features, renamed_cols_map):
+        self.expected_features = list(expected_features)
+        column_positions = {name: position for position, name in enumerate(columns)}
+        self.positions = [] # Input column position of each expected feature, -1 if missing
+        self.missing_features = []
+        for expected_col_original in self.expected_features:
+            # Column names were cleaned by the preprocessor: look up the cleaned name of the
+            # expected (original) feature name, or the name itself if it was never renamed
+            cleaned_name = renamed_cols_map.get(expected_col_original, expected_col_original)
+            position = column_positions.get(cleaned_name, -1)
+            if position < 0:
+                self.missing_features.append(expected_col_original)
+            self.positions.append(position)
+        self._local = threading.local() # Plans are cached process-wide; each scoring thread gets its own buffer
+
+    def apply(self, df, out=None):
+        """
+        Writes the aligned float32 feature matrix (rows of df, columns in expected order).
+
+        Args:
+            df: Input DataFrame with the column layout this plan was built for.
+            out: Optional float32 array of shape (len(df), number of features) to fill.
+                 By default the plan's buffer for this thread is used, so the returned
+                 matrix is only valid until the next apply() on the same thread.
+
+        Returns:
+            The filled matrix.
+        """
+        num_rows = len(df)
+        if out is None:
+            buffer = getattr(self._local, 'buffer', None)
+            if buffer is None or len(buffer) < num_rows:
+                buffer = self._local.buffer = np.empty((num_rows, len(self.positions)), dtype=np.float32)
+            out = buffer[:num_rows]
+        series = [values for _, values in df.items()] # Much cheaper per column than df.iloc[:, position]
+        columns = [None if position < 0 else series[position].to_numpy() for position in self.positions]
+        # Copy in row tiles so the strided column writes into the row-major matrix stay in cache
+        for start in range(0, num_rows, _ALIGN_TILE_ROWS):
+            tile = out[start:start + _ALIGN_TILE_ROWS]
+            for column, values in enumerate(columns):
+                tile[:, column] = 0 if values is None else values[start:start + _ALIGN_TILE_ROWS] # Cast to float32 while copying
+        return out
+
+
+def sanitize_features(X, feature_names):
+    """
+    Replaces Inf and NaN values in the aligned feature matrix with 0, in place,
+    in one vectorized pass.
 
+    Args:
+        X: float32 feature matrix (rows x features); modified in place.
+        feature_names: Column names of X, for logging.
 
-    if missing_original_features:
-        logging.warning(f"Missing {len(missing_original_features)} expected original features even after mapping: {missing_original_features}. Adding them with value 0.")
-        for original_col in missing_original_features:
-            # Cần quyết định đặt tên cột mới là gì, dùng tên gốc hay tên đã clean (nếu có)
-            # An toàn nhất là dùng tên gốc mong đợi, vì bước sau sẽ chọn theo expected_features
-            if original_col not in df.columns: # Chỉ thêm nếu chưa có
-                 df[original_col] = 0.0
+    Returns:
+        Dictionary {feature name: number of values replaced} for the affected columns.
+    """
+    nonfinite = ~np.isfinite(X)
+    counts = nonfinite.sum(axis=0)
+    affected = np.flatnonzero(counts)
+    if not len(affected):
+        logging.info("No Inf/NaN values in the aligned features.")
+        return {}
+    X[nonfinite] = 0
+    replaced = {feature_names[i]: int(counts[i]) for i in affected}
+    logging.warning(f"Replaced {int(counts.sum())} Inf/NaN values with 0 in {len(replaced)} features: {replaced}")
+    return replaced
 
-    # --- CHỌN CỘT THEO TÊN ĐÃ ĐƯỢC LÀM SẠCH tương ứng ---
-    # df_selection = df[current_feature_names_to_select] # Chọn các cột hiện có theo thứ tự mong muốn
 
-    # --- SAU KHI CHỌN, ĐỔI TÊN CỘT LẠI THÀNH TÊN GỐC MONG ĐỢI ---
-    # Tạo một map từ tên đã clean (trong current_feature_names_to_select) về tên gốc mong đợi
-    cleaned_to_original_for_selected = {
-         renamed_cols_map.get(orig, orig) : orig
-         for orig in expected_features
-         if renamed_cols_map.get(orig, orig) in current_feature_names_to_select
-    }
+@lru_cache(maxsize=32)
+def _get_alignment_plan(columns, expected_features, renamed_items):
+    plan = AlignmentPlan(columns, expected_features, dict(renamed_items))
+    if plan.missing_features:
+        logging.warning(f"Missing {len(plan.missing_features)} expected original features even after mapping: {plan.missing_features}. Adding them with value 0.")
+    logging.info(f"Built feature alignment plan for {len(columns)} input columns -> {len(expected_features)} features.")
+    return plan
 
-    try:
-         # Chọn các cột theo tên đã được làm sạch tìm thấy
-         df_selection = df[current_feature_names_to_select]
 
-         # Đổi tên cột của df_selection thành tên gốc mà model/scaler mong đợi
-         df_aligned = df_selection.rename(columns=cleaned_to_original_for_selected)
+def get_alignment_plan(df, expected_features, renamed_cols_map):
+    """Returns the cached AlignmentPlan for the column layout of df."""
+    return _get_alignment_plan(tuple(df.columns), tuple(expected_features), tuple(renamed_cols_map.items()))
 
-         # Bây giờ df_aligned có các cột với tên gốc, theo đúng thứ tự mong đợi.
-         # Kiểm tra lại lần cuối xem tất cả cột mong đợi có trong df_aligned không
-         final_missing = list(set(expected_features) - set(df_aligned.columns))
-         if final_missing:
-              logging.warning(f"After renaming, still missing expected features: {final_missing}. Adding with 0.")
-              for col in final_missing:
-                   df_aligned[col] = 0.0
 
-         # Đảm bảo thứ tự cột cuối cùng khớp với expected_features
-         df_aligned = df_aligned[expected_features].astype(float)
+def align_features(df, expected_features, renamed_cols_map):
+    """
+    Aligns DataFrame columns with the list of features expected by the model,
+    considering potential column name cleaning.
+    Missing features are filled with 0, columns are put in the expected order
+    and Inf/NaN values are replaced with 0 (sanitize_features).
 
-         logging.info(f"DataFrame aligned successfully. Shape: {df_aligned.shape}")
-         return df_aligned
+    Args:
+        df: Preprocessed DataFrame (cleaned column names).
+        expected_features: Original feature names expected by the model, in order.
+        renamed_cols_map: {original_name: cleaned_name} from preprocessor.clean_column_names.
 
-    except KeyError as e:
-        logging.error(f"KeyError during feature alignment/renaming: {e}. Problematic key likely in current_feature_names_to_select or cleaned_to_original_for_selected.", exc_info=True)
-        return None
+    Returns:
+        float32 DataFrame with the expected (original) feature names as columns, or None on error.
+        Its values live in the alignment plan's reused buffer: copy them to keep them
+        past the next align_features call on the same thread.
+    """
+    try:
+        plan = get_alignment_plan(df, expected_features, renamed_cols_map)
+        aligned = plan.apply(df)
+        sanitize_features(aligned, plan.expected_features)
+        df_aligned = pd.DataFrame(aligned, columns=plan.expected_features, index=df.index, copy=False)
+        logging.info(f"DataFrame aligned successfully. Shape: {df_aligned.shape}")
+        return df_aligned
     except ValueError as e:
          logging.error(f"ValueError during feature alignment (e.g., could not convert to float): {e}")
          return None
@@ -176,7 +213,7 @@ def make_predictions(df_aligned, model, scaler):
     Args:
         df_aligned: DataFrame with features aligned and ordered correctly (TÊN CỘT LÀ TÊN GỐC).
         model: Loaded prediction model.
-        scaler: Loaded scaler.
+        scaler: Loaded scaler, or None for a fused model that takes unscaled features.
     Returns:
         Tuple: (predictions_array, probabilities_array or None)
     """
@@ -184,13 +221,15 @@ def make_predictions(df_aligned, model, scaler):
         logging.warning("Prediction skipped: Aligned DataFrame is None or empty.")
         return np.array([]), None # Return empty array and None
 
+    if scaler is None:
+        X_scaled = df_aligned.to_numpy(copy=False) # Fused model: scaling is folded into the split thresholds
+        logging.info("Skipping scaling: the model takes unscaled features.")
+        return _predict(model, X_scaled)
+
     logging.info(f"Scaling data ({df_aligned.shape[0]} rows, {df_aligned.shape[1]} features)...")
     try:
         # Dữ liệu đầu vào cho scaler phải có tên cột khớp với scaler.feature_names_in_
-        if df_aligned.isnull().values.any() or np.isinf(df_aligned.values).any():
-             logging.error("NaN or Inf values detected in data just before scaling. Check preprocessing steps.")
-             return None, None # Indicate failure
-
+        # (align_features already replaced Inf/NaN, so no rescan here)
         X_scaled = scaler.transform(df_aligned) # Scaler hoạt động với tên cột gốc
         logging.info("Data scaling successful.")
     except ValueError as e:
@@ -205,8 +244,24 @@ def make_predictions(df_aligned, model, scaler):
         logging.error(f"Unexpected error during scaling: {e}", exc_info=True)
         return None, None # Indicate failure
 
+    return _predict(model, X_scaled)
+
+
+def _predict(model, X_scaled):
+    """
+    Runs the model on the (scaled) feature matrix. With SINGLE_PASS_INFERENCE the
+    ensemble is evaluated once: labels are the argmax of predict_proba mapped
+    through model.classes_, instead of a second traversal by model.predict.
+    """
     logging.info("Making predictions...")
     try:
+        classes = getattr(model, "classes_", None)
+        if config.SINGLE_PASS_INFERENCE and hasattr(model, "predict_proba") and classes is not None:
+            probabilities = model.predict_proba(X_scaled)
+            predictions = np.asarray(classes).take(np.argmax(probabilities, axis=1))
+            logging.info("Generated prediction probabilities; labels derived from them (single pass).")
+            logging.info("Predictions completed.")
+            return predictions, probabilities
         predictions = model.predict(X_scaled)
         probabilities = None
         if hasattr(model, "predict_proba"):
@@ -218,4 +273,4 @@ def make_predictions(df_aligned, model, scaler):
         return predictions, probabilities
     except Exception as e:
         logging.error(f"Error during model prediction: {e}", exc_info=True)
-        return None, None
\ No newline at end of file
+        return None, None
@@ -3,35 +3,125 @@ import pandas as pd
 import numpy as np
 import logging
 import re
+import time
+from functools import lru_cache
 
-def clean_column_names(df):
-    """Cleans DataFrame column names: strips whitespace, replaces special chars with underscores."""
-    original_columns = df.columns.tolist()
-    df.columns = df.columns.str.strip()
+_NON_ALNUM = re.compile(r'[^A-Za-z0-9_]+')
+
+@lru_cache(maxsize=32)
+def _cleaned_names(original_columns):
+    """Cleaned names for one input header; cached because every batch of a capture has the same header."""
+    columns = pd.Index(original_columns).str.strip()
     # Replace sequences of non-alphanumeric chars (excluding _) with a single underscore
-    df.columns = df.columns.map(lambda x: re.sub(r'[^A-Za-z0-9_]+', '_', x))
+    columns = columns.map(lambda x: _NON_ALNUM.sub('_', x))
     # Optional: Remove leading/trailing underscores that might result
-    df.columns = df.columns.map(lambda x: x.strip('_'))
+    columns = columns.map(lambda x: x.strip('_'))
     # Optional: Handle potential duplicate names after cleaning (e.g., append count)
-    if df.columns.duplicated().any():
-        logging.warning(f"Duplicate column names found after cleaning: {df.columns[df.columns.duplicated()].tolist()}. Consider renaming.")
+    if columns.duplicated().any():
+        logging.warning(f"Duplicate column names found after cleaning: {columns[columns.duplicated()].tolist()}. Consider renaming.")
         # Basic handling: append suffix - could be improved
-        df.columns = pd.io.parsers.base_parser.ParserBase({'names': df.columns})._maybe_dedup_names(df.columns)
+        columns = pd.io.parsers.base_parser.ParserBase({'names': columns})._maybe_dedup_names(columns)
+    return tuple(columns)
 
-    renamed_cols_map = dict(zip(original_columns, df.columns))
+def clean_column_names(df):
+    """Cleans DataFrame column names: strips whitespace, replaces special chars with underscores."""
+    original_columns = tuple(df.columns)
+    cleaned_columns = _cleaned_names(original_columns)
+    df.columns = cleaned_columns
+    renamed_cols_map = dict(zip(original_columns, cleaned_columns))
     logging.info("Cleaned column names.")
     # logging.debug(f"Column name mapping: {renamed_cols_map}") # Optional: Log the mapping
     return df, renamed_cols_map
 
+# Formats tried on a sample of the timestamp column (the capture module writes the first one)
+TIMESTAMP_FORMATS = [
+    '%Y-%m-%d %H:%M:%S',        # Format from original test.py / capture module
+    '%d/%m/%Y %I:%M:%S %p',    # Common CICFlowMeter format
+    '%Y-%m-%d %H:%M:%S.%f',   # Format with microseconds
+    '%m/%d/%Y %H:%M',         # Another possible format
+]
+TIMESTAMP_SAMPLE_SIZE = 256 # Values used to detect the format before parsing the whole column
+EPOCH_COLUMN = 'Timestamp Epoch' # Numeric seconds written by the capture module next to 'Timestamp'
+
+# Detected timestamp format per (input header, timestamp column); None = needs inference
+_timestamp_formats = {}
+
+
+def detect_timestamp_format(values, formats=TIMESTAMP_FORMATS):
+    """Returns the first of `formats` that parses every sampled value, or None."""
+    sample = values.head(TIMESTAMP_SAMPLE_SIZE).dropna().astype(str)
+    for fmt in formats:
+        try:
+            pd.to_datetime(sample, format=fmt, errors='raise')
+            return fmt
+        except (ValueError, TypeError):
+            logging.debug(f"Timestamp format '{fmt}' did not match.")
+    return None
+
+
+def _utc_offsets(epoch_seconds):
+    """
+    Returns the local time zone's UTC offset (seconds) at each epoch second.
+    Offsets only change on quarter-hour boundaries, so time.localtime is called
+    once per distinct 15-minute bucket. NaN inputs get an arbitrary offset.
+    """
+    buckets, bucket_index = np.unique(np.floor(np.nan_to_num(epoch_seconds) / 900), return_inverse=True)
+    offsets = np.array([time.localtime(bucket * 900).tm_gmtoff for bucket in buckets], dtype=np.float64)
+    return offsets[bucket_index.reshape(-1)]
+
+
+def _epoch_to_local_datetime(epoch_seconds):
+    """
+    Converts epoch seconds to naive local datetimes, matching the capture module's
+    'Timestamp' strings (time.localtime).
+    """
+    epoch_seconds = np.asarray(epoch_seconds, dtype=np.float64)
+    local_seconds = epoch_seconds + _utc_offsets(epoch_seconds)
+    return pd.Series(pd.to_datetime(np.round(local_seconds * 1e6).astype(np.int64), unit='us'))
+
+
+def local_datetime_to_epoch(timestamps):
+    """
+    Converts naive local datetimes (like the capture module's 'Timestamp' strings)
+    to epoch seconds, the inverse of _epoch_to_local_datetime. The offset is looked
+    up at the UTC instant rather than at the local time read as UTC, so times
+    within an offset of a DST change convert correctly; a repeated local hour
+    resolves to its second occurrence.
+
+    Args:
+        timestamps: datetime64 Series (naive local time, or time zone aware).
+
+    Returns:
+        float64 numpy array of epoch seconds, NaN for NaT.
+    """
+    aware = timestamps.dt.tz is not None
+    if aware:
+        timestamps = timestamps.dt.tz_convert(None) # Naive UTC
+    seconds = timestamps.to_numpy(dtype='datetime64[ns]').astype(np.int64) / 1e9
+    seconds[timestamps.isna().to_numpy()] = np.nan
+    if aware:
+        return seconds
+    first_guess = seconds - _utc_offsets(seconds)
+    return seconds - _utc_offsets(first_guess)
+
+
 def convert_timestamp_col(df, renamed_cols_map):
     """
     Converts the timestamp column to datetime objects.
-    Tries multiple formats and falls back to inference.
+    Uses the capture module's numeric epoch column when present; otherwise
+    detects the format on a sample (cached per input header) and parses once,
+    falling back to inference.
     """
     # Try to find the timestamp column using original and cleaned names
     timestamp_col_original = 'Timestamp'
     timestamp_col = renamed_cols_map.get(timestamp_col_original, timestamp_col_original)
 
+    epoch_col = renamed_cols_map.get(EPOCH_COLUMN, EPOCH_COLUMN)
+    if epoch_col in df.columns and pd.api.types.is_numeric_dtype(df[epoch_col]) and df[epoch_col].notna().all():
+        df[timestamp_col] = _epoch_to_local_datetime(df[epoch_col]).set_axis(df.index)
+        logging.info(f"Converted timestamp from numeric column '{epoch_col}' (no string parsing).")
+        return df, timestamp_col
+
     if timestamp_col not in df.columns:
         possible_ts_cols = [col for col in df.columns if 'timestamp' in col.lower()]
         if possible_ts_cols:
@@ -46,80 +136,37 @@ def convert_timestamp_col(df, renamed_cols_map):
         logging.info("Timestamp column already in datetime format.")
         return df, timestamp_col
 
-    # Try specific formats first (adjust based on your capture output)
-    formats_to_try = [
-        '%Y-%m-%d %H:%M:%S',        # Format from original test.py
-        '%d/%m/%Y %I:%M:%S %p',    # Common CICFlowMeter format
-        '%Y-%m-%d %H:%M:%S.%f',   # Format with microseconds
-        '%m/%d/%Y %H:%M',         # Another possible format
-    ]
-
-    original_dtype = df[timestamp_col].dtype
-    converted = False
-    for fmt in formats_to_try:
+    cache_key = (tuple(df.columns), timestamp_col)
+    fmt = _timestamp_formats.get(cache_key)
+    if fmt is None or detect_timestamp_format(df[timestamp_col], [fmt]) is None:
+        # Not detected yet, or another file with the same header uses a different format
+        fmt = detect_timestamp_format(df[timestamp_col])
+    if fmt is not None:
+        _timestamp_formats[cache_key] = fmt
         try:
             df[timestamp_col] = pd.to_datetime(df[timestamp_col], format=fmt, errors='raise')
             logging.info(f"Converted timestamp using format: {fmt}")
-            converted = True
-            break
+            return df, timestamp_col
         except (ValueError, TypeError):
-            logging.debug(f"Timestamp format '{fmt}' did not match.")
-            # Reset column to original if conversion failed partially (unlikely with errors='raise')
-            # df[timestamp_col] = df[timestamp_col].astype(original_dtype) # Careful with this
-
-    if not converted:
-        logging.warning("Specific timestamp formats failed. Attempting automatic inference (infer_datetime_format=True)...")
-        try:
-            # Ensure the column is string type before inferring if it's object type
-            if df[timestamp_col].dtype == 'object':
-                 df[timestamp_col] = df[timestamp_col].astype(str)
-
-            df[timestamp_col] = pd.to_datetime(df[timestamp_col], infer_datetime_format=True, errors='coerce')
-            if df[timestamp_col].isnull().any():
-                logging.error(f"Timestamp conversion resulted in NaT values after inference. Check data in column '{timestamp_col}'.")
-                # Consider logging problematic rows: df[df[timestamp_col].isnull()]
-                return df, None # Indicate failure
-            logging.info("Timestamp conversion successful using inference.")
-            converted = True
-        except Exception as e_infer:
-            logging.error(f"Fatal error during timestamp inference for column '{timestamp_col}': {e_infer}", exc_info=True)
+            logging.warning(f"Timestamp format '{fmt}' matched the sample but not the whole column.")
+            del _timestamp_formats[cache_key]
+
+    logging.warning("Specific timestamp formats failed. Attempting automatic inference...")
+    try:
+        # Ensure the column is string type before inferring if it's object type
+        values = df[timestamp_col].astype(str) if df[timestamp_col].dtype == 'object' else df[timestamp_col]
+        df[timestamp_col] = pd.to_datetime(values, errors='coerce') # Format inferred from the first value
+        if df[timestamp_col].isnull().any():
+            logging.error(f"Timestamp conversion resulted in NaT values after inference. Check data in column '{timestamp_col}'.")
+            # Consider logging problematic rows: df[df[timestamp_col].isnull()]
             return df, None # Indicate failure
-
-    if not converted:
-         logging.error(f"Could not convert timestamp column '{timestamp_col}' to datetime.")
-         return df, None
+        logging.info("Timestamp conversion successful using inference.")
+    except Exception as e_infer:
+        logging.error(f"Fatal error during timestamp inference for column '{timestamp_col}': {e_infer}", exc_info=True)
+        return df, None # Indicate failure
 
     return df, timestamp_col # Return df and the name of the converted column
 
-def handle_missing_values(df):
-    """Handles NaN and Infinity values in numeric columns."""
-    logging.info("Handling Infinity and NaN values...")
-    numeric_cols = df.select_dtypes(include=np.number).columns.tolist()
-
-    inf_handled_cols = []
-    for col in numeric_cols:
-        if np.isinf(df[col]).any():
-            inf_count = np.isinf(df[col]).sum()
-            logging.debug(f"  Replacing {inf_count} Inf values with NaN in column '{col}'.")
-            df[col] = df[col].replace([np.inf, -np.inf], np.nan)
-            inf_handled_cols.append(col)
-
-    if inf_handled_cols:
-         logging.info(f"Replaced Inf values in columns: {inf_handled_cols}")
-
-    # Fill NaN values - Strategy: fill with 0 for now.
-    # Consider more sophisticated strategies (mean, median, model-based) if appropriate.
-    nan_counts = df[numeric_cols].isnull().sum()
-    cols_with_nan = nan_counts[nan_counts > 0]
-    if not cols_with_nan.empty:
-        logging.warning(f"Found NaN values in numeric columns. Filling with 0: \n{cols_with_nan}")
-        df[numeric_cols] = df[numeric_cols].fillna(0)
-        logging.info("Filled NaN values in numeric columns with 0.")
-    else:
-        logging.info("No NaN values found in numeric columns after Inf handling.")
-
-    return df
-
 def ensure_numeric_features(df, feature_list):
     """Ensures all features expected by the model are numeric, converting if necessary."""
     logging.info("Ensuring required features are numeric...")
@@ -153,18 +200,22 @@ def ensure_numeric_features(df, feature_list):
     return df
 
 def preprocess_data(df, expected_features):
-    """Runs the standard preprocessing pipeline."""
+    """
+    Runs the standard preprocessing pipeline. df is not modified; the returned
+    frame shares its unchanged columns with df.
+    """
     if df is None or df.empty:
         logging.warning("Preprocessing skipped: DataFrame is None or empty.")
         return df, None, None
 
-    df_processed, renamed_cols_map = clean_column_names(df.copy()) # Work on a copy
+    # Shallow copy: renaming and the column replacements below never write into df's arrays.
+    # Inf/NaN are replaced later, in one pass over the aligned matrix (predictor.sanitize_features).
+    df_processed, renamed_cols_map = clean_column_names(df.copy(deep=False))
     df_processed, timestamp_col_name = convert_timestamp_col(df_processed, renamed_cols_map)
     if timestamp_col_name is None:
          logging.error("Preprocessing failed due to timestamp conversion issues.")
          return None, None, None # Indicate failure
 
-    df_processed = handle_missing_values(df_processed)
     df_processed = ensure_numeric_features(df_processed, expected_features)
     if df_processed is None:
          logging.error("Preprocessing failed due to numeric conversion issues.")
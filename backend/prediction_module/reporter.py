@@ -1,4 +1,5 @@
 # prediction_module/reporter.py
+import json
 import pandas as pd
 import numpy as np
 import logging
@@ -8,11 +9,20 @@ from . import config
 # from dotenv import load_dotenv # Not needed here
 from .send_telegram_messege import process_attack_detection
 from .send_email_notification import notify_by_email_on_prediction_completion # <<< MODIFIED IMPORT
+from .alert_suppression import AlertSuppressor, suppress_alerts
+from .results_store import ScanRecorder
+
+def suspicious_mask(predictions):
+    """Returns a boolean Series, True where the prediction is not a BENIGN_LABELS label (case-insensitive)."""
+    benign_labels_lower = {str(label).lower() for label in config.BENIGN_LABELS}
+    # Lowercase each distinct label once instead of every row
+    suspicious_labels = [label for label in predictions.unique() if str(label).lower() not in benign_labels_lower]
+    return predictions.isin(suspicious_labels)
 
 def analyze_and_save_results(df_original_with_preds, predictions, probabilities):
     """
     Analyzes prediction results, identifies suspicious flows, prints summaries,
-    saves results to CSV files, and sends notifications.
+    saves results to the results store and CSV files, and sends notifications.
 
     Args:
         df_original_with_preds: Original DataFrame with 'Prediction' column added.
@@ -39,23 +49,17 @@ def analyze_and_save_results(df_original_with_preds, predictions, probabilities)
     print(prediction_counts) # Print to console for visibility
 
     # --- Identify Suspicious Flows ---
-    # Use lower case for comparison to make it case-insensitive
-    benign_labels_lower = [str(label).lower() for label in config.BENIGN_LABELS]
-    df_original_with_preds['Prediction_Lower'] = df_original_with_preds['Prediction'].astype(str).str.lower()
-
-    suspicious_condition = ~df_original_with_preds['Prediction_Lower'].isin(benign_labels_lower)
+    suspicious_condition = suspicious_mask(df_original_with_preds['Prediction'])
     suspicious_flows = df_original_with_preds[suspicious_condition].copy() # Create a copy
 
-    # Drop the temporary lower case column
-    df_original_with_preds.drop(columns=['Prediction_Lower'], inplace=True)
-    if 'Prediction_Lower' in suspicious_flows.columns:
-        suspicious_flows.drop(columns=['Prediction_Lower'], inplace=True)
-
-
     num_suspicious = len(suspicious_flows)
     num_total = len(df_original_with_preds)
     logging.info(f"\nIdentified {num_suspicious} suspicious flows out of {num_total} total flows.")
 
+    # --- Append Every Flow to the Results Store (one bulk transaction) ---
+    recorder = ScanRecorder()
+    recorder.add(df_original_with_preds, suspicious_condition)
+
     # Define display_cols for console/telegram and ensure they exist
     console_display_cols = ['Timestamp', 'Flow ID', 'Src IP', 'Src Port', 'Dst IP', 'Dst Port', 'Protocol', 'Prediction']
     if 'Prediction_Probability' in suspicious_flows.columns:
@@ -90,30 +94,249 @@ def analyze_and_save_results(df_original_with_preds, predictions, probabilities)
     #         if not sample_for_console_and_telegram.empty:
     #              process_attack_detection(sample_for_console_and_telegram)
     
+    # --- Aggregate Suspicious Flows into Incidents (one row per Src IP, Dst IP, Dst Port, Prediction) ---
+    suspicious_output = suspicious_flows
+    if config.ALERT_SUPPRESSION and num_suspicious > 0:
+        run_incidents = AlertSuppressor(keep_rows=True)
+        run_incidents.observe(suspicious_flows)
+        suspicious_output = run_incidents.incidents_frame()
+        logging.info(f"{num_suspicious} suspicious flows form {len(suspicious_output)} incidents.")
+
     # --- Send Email Notification ---
-    # The email function receives the full original DF with predictions, and the suspicious flows DF.
+    # The email function receives the full original DF with predictions, and the suspicious flows (or incidents) DF.
     # It will handle formatting and content based on whether suspicious_flows is empty.
     # The suspicious_flows DataFrame passed here should contain all its original columns,
     # as the email function might want to select different columns or show all of them in an attachment.
-    notify_by_email_on_prediction_completion(df_original_with_preds, suspicious_flows)
+    notify_by_email_on_prediction_completion(df_original_with_preds, suspicious_output, num_suspicious=num_suspicious)
+
+    # --- Save UI Summary (one pass over the in-memory results; the UI loads it instead of the CSVs) ---
+    summary = ResultSummary()
+    summary.add(df_original_with_preds, suspicious_condition)
+    recorder.finish(summary.write(suspicious_output))
+
+    # --- Queue Telegram Alerts (sent in the background as per-source digests; does not block) ---
+    if config.TELEGRAM_REPORT_ALERTS and num_suspicious > 0:
+        process_attack_detection(suppress_alerts(suspicious_flows))
 
 
     # --- Save Results ---
-    try:
-        logging.info(f"Saving all predictions to: {config.PREDICTIONS_OUTPUT_CSV_PATH}")
-        os.makedirs(os.path.dirname(config.PREDICTIONS_OUTPUT_CSV_PATH), exist_ok=True)
-        df_original_with_preds.to_csv(config.PREDICTIONS_OUTPUT_CSV_PATH, index=False, encoding='utf-8')
-        logging.info("Successfully saved all predictions.")
-    except Exception as e:
-        logging.error(f"Error saving all predictions CSV: {e}", exc_info=True)
+    if config.PREDICTIONS_CSV_OUTPUT or not recorder.enabled: # Otherwise every flow is in the results store
+        try:
+            logging.info(f"Saving all predictions to: {config.PREDICTIONS_OUTPUT_CSV_PATH}")
+            os.makedirs(os.path.dirname(config.PREDICTIONS_OUTPUT_CSV_PATH), exist_ok=True)
+            df_original_with_preds.to_csv(config.PREDICTIONS_OUTPUT_CSV_PATH, index=False, encoding='utf-8')
+            logging.info("Successfully saved all predictions.")
+        except Exception as e:
+            logging.error(f"Error saving all predictions CSV: {e}", exc_info=True)
 
     if num_suspicious > 0:
         try:
             logging.info(f"Saving suspicious flows to: {config.SUSPICIOUS_OUTPUT_CSV_PATH}")
             os.makedirs(os.path.dirname(config.SUSPICIOUS_OUTPUT_CSV_PATH), exist_ok=True)
-            suspicious_flows.to_csv(config.SUSPICIOUS_OUTPUT_CSV_PATH, index=False, encoding='utf-8')
+            suspicious_output.to_csv(config.SUSPICIOUS_OUTPUT_CSV_PATH, index=False, encoding='utf-8')
             logging.info("Successfully saved suspicious flows.")
         except Exception as e:
             logging.error(f"Error saving suspicious flows CSV: {e}", exc_info=True)
     else:
-        logging.info("No suspicious flows to save (related CSV not created or is empty).")
\ No newline at end of file
+        logging.info("No suspicious flows to save (related CSV not created or is empty).")
+
+PROTOCOL_NAMES = {6: 'TCP', 17: 'UDP', 1: 'ICMP'}
+# Flow columns whose sum is the flow's volume in bytes
+VOLUME_COLUMNS = ('TotLen Fwd Pkts', 'TotLen Bwd Pkts')
+# Columns of the alert rows embedded in the summary JSON
+SUMMARY_ALERT_COLUMNS = ['Timestamp', 'Flow ID', 'Src IP', 'Src Port', 'Dst IP', 'Dst Port', 'Protocol', 'Prediction',
+                         'Prediction_Probability', 'Hit Count', 'First Seen', 'Last Seen']
+
+
+class ResultSummary:
+    """
+    Everything the UI shows about a scan (traffic volume by class, label and
+    protocol counts, top source/destination IPs, threat map figures, a sample
+    of alerts), accumulated from the in-memory results chunk by chunk and
+    written as one JSON file (SUMMARY_JSON_PATH).
+    """
+    def __init__(self):
+        self.num_total = 0
+        self.num_suspicious = 0
+        self.critical_alerts = 0
+        self.volume_bytes = {'normal': 0.0, 'suspicious': 0.0}
+        self.prediction_counts = pd.Series(dtype='int64') # All flows
+        self.type_counts = pd.Series(dtype='int64') # Suspicious flows only, like the three below
+        self.src_ip_counts = pd.Series(dtype='int64')
+        self.dst_ip_counts = pd.Series(dtype='int64')
+        self.protocol_counts = pd.Series(dtype='int64')
+
+    @staticmethod
+    def _add_counts(total, values):
+        counts = values.value_counts(sort=False)
+        counts = counts[counts > 0] # Categorical columns (IPs) also count every unobserved category, with 0
+        counts.index = counts.index.astype(str)
+        return total.add(counts, fill_value=0)
+
+    def add(self, df_with_preds, suspicious_condition):
+        """
+        Adds scored flows.
+
+        Args:
+            df_with_preds: Flows with the 'Prediction' (and optional 'Prediction_Probability') column.
+            suspicious_condition: Boolean Series, True for the suspicious rows.
+        """
+        self.num_total += len(df_with_preds)
+        self.prediction_counts = self._add_counts(self.prediction_counts, df_with_preds['Prediction'])
+        if all(column in df_with_preds.columns for column in VOLUME_COLUMNS):
+            volume = sum(pd.to_numeric(df_with_preds[column], errors='coerce').fillna(0).to_numpy(dtype=np.float64)
+                         for column in VOLUME_COLUMNS)
+            suspicious_volume = float(volume[suspicious_condition.to_numpy()].sum())
+            self.volume_bytes['suspicious'] += suspicious_volume
+            self.volume_bytes['normal'] += float(volume.sum()) - suspicious_volume
+
+        suspicious = df_with_preds[suspicious_condition]
+        if suspicious.empty:
+            return
+        self.num_suspicious += len(suspicious)
+        self.type_counts = self._add_counts(self.type_counts, suspicious['Prediction'])
+        for attribute, column in (('src_ip_counts', 'Src IP'), ('dst_ip_counts', 'Dst IP')):
+            if column in suspicious.columns:
+                setattr(self, attribute, self._add_counts(getattr(self, attribute), suspicious[column]))
+        if 'Protocol' in suspicious.columns:
+            protocols = pd.to_numeric(suspicious['Protocol'], errors='coerce')
+            names = protocols.map(PROTOCOL_NAMES).fillna(suspicious['Protocol'].astype(str))
+            self.protocol_counts = self._add_counts(self.protocol_counts, names)
+        critical = suspicious['Prediction'].astype(str).str.lower().str.contains('critical', regex=False)
+        if 'Prediction_Probability' in suspicious.columns:
+            critical |= suspicious['Prediction_Probability'].to_numpy() > 0.9
+        self.critical_alerts += int(critical.sum())
+
+    @staticmethod
+    def _as_dict(counts, top_n=None):
+        counts = counts.astype('int64').sort_values(ascending=False, kind='stable')
+        return {str(key): int(value) for key, value in (counts.head(top_n) if top_n else counts).items()}
+
+    def to_dict(self, alert_rows=None):
+        """Returns the summary as a JSON-serializable dict; alert_rows is a DataFrame of alerts to embed."""
+        src_ips = self.src_ip_counts.index
+        alerts = []
+        if alert_rows is not None and not alert_rows.empty:
+            columns = [column for column in SUMMARY_ALERT_COLUMNS if column in alert_rows.columns]
+            alerts = json.loads(alert_rows[columns].head(config.SUMMARY_MAX_ALERTS).to_json(orient='records', date_format='iso'))
+        to_mb = lambda volume: round(volume / (1024 * 1024), 2)
+        return {
+            'generated': pd.Timestamp.now().isoformat(timespec='seconds'),
+            'totalFlows': self.num_total,
+            'totalThreats': self.num_suspicious,
+            'criticalAlerts': self.critical_alerts,
+            'predictionCounts': self._as_dict(self.prediction_counts),
+            # The suspicious CSV holds exactly the non-benign flows, so 'malicious' equals 'suspicious'
+            'trafficAnalysis': {'normal': to_mb(self.volume_bytes['normal']),
+                                'suspicious': to_mb(self.volume_bytes['suspicious']),
+                                'malicious': to_mb(self.volume_bytes['suspicious'])},
+            'globalThreatMap': {'activeAttacks': len(src_ips),
+                                'countries': len(set(ip.split('.')[0] if '.' in ip else 'Unknown' for ip in src_ips)),
+                                'totalToday': self.num_suspicious},
+            'aptTypeCounts': self._as_dict(self.type_counts),
+            'topSourceAPTIPs': self._as_dict(self.src_ip_counts, config.SUMMARY_TOP_N),
+            'topDestAPTIPs': self._as_dict(self.dst_ip_counts, config.SUMMARY_TOP_N),
+            'aptProtocolCounts': self._as_dict(self.protocol_counts),
+            'alerts': alerts,
+        }
+
+    def write(self, alert_rows=None, path=None):
+        """Writes the summary JSON (atomically, so the UI never reads a partial file) and returns the summary dict."""
+        path = path or config.SUMMARY_JSON_PATH
+        summary = self.to_dict(alert_rows)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = path + '.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(summary, f, ensure_ascii=False)
+            os.replace(temp_path, path)
+            logging.info(f"Saved results summary to: {path}")
+        except Exception as e:
+            logging.error(f"Error saving results summary JSON: {e}", exc_info=True)
+        return summary
+
+
+class ChunkedResultWriter:
+    """
+    Chunked counterpart of analyze_and_save_results for files scored in pieces:
+    each chunk's rows are appended to the results store (or the prediction CSV)
+    as soon as they are scored, and only the prediction counts and a small sample of suspicious
+    flows (for the email) are kept in memory. With ALERT_SUPPRESSION the
+    suspicious flows are aggregated into incidents instead, and the incident
+    CSV is written by finish().
+    """
+    def __init__(self):
+        self.email_sample_size = getattr(config, 'EMAIL_ALERT_SAMPLE_SIZE', 5)
+        self.prediction_counts = pd.Series(dtype='int64')
+        self.suspicious_sample = None
+        self.incidents = AlertSuppressor(keep_rows=True) if config.ALERT_SUPPRESSION else None
+        self.summary = ResultSummary()
+        self.recorder = ScanRecorder()
+        self.write_predictions_csv = config.PREDICTIONS_CSV_OUTPUT or not self.recorder.enabled
+        self.alert_sample_size = max(self.email_sample_size, config.SUMMARY_MAX_ALERTS)
+        self.num_total = 0
+        self.num_suspicious = 0
+        self.wrote_predictions = False
+        self.wrote_suspicious = False
+
+    def add_chunk(self, df_chunk_with_preds, probabilities):
+        """
+        Appends one scored chunk to the result files.
+
+        Args:
+            df_chunk_with_preds: Chunk of original flows with the 'Prediction' column added.
+            probabilities: Numpy array of probabilities for the chunk (or None).
+        """
+        if probabilities is not None and len(probabilities) == len(df_chunk_with_preds):
+            df_chunk_with_preds['Prediction_Probability'] = np.max(probabilities, axis=1)
+        self.prediction_counts = self.prediction_counts.add(df_chunk_with_preds['Prediction'].value_counts(), fill_value=0)
+        self.num_total += len(df_chunk_with_preds)
+
+        suspicious_condition = suspicious_mask(df_chunk_with_preds['Prediction'])
+        suspicious_flows = df_chunk_with_preds[suspicious_condition]
+        self.num_suspicious += len(suspicious_flows)
+        self.summary.add(df_chunk_with_preds, suspicious_condition)
+
+        self.recorder.add(df_chunk_with_preds, suspicious_condition)
+        if self.write_predictions_csv:
+            self.wrote_predictions = self._append(df_chunk_with_preds, config.PREDICTIONS_OUTPUT_CSV_PATH, self.wrote_predictions)
+        if len(suspicious_flows):
+            if self.incidents is not None:
+                self.incidents.observe(suspicious_flows)
+            else:
+                self.wrote_suspicious = self._append(suspicious_flows, config.SUSPICIOUS_OUTPUT_CSV_PATH, self.wrote_suspicious)
+            if config.TELEGRAM_REPORT_ALERTS:
+                process_attack_detection(suppress_alerts(suspicious_flows))
+            if self.suspicious_sample is None or len(self.suspicious_sample) < self.alert_sample_size:
+                self.suspicious_sample = pd.concat([self.suspicious_sample, suspicious_flows.head(self.alert_sample_size)]
+                                                   ).head(self.alert_sample_size)
+
+    @staticmethod
+    def _append(df, path, file_started):
+        """Writes df to path (with header) on the first call, appends on later ones."""
+        if not file_started:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        df.to_csv(path, mode='a' if file_started else 'w', header=not file_started, index=False, encoding='utf-8')
+        return True
+
+    def finish(self):
+        """Prints the summary and sends the email notification once every chunk was added."""
+        logging.info("\n--- Analyzing Prediction Results ---")
+        logging.info("Prediction Counts:")
+        print(self.prediction_counts.astype('int64').sort_values(ascending=False).rename('count'))
+        logging.info(f"\nIdentified {self.num_suspicious} suspicious flows out of {self.num_total} total flows.")
+        if self.wrote_predictions:
+            logging.info(f"Saved all predictions to: {config.PREDICTIONS_OUTPUT_CSV_PATH}")
+        if self.incidents is not None and self.num_suspicious:
+            incidents = self.incidents.incidents_frame()
+            logging.info(f"{self.num_suspicious} suspicious flows form {len(incidents)} incidents.")
+            self.wrote_suspicious = self._append(incidents, config.SUSPICIOUS_OUTPUT_CSV_PATH, False)
+            self.suspicious_sample = incidents.head(self.alert_sample_size)
+        if self.wrote_suspicious:
+            logging.info(f"Saved suspicious flows to: {config.SUSPICIOUS_OUTPUT_CSV_PATH}")
+        else:
+            logging.info("No suspicious flows to save (related CSV not created or is empty).")
+        suspicious_sample = self.suspicious_sample if self.suspicious_sample is not None else pd.DataFrame()
+        self.recorder.finish(self.summary.write(suspicious_sample))
+        notify_by_email_on_prediction_completion(None, suspicious_sample.head(self.email_sample_size),
+                                                 num_total=self.num_total, num_suspicious=self.num_suspicious)
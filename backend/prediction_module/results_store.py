@@ -0,0 +1,560 @@
+# prediction_module/results_store.py
+"""
+Append-only SQLite results store (WAL mode) holding every scored flow with its
+prediction, and one row per scan run. The reporter appends each scored chunk in
+one executemany transaction. The UI pages through flows with indexed keyset
+queries (query_flows, list_scans via server.py) instead of re-reading result
+CSVs. Scans older than RESULTS_DB_RETENTION_DAYS are deleted with their flows
+and the freed pages returned to the file system (apply_retention).
+
+From backend/:
+    python -m prediction_module.results_store --stats
+    python -m prediction_module.results_store --query --label PortScan --page-size 20
+    python -m prediction_module.results_store --compact           # retention + free pages now
+    python -m prediction_module.results_store --benchmark 200000  # on a temporary database
+"""
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from . import config
+from .preprocessor import EPOCH_COLUMN, detect_timestamp_format, local_datetime_to_epoch
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scans (
+    id INTEGER PRIMARY KEY,
+    started REAL NOT NULL,              -- epoch seconds
+    finished REAL,
+    status TEXT NOT NULL,               -- running, finished
+    total_flows INTEGER NOT NULL DEFAULT 0,
+    suspicious_flows INTEGER NOT NULL DEFAULT 0,
+    critical_alerts INTEGER NOT NULL DEFAULT 0,
+    normal_mb REAL,
+    suspicious_mb REAL,
+    feature_columns TEXT                -- JSON list naming the float32 values in flows.features
+);
+CREATE TABLE IF NOT EXISTS flows (
+    id INTEGER PRIMARY KEY,
+    scan_id INTEGER NOT NULL REFERENCES scans(id),
+    ts REAL NOT NULL,                   -- flow Timestamp in epoch seconds
+    flow_id TEXT,
+    src_ip TEXT,
+    src_port INTEGER,
+    dst_ip TEXT,
+    dst_port INTEGER,
+    protocol INTEGER,
+    label TEXT,
+    probability REAL,
+    suspicious INTEGER NOT NULL,
+    features BLOB                       -- float32 row, see scans.feature_columns (RESULTS_DB_STORE_FEATURES)
+);
+-- Every index ends in ts (then the rowid), so each filter pages newest-first without sorting
+CREATE INDEX IF NOT EXISTS flows_ts ON flows(ts);
+CREATE INDEX IF NOT EXISTS flows_src_ip_ts ON flows(src_ip, ts);
+CREATE INDEX IF NOT EXISTS flows_dst_ip_ts ON flows(dst_ip, ts);
+CREATE INDEX IF NOT EXISTS flows_label_ts ON flows(label, ts);
+CREATE INDEX IF NOT EXISTS flows_scan_ts ON flows(scan_id, ts);
+CREATE INDEX IF NOT EXISTS flows_suspicious_ts ON flows(ts) WHERE suspicious = 1;
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+# flows column -> (result column, kind); kind picks the conversion in _column_values
+FLOW_COLUMNS = {
+    'flow_id': ('Flow ID', 'text'),
+    'src_ip': ('Src IP', 'text'),
+    'src_port': ('Src Port', 'number'),
+    'dst_ip': ('Dst IP', 'text'),
+    'dst_port': ('Dst Port', 'number'),
+    'protocol': ('Protocol', 'number'),
+    'label': ('Prediction', 'text'),
+    'probability': ('Prediction_Probability', 'number'),
+}
+# Result columns not repeated in the features blob
+NON_FEATURE_COLUMNS = {column for column, _ in FLOW_COLUMNS.values()} | {'Timestamp', EPOCH_COLUMN}
+INSERT_FLOW_SQL = (f"INSERT INTO flows (scan_id, ts, suspicious, features, {', '.join(FLOW_COLUMNS)}) "
+                   f"VALUES ({', '.join('?' * (4 + len(FLOW_COLUMNS)))})")
+# query_flows filters: argument -> SQL condition
+FLOW_FILTERS = {
+    'src_ip': "src_ip = ?",
+    'dst_ip': "dst_ip = ?",
+    'label': "label = ?",
+    'scan_id': "scan_id = ?",
+    'since': "ts >= ?",
+    'until': "ts < ?",
+}
+
+
+def _column_values(df, column, kind):
+    """Returns a column as a list of SQLite-bindable values (None for missing ones)."""
+    if column not in df.columns:
+        return [None] * len(df)
+    values = df[column]
+    if kind == 'number' and not pd.api.types.is_numeric_dtype(values):
+        values = pd.to_numeric(values, errors='coerce')
+    elif kind == 'text' and not (pd.api.types.is_object_dtype(values) or pd.api.types.is_string_dtype(values)):
+        values = values.astype(str).where(values.notna()) # Categorical IPs, numeric labels
+    values = values.astype(object)
+    return values.where(values.notna(), None).tolist()
+
+
+def flow_epoch_seconds(df, default):
+    """
+    Returns the flows' times as epoch seconds (float64 array). Uses the capture
+    module's numeric 'Timestamp Epoch' column when present, else parses the
+    'Timestamp' strings (naive local time, like the capture module writes).
+    Unparseable or missing times get `default`.
+    """
+    if EPOCH_COLUMN in df.columns and pd.api.types.is_numeric_dtype(df[EPOCH_COLUMN]):
+        seconds = df[EPOCH_COLUMN].to_numpy(dtype=np.float64, na_value=np.nan)
+    elif 'Timestamp' in df.columns:
+        timestamps = df['Timestamp']
+        if not pd.api.types.is_datetime64_any_dtype(timestamps):
+            timestamps = pd.to_datetime(timestamps, format=detect_timestamp_format(timestamps), errors='coerce')
+        seconds = local_datetime_to_epoch(timestamps)
+    else:
+        return np.full(len(df), float(default))
+    return np.where(np.isnan(seconds), float(default), seconds)
+
+
+def _format_time(seconds):
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(seconds)) if seconds is not None else None
+
+
+def _parse_cursor(cursor):
+    """'ts:id' (as returned in a page's 'next') -> (float, int)."""
+    ts, flow_id = str(cursor).split(':')
+    return float(ts), int(flow_id)
+
+
+class ResultsStore:
+    """
+    SQLite database of scans and scored flows. Safe to share between threads:
+    each thread gets its own connection, and WAL lets readers (the UI's queries)
+    run while the reporter appends.
+    """
+    def __init__(self, path=None):
+        self.path = str(path or config.RESULTS_DB_PATH)
+        self._local = threading.local()
+        self._feature_columns = {} # scan_id -> feature column names, for decoding flows.features
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._connection().executescript(SCHEMA)
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=config.RESULTS_DB_BUSY_TIMEOUT)
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL") # Only takes effect on a new, still empty database
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL") # Durable across application crashes; one fsync per checkpoint
+            conn.execute("PRAGMA cache_size=-32768") # 32 MB page cache: keeps the index pages hot during bulk appends
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def close(self):
+        """Closes the calling thread's connection."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    # --- Writing ---
+
+    def begin_scan(self, started=None):
+        """Records a new running scan and returns its id."""
+        conn = self._connection()
+        with conn:
+            cursor = conn.execute("INSERT INTO scans (started, status) VALUES (?, 'running')",
+                                  (time.time() if started is None else started,))
+        return cursor.lastrowid
+
+    def add_flows(self, scan_id, df_with_preds, suspicious_condition, default_time=None):
+        """
+        Appends scored flows in one transaction.
+
+        Args:
+            scan_id: Id from begin_scan.
+            df_with_preds: Flows with the 'Prediction' (and optional 'Prediction_Probability') column.
+            suspicious_condition: Boolean Series, True for the suspicious rows.
+            default_time: Epoch seconds for flows without a readable timestamp (defaults to now).
+
+        Returns:
+            Number of rows written.
+        """
+        if df_with_preds.empty:
+            return 0
+        conn = self._connection()
+        columns = [_column_values(df_with_preds, column, kind) for column, kind in FLOW_COLUMNS.values()]
+        times = flow_epoch_seconds(df_with_preds, time.time() if default_time is None else default_time).tolist()
+        suspicious = np.asarray(suspicious_condition, dtype=np.int64).tolist()
+        features = self._feature_blobs(conn, scan_id, df_with_preds)
+        with conn:
+            conn.executemany(INSERT_FLOW_SQL, zip([scan_id] * len(times), times, suspicious, features, *columns))
+        return len(times)
+
+    def _feature_blobs(self, conn, scan_id, df):
+        """The numeric flow features of each row as float32 bytes (None for every row if not stored)."""
+        if not config.RESULTS_DB_STORE_FEATURES:
+            return [None] * len(df)
+        feature_columns = self._feature_columns.get(scan_id)
+        if feature_columns is None:
+            # Fixed by the scan's first chunk, so every row of a scan decodes with the same names
+            feature_columns = [column for column in df.select_dtypes(include='number').columns
+                               if column not in NON_FEATURE_COLUMNS]
+            with conn:
+                conn.execute("UPDATE scans SET feature_columns = ? WHERE id = ?", (json.dumps(feature_columns), scan_id))
+            self._feature_columns[scan_id] = feature_columns
+        values = df.reindex(columns=feature_columns)
+        if not all(pd.api.types.is_numeric_dtype(dtype) for dtype in values.dtypes):
+            values = values.apply(pd.to_numeric, errors='coerce')
+        matrix = np.ascontiguousarray(values.to_numpy(dtype=np.float32, na_value=np.nan))
+        return [row.tobytes() for row in matrix]
+
+    def finish_scan(self, scan_id, summary=None, status='finished'):
+        """
+        Marks a scan finished with its totals, then runs retention if it is due.
+
+        Args:
+            scan_id: Id from begin_scan.
+            summary: The scan's summary dict (reporter.ResultSummary.to_dict), or None.
+            status: Final status.
+        """
+        summary = summary or {}
+        traffic = summary.get('trafficAnalysis', {})
+        conn = self._connection()
+        with conn:
+            conn.execute("UPDATE scans SET finished = ?, status = ?, total_flows = ?, suspicious_flows = ?, "
+                         "critical_alerts = ?, normal_mb = ?, suspicious_mb = ? WHERE id = ?",
+                         (time.time(), status, summary.get('totalFlows', 0), summary.get('totalThreats', 0),
+                          summary.get('criticalAlerts', 0), traffic.get('normal'), traffic.get('suspicious'), scan_id))
+        self._feature_columns.pop(scan_id, None)
+        self.maybe_apply_retention()
+
+    # --- Queries ---
+
+    def query_flows(self, page_size=100, before=None, suspicious_only=False, include_features=False, **filters):
+        """
+        Returns one page of flows, newest first, using the index of the filter given.
+
+        Args:
+            page_size: Rows per page (capped at RESULTS_DB_MAX_PAGE_SIZE).
+            before: The 'next' cursor of the previous page; None for the first page.
+            suspicious_only: Only suspicious flows.
+            include_features: Also decode each flow's stored features.
+            **filters: Any of src_ip, dst_ip, label, scan_id (exact match) and
+                since, until (epoch seconds, until exclusive). None values are ignored.
+
+        Returns:
+            Dict with 'rows' (result-column dicts, as in the prediction CSVs) and
+            'next' (cursor for the following page, or None on the last page).
+        """
+        page_size = max(1, min(int(page_size), config.RESULTS_DB_MAX_PAGE_SIZE))
+        conditions, params = [], []
+        for name, value in filters.items():
+            if name not in FLOW_FILTERS:
+                raise ValueError(f"Unknown flow filter '{name}'. Use one of: {', '.join(FLOW_FILTERS)}")
+            if value is not None and value != '':
+                conditions.append(FLOW_FILTERS[name])
+                params.append(value)
+        if suspicious_only:
+            conditions.append("suspicious = 1")
+        if before is not None and before != '':
+            conditions.append("(ts, id) < (?, ?)")
+            params.extend(_parse_cursor(before))
+        sql = ("SELECT * FROM flows" + (" WHERE " + " AND ".join(conditions) if conditions else "")
+               + " ORDER BY ts DESC, id DESC LIMIT ?")
+        rows = self._connection().execute(sql, params + [page_size + 1]).fetchall()
+        next_cursor = f"{rows[page_size - 1]['ts']!r}:{rows[page_size - 1]['id']}" if len(rows) > page_size else None
+        return {'rows': [self._flow_record(row, include_features) for row in rows[:page_size]], 'next': next_cursor}
+
+    def _flow_record(self, row, include_features):
+        record = {'id': row['id'], 'Scan ID': row['scan_id'], 'Timestamp': _format_time(row['ts'])}
+        for db_column, (column, _) in FLOW_COLUMNS.items():
+            record[column] = row[db_column]
+        record['Suspicious'] = bool(row['suspicious'])
+        if include_features and row['features'] is not None:
+            names = self._scan_feature_columns(row['scan_id'])
+            values = np.frombuffer(row['features'], dtype=np.float32).tolist()
+            record.update((name, None if value != value else value) for name, value in zip(names, values)) # NaN -> None
+        return record
+
+    def _scan_feature_columns(self, scan_id):
+        names = self._feature_columns.get(scan_id)
+        if names is None:
+            row = self._connection().execute("SELECT feature_columns FROM scans WHERE id = ?", (scan_id,)).fetchone()
+            names = json.loads(row['feature_columns']) if row and row['feature_columns'] else []
+        return names
+
+    def list_scans(self, limit=20, status=None):
+        """Returns the latest scans (newest first) as dicts; status filters, e.g. 'finished'."""
+        sql = "SELECT * FROM scans" + (" WHERE status = ?" if status else "") + " ORDER BY id DESC LIMIT ?"
+        rows = self._connection().execute(sql, ([status] if status else []) + [int(limit)]).fetchall()
+        return [{key: row[key] for key in row.keys() if key != 'feature_columns'} for row in rows]
+
+    def stats(self):
+        """Returns row counts, time range and file sizes of the store."""
+        conn = self._connection()
+        flows, oldest, newest = conn.execute("SELECT COUNT(*), MIN(ts), MAX(ts) FROM flows").fetchone()
+        scans = conn.execute("SELECT COUNT(*) FROM scans").fetchone()[0]
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        size = lambda path: os.path.getsize(path) if os.path.exists(path) else 0
+        return {'path': self.path, 'scans': scans, 'flows': flows,
+                'oldest': _format_time(oldest), 'newest': _format_time(newest),
+                'file_mb': round(size(self.path) / 2**20, 2), 'wal_mb': round(size(self.path + '-wal') / 2**20, 2),
+                'free_mb': round(free_pages * page_size / 2**20, 2)}
+
+    # --- Retention and compaction ---
+
+    def apply_retention(self, max_age_days=None, now=None):
+        """
+        Deletes the scans (with their flows) that finished more than max_age_days
+        ago, then compacts: frees the emptied pages and truncates the WAL file.
+        Age is when a scan was stored, not the flow timestamps, so a replayed old
+        capture is kept like a live one. Flows are deleted in
+        RESULTS_DB_DELETE_BATCH_ROWS batches so concurrent writers are never
+        blocked for long.
+
+        Returns:
+            Tuple: (flows deleted, scans deleted).
+        """
+        max_age_days = config.RESULTS_DB_RETENTION_DAYS if max_age_days is None else max_age_days
+        now = time.time() if now is None else now
+        conn = self._connection()
+        flows_deleted = scans_deleted = 0
+        if max_age_days is not None:
+            cutoff = now - max_age_days * 86400
+            expired = [row['id'] for row in conn.execute("SELECT id FROM scans WHERE COALESCE(finished, started) < ?",
+                                                          (cutoff,))]
+            for scan_id in expired:
+                while True:
+                    with conn:
+                        deleted = conn.execute("DELETE FROM flows WHERE id IN (SELECT id FROM flows WHERE scan_id = ? LIMIT ?)",
+                                               (scan_id, config.RESULTS_DB_DELETE_BATCH_ROWS)).rowcount
+                    flows_deleted += deleted
+                    if deleted < config.RESULTS_DB_DELETE_BATCH_ROWS:
+                        break
+                with conn:
+                    scans_deleted += conn.execute("DELETE FROM scans WHERE id = ?", (scan_id,)).rowcount
+        self.compact()
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('last_retention', ?)", (str(now),))
+        if flows_deleted or scans_deleted:
+            logger.info(f"Results store retention: deleted {flows_deleted} flows and {scans_deleted} scans "
+                        f"older than {max_age_days} days.")
+        return flows_deleted, scans_deleted
+
+    def maybe_apply_retention(self, now=None):
+        """Runs apply_retention if the last run was more than RESULTS_DB_RETENTION_INTERVAL_HOURS ago."""
+        now = time.time() if now is None else now
+        row = self._connection().execute("SELECT value FROM meta WHERE key = 'last_retention'").fetchone()
+        if row is None or now - float(row['value']) >= config.RESULTS_DB_RETENTION_INTERVAL_HOURS * 3600:
+            try:
+                self.apply_retention(now=now)
+            except sqlite3.Error as e:
+                logger.warning(f"Results store retention failed (retried after the next scan): {e}")
+
+    def compact(self, full=False):
+        """Returns free pages to the file system and truncates the WAL; full=True rebuilds the file (VACUUM)."""
+        conn = self._connection()
+        if full:
+            conn.execute("VACUUM")
+        else:
+            conn.executescript("PRAGMA incremental_vacuum") # execute() would free a single page per step
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+
+
+class ScanRecorder:
+    """
+    Records one scan's flows into the shared results store. Store errors are
+    logged and stop the recording, but never fail the prediction run.
+    """
+    def __init__(self, store=None):
+        self.store = store or get_results_store()
+        self.scan_id = None
+        self.started = time.time()
+        if self.store is not None:
+            try:
+                self.scan_id = self.store.begin_scan(self.started)
+            except sqlite3.Error as e:
+                logger.error(f"Could not record the scan in the results store: {e}")
+
+    @property
+    def enabled(self):
+        return self.scan_id is not None
+
+    def add(self, df_with_preds, suspicious_condition):
+        """Appends a scored chunk (see ResultsStore.add_flows)."""
+        if not self.enabled:
+            return
+        try:
+            started = time.perf_counter()
+            rows = self.store.add_flows(self.scan_id, df_with_preds, suspicious_condition, default_time=self.started)
+            logger.info(f"Stored {rows} flows in the results store in {(time.perf_counter() - started) * 1000:.1f} ms.")
+        except (sqlite3.Error, ValueError) as e:
+            logger.error(f"Error writing flows to the results store; the rest of this scan is not stored: {e}", exc_info=True)
+            self.scan_id = None
+
+    def finish(self, summary):
+        """Marks the scan finished with the totals of its summary dict."""
+        if not self.enabled:
+            return
+        try:
+            self.store.finish_scan(self.scan_id, summary)
+            logger.info(f"Scan {self.scan_id} saved to the results store: {self.store.path}")
+        except sqlite3.Error as e:
+            logger.error(f"Error finishing the scan in the results store: {e}")
+
+
+_shared_store = None
+_shared_lock = threading.Lock()
+
+
+def get_results_store():
+    """Returns the process-wide store at RESULTS_DB_PATH, or None if disabled or it cannot be opened."""
+    global _shared_store
+    if not config.RESULTS_DB_ENABLED:
+        return None
+    with _shared_lock:
+        if _shared_store is None:
+            try:
+                _shared_store = ResultsStore(config.RESULTS_DB_PATH)
+            except sqlite3.Error as e:
+                logger.error(f"Could not open the results store at {config.RESULTS_DB_PATH}: {e}")
+        return _shared_store
+
+
+def run_benchmark(num_flows, page_size=100, chunk_rows=100000):
+    """
+    Fills a temporary store with num_flows synthetic flows and compares indexed
+    page queries with reading the same flows back from a CSV and filtering them.
+    """
+    rng = np.random.default_rng(0)
+    labels = np.array(['Benign'] * 8 + ['PortScan', 'DDoS'])
+    started_at = time.time() - 86400
+    df = pd.DataFrame({
+        'Flow ID': [f"flow-{i}" for i in range(num_flows)],
+        'Src IP': [f"10.0.{i % 250}.{i % 200}" for i in rng.integers(0, 50000, num_flows)],
+        'Src Port': rng.integers(1024, 65535, num_flows),
+        'Dst IP': [f"192.168.1.{i}" for i in rng.integers(1, 255, num_flows)],
+        'Dst Port': rng.choice([22, 53, 80, 443], num_flows),
+        'Protocol': rng.choice([6, 17], num_flows),
+        'Timestamp Epoch': np.sort(started_at + rng.uniform(0, 86400, num_flows)),
+        'Flow Duration': rng.exponential(1e5, num_flows).astype(np.float32),
+        'TotLen Fwd Pkts': rng.integers(0, 1e5, num_flows).astype(np.float32),
+        'TotLen Bwd Pkts': rng.integers(0, 1e5, num_flows).astype(np.float32),
+        'Prediction': rng.choice(labels, num_flows),
+        'Prediction_Probability': rng.uniform(0.5, 1, num_flows).astype(np.float32),
+    })
+    # As wide as a real predictions file (the capture module writes ~80 flow features)
+    df = pd.concat([df, pd.DataFrame(rng.uniform(0, 1e4, (num_flows, 75)).astype(np.float32),
+                                     columns=[f"Feature {i}" for i in range(75)])], axis=1)
+    suspicious = df['Prediction'] != 'Benign'
+    src_ip = df['Src IP'].iloc[num_flows // 2]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = ResultsStore(os.path.join(tmp, 'results.db'))
+        half = num_flows // 2
+        started = time.perf_counter()
+        # Two scans: one stored a day ago (expired by the retention run below) and one now
+        for scan_id, start, stop in ((store.begin_scan(started_at), 0, half), (store.begin_scan(), half, num_flows)):
+            for offset in range(start, stop, chunk_rows):
+                end = min(offset + chunk_rows, stop)
+                store.add_flows(scan_id, df.iloc[offset:end], suspicious.iloc[offset:end])
+        insert_s = time.perf_counter() - started
+        csv_path = os.path.join(tmp, 'predictions.csv')
+        started = time.perf_counter()
+        df.to_csv(csv_path, index=False)
+        csv_write_s = time.perf_counter() - started
+
+        queries = {
+            'newest page': {},
+            'label=PortScan': {'label': 'PortScan'},
+            'src_ip': {'src_ip': src_ip},
+            'suspicious, last hour': {'suspicious_only': True, 'since': started_at + 82800},
+        }
+        print(f"{num_flows} flows: stored in {insert_s:.2f}s ({num_flows / insert_s:,.0f} flows/s); "
+              f"writing the CSV took {csv_write_s:.2f}s. Store: {store.stats()['file_mb']} MB")
+        print(f"{'query (page of ' + str(page_size) + ')':28}{'store ms':>10}{'page 2 ms':>11}{'CSV ms':>10}")
+        for name, query in queries.items():
+            started = time.perf_counter()
+            page = store.query_flows(page_size, **query)
+            first_ms = (time.perf_counter() - started) * 1000
+            started = time.perf_counter()
+            store.query_flows(page_size, before=page['next'], **query)
+            second_ms = (time.perf_counter() - started) * 1000
+            started = time.perf_counter()
+            csv_df = pd.read_csv(csv_path)
+            mask = pd.Series(True, index=csv_df.index)
+            for key, column in (('label', 'Prediction'), ('src_ip', 'Src IP')):
+                if key in query:
+                    mask &= csv_df[column] == query[key]
+            if query.get('suspicious_only'):
+                mask &= csv_df['Prediction'] != 'Benign'
+            if 'since' in query:
+                mask &= csv_df['Timestamp Epoch'] >= query['since']
+            csv_df[mask].nlargest(page_size, 'Timestamp Epoch')
+            csv_ms = (time.perf_counter() - started) * 1000
+            print(f"{name:28}{first_ms:10.2f}{second_ms:11.2f}{csv_ms:10.1f}")
+        started = time.perf_counter()
+        deleted, _ = store.apply_retention(max_age_days=0.5)
+        print(f"Retention (scans older than 12h): deleted {deleted} flows in {time.perf_counter() - started:.2f}s; "
+              f"store now {store.stats()['file_mb']} MB.")
+        store.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Results store tools.")
+    parser.add_argument('--db', help=f"Database file (default {config.RESULTS_DB_PATH}).")
+    parser.add_argument('--stats', action='store_true', help="Print row counts, time range and file sizes.")
+    parser.add_argument('--query', action='store_true', help="Print one page of flows (newest first) as JSON lines.")
+    parser.add_argument('--src-ip')
+    parser.add_argument('--dst-ip')
+    parser.add_argument('--label')
+    parser.add_argument('--scan-id', type=int)
+    parser.add_argument('--suspicious', action='store_true', help="Only suspicious flows.")
+    parser.add_argument('--before', help="Cursor printed after the previous page.")
+    parser.add_argument('--page-size', type=int, default=50)
+    parser.add_argument('--compact', action='store_true', help="Apply retention and free unused pages now.")
+    parser.add_argument('--vacuum', action='store_true', help="With --compact, rebuild the whole file (slow on large stores).")
+    parser.add_argument('--benchmark', type=int, metavar='FLOWS',
+                        help="Compare indexed page queries with CSV reads on FLOWS synthetic flows (temporary database).")
+    args = parser.parse_args()
+    logging.basicConfig(level=config.LOGGING_LEVEL, format=config.LOGGING_FORMAT)
+
+    if args.benchmark:
+        run_benchmark(args.benchmark, args.page_size)
+        return 0
+    if not (args.stats or args.query or args.compact):
+        parser.print_help()
+        return 0
+    store = ResultsStore(args.db)
+    if args.compact:
+        flows, scans = store.apply_retention()
+        if args.vacuum:
+            store.compact(full=True)
+        print(f"Deleted {flows} flows and {scans} scans.")
+    if args.query:
+        page = store.query_flows(args.page_size, before=args.before, suspicious_only=args.suspicious,
+                                 src_ip=args.src_ip, dst_ip=args.dst_ip, label=args.label, scan_id=args.scan_id)
+        for row in page['rows']:
+            print(json.dumps(row, ensure_ascii=False))
+        print(f"next: {page['next']}")
+    if args.stats or args.compact:
+        print(json.dumps(store.stats(), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
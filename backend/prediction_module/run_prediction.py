@@ -2,79 +2,186 @@
 import logging
 import sys
 import os
+import time
 
 from . import config
-from .loader import load_model_scaler, load_data
+from .loader import FLOW_FILE_EXTENSIONS, get_flows_path, iter_data_chunks, load_model_scaler, load_data
 from .preprocessor import preprocess_data
-from .feature_engineer import calculate_dynamic_features
+from .feature_engineer import calculate_dynamic_features, create_feature_engine
 from .predictor import align_features, make_predictions
-from .reporter import analyze_and_save_results
+from .reporter import ChunkedResultWriter, analyze_and_save_results
 from .send_telegram_messege import process_attack_detection
 
-def run_prediction_pipeline():
-    """Executes the full prediction pipeline."""
-    logging.basicConfig(level=config.LOGGING_LEVEL, format=config.LOGGING_FORMAT)
-    logging.info("--- Starting Prediction Module ---")
-
-    # 1. Load Model, Scaler, and Expected Features
-    model, scaler, expected_features = load_model_scaler()
-    if model is None or scaler is None or expected_features is None:
-        logging.error("Failed to load model/scaler or determine expected features. Exiting.")
-        return False
+def score_flows(df, model, scaler, expected_features, feature_engine=None):
+    """
+    Runs preprocessing, optional feature engineering, feature alignment and
+    prediction on a DataFrame of flows (as loaded from the capture output).
 
-    # 2. Load Data
-    df = load_data()
-    if df is None:
-        logging.error(f"Failed to load data from '{config.NETWORK_FLOWS_CSV_PATH}'. Exiting.")
-        return False
-    if df.empty:
-        logging.warning("Input data file is empty. Nothing to predict.")
-        return True
+    Args:
+        df: DataFrame with the capture module's columns. Not modified.
+        model: Loaded prediction model.
+        scaler: Loaded scaler.
+        expected_features: Feature names expected by the model, in order.
+        feature_engine: RollingFeatureEngine shared by consecutive batches of one
+            stream/file, so per-source features span batches. None uses a fresh one.
 
-    df_original_copy = df.copy() # Keep a copy for final reporting with original columns
-
-    
+    Returns:
+        Tuple: (predictions_array, probabilities_array or None), or (None, None) on failure.
+    """
+    stage_times = {} # stage name -> seconds, logged once the flows are scored
+    stage_started = time.perf_counter()
     # 3. Preprocess Data -> nhận renamed_cols_map
     df_processed, timestamp_col, renamed_cols_map = preprocess_data(df, expected_features) # Lấy map ở đây
     if df_processed is None or renamed_cols_map is None: # Kiểm tra cả map
-        logging.error("Data preprocessing failed. Exiting.")
-        return False
+        logging.error("Data preprocessing failed.")
+        return None, None
+    stage_started = _record_stage(stage_times, 'preprocess', stage_started)
 
     # 4. Feature Engineering (Optional)
     if config.CALCULATE_DYNAMIC_FEATURES:
         # Truyền map vào feature engineer nếu nó cũng cần
-        df_engineered = calculate_dynamic_features(df_processed, timestamp_col, renamed_cols_map)
+        df_engineered = calculate_dynamic_features(df_processed, timestamp_col, renamed_cols_map, feature_engine)
         if df_engineered is None:
-             logging.error("Feature engineering failed. Exiting.")
-             return False
+             logging.error("Feature engineering failed.")
+             return None, None
+        stage_started = _record_stage(stage_times, 'feature engineering', stage_started)
     else:
         df_engineered = df_processed
 
     # 5. Align Features -> truyền map vào đây
     df_aligned = align_features(df_engineered, expected_features, renamed_cols_map) # Truyền map
     if df_aligned is None:
-        logging.error("Feature alignment failed. Exiting.")
-        return False
+        logging.error("Feature alignment failed.")
+        return None, None
+    stage_started = _record_stage(stage_times, 'align', stage_started)
 
     # 6. Make Predictions (df_aligned giờ đã có tên cột gốc)
     predictions, probabilities = make_predictions(df_aligned, model, scaler)
     if predictions is None:
-        logging.error("Prediction failed. Exiting.")
+        logging.error("Prediction failed.")
+        return None, None
+    _record_stage(stage_times, 'scale + predict' if scaler is not None else 'predict', stage_started)
+    logging.info(f"Scored {len(df)} flows in {sum(stage_times.values()) * 1000:.1f} ms ("
+                 + ", ".join(f"{stage} {seconds * 1000:.1f} ms" for stage, seconds in stage_times.items()) + ")")
+    return predictions, probabilities
+
+
+def _record_stage(stage_times, stage, started):
+    """Stores the time since `started` for `stage` and returns the current time."""
+    now = time.perf_counter()
+    stage_times[stage] = now - started
+    return now
+
+def run_prediction_pipeline(flows_path=None, data_format=None):
+    """
+    Executes the full prediction pipeline.
+
+    Args:
+        flows_path: Optional flow file to score instead of the configured one.
+        data_format: 'csv', 'parquet' or 'arrow'. Defaults to config.NETWORK_FLOWS_FORMAT.
+    """
+    logging.basicConfig(level=config.LOGGING_LEVEL, format=config.LOGGING_FORMAT)
+    logging.info("--- Starting Prediction Module ---")
+    pipeline_started = time.perf_counter()
+
+    # 1. Load Model, Scaler, and Expected Features
+    model, scaler, expected_features = load_model_scaler()
+    if model is None or expected_features is None: # scaler is None for a fused model
+        logging.error("Failed to load model/scaler or determine expected features. Exiting.")
+        return False
+
+    if config.PREDICTION_CHUNK_ROWS:
+        succeeded = _run_chunked(model, scaler, expected_features, flows_path, data_format)
+    else:
+        succeeded = _run_whole_file(model, scaler, expected_features, flows_path, data_format)
+    # Notifications are only queued here, so this excludes SMTP/Telegram latency
+    logging.info(f"Prediction pipeline finished in {time.perf_counter() - pipeline_started:.2f}s.")
+    peak_rss_mb = get_peak_rss_mb()
+    if peak_rss_mb is not None:
+        logging.info(f"Peak memory (RSS) of the prediction process: {peak_rss_mb:.0f} MB")
+    return succeeded
+
+
+def _run_whole_file(model, scaler, expected_features, flows_path, data_format):
+    """Loads the whole flow file, scores it and saves the results in one go."""
+    # 2. Load Data
+    df = load_data(data_format, flows_path)
+    if df is None:
+        logging.error(f"Failed to load data from '{flows_path or config.NETWORK_FLOWS_CSV_PATH}'. Exiting.")
+        return False
+    if df.empty:
+        logging.warning("Input data file is empty. Nothing to predict.")
+        return True
+
+    # 3-6. Preprocess, engineer, align and predict (score_flows leaves df untouched)
+    predictions, probabilities = score_flows(df, model, scaler, expected_features)
+    if predictions is None:
+        logging.error("Scoring the flows failed. Exiting.")
         return False
 
     # 7. Analyze and Save Results
-    if len(predictions) == len(df_original_copy):
-         # Giả định df_original_copy vẫn giữ nguyên tên cột gốc từ lúc load_data
-         df_original_copy['Prediction'] = predictions
+    if len(predictions) == len(df):
+         df['Prediction'] = predictions
 
-         analyze_and_save_results(df_original_copy, predictions, probabilities)
+         analyze_and_save_results(df, predictions, probabilities)
          logging.info("--- Prediction Module Finished Successfully ---")
          return True
     else:
-         logging.error(f"Prediction length ({len(predictions)}) does not match original data length ({len(df_original_copy)}). Cannot merge results.")
+         logging.error(f"Prediction length ({len(predictions)}) does not match original data length ({len(df)}). Cannot merge results.")
          return False
 
 
+def _run_chunked(model, scaler, expected_features, flows_path, data_format):
+    """Loads, scores and writes the flow file chunk by chunk (PREDICTION_CHUNK_ROWS flows at a time)."""
+    data_format = (data_format or config.NETWORK_FLOWS_FORMAT).lower()
+    if data_format not in FLOW_FILE_EXTENSIONS:
+        logging.error(f"Unknown network flow format '{data_format}'. Use one of: {', '.join(FLOW_FILE_EXTENSIONS)}")
+        return False
+    path = flows_path or get_flows_path(data_format)
+    if not os.path.exists(path):
+        logging.error(f"Input flow file not found: '{path}'. Exiting.")
+        return False
+
+    writer = ChunkedResultWriter()
+    feature_engine = create_feature_engine() # Per-source rolling state carried across chunks
+    try:
+        for chunk_number, df in enumerate(iter_data_chunks(data_format, path), start=1):
+            if df.empty:
+                continue
+            predictions, probabilities = score_flows(df, model, scaler, expected_features, feature_engine)
+            if predictions is None or len(predictions) != len(df):
+                logging.error(f"Scoring chunk {chunk_number} failed. Exiting.")
+                return False
+            df['Prediction'] = predictions
+            writer.add_chunk(df, probabilities)
+            logging.info(f"Chunk {chunk_number}: {writer.num_total} flows scored so far.")
+    except Exception as e:
+        logging.error(f"Error reading flow file '{path}': {e}", exc_info=True)
+        return False
+
+    if writer.num_total == 0:
+        logging.warning("Input data file is empty. Nothing to predict.")
+        return True
+    writer.finish()
+    logging.info("--- Prediction Module Finished Successfully ---")
+    return True
+
+
+def get_peak_rss_mb():
+    """Returns the peak resident memory of this process in MB, or None if it cannot be read."""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024 # bytes on macOS, KB on Linux
+    except ImportError: # Windows
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().peak_wset / 1024 / 1024
+    except (ImportError, AttributeError):
+        return None
+
+
 if __name__ == "__main__":
     run_prediction_pipeline()
 
@@ -1,5 +1,17 @@
 # prediction_module/send_email_notification.py
+"""
+Email notifications for finished predictions. notify_by_email_on_prediction_completion
+queues a report and returns; a background EmailNotificationWorker waits
+EMAIL_DEBOUNCE_SECONDS for more reports, merges them into one digest email and
+sends it over a kept-open, authenticated SMTP connection (reconnecting if the
+server dropped it).
+"""
+import atexit
+import collections
+import queue
 import smtplib
+import threading
+import time
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import os
@@ -18,11 +30,26 @@ EMAIL_RECEIVER_ADDRESS = os.getenv("EMAIL_RECEIVER_ADDRESS")
 SMTP_SERVER = os.getenv("SMTP_SERVER", "smtp.gmail.com")
 SMTP_PORT = int(os.getenv("SMTP_PORT", 587))
 
+# Snapshot of the settings above; server.py changes them between scans
+EmailSettings = collections.namedtuple('EmailSettings', 'sender password receiver server port')
+
+# One finished prediction run waiting to be emailed
+PredictionReport = collections.namedtuple('PredictionReport', 'finished_at num_total num_suspicious sample predictions_csv')
+
+
+def current_email_settings():
+    """Returns the current EmailSettings, or None if they are incomplete."""
+    if not all([EMAIL_SENDER_ADDRESS, EMAIL_SENDER_PASSWORD, EMAIL_RECEIVER_ADDRESS, SMTP_SERVER]):
+        logger.error("Email configuration incomplete. Skipping email notification. Please check .env variables: EMAIL_SENDER_ADDRESS, EMAIL_SENDER_PASSWORD, EMAIL_RECEIVER_ADDRESS, SMTP_SERVER, SMTP_PORT.")
+        return None
+    return EmailSettings(EMAIL_SENDER_ADDRESS, EMAIL_SENDER_PASSWORD, EMAIL_RECEIVER_ADDRESS, SMTP_SERVER, int(SMTP_PORT))
+
+
 def format_suspicious_flows_for_email_html(suspicious_df_sample):
     """Formats a sample of suspicious flows DataFrame into an HTML table for email."""
     if suspicious_df_sample.empty:
         return "<p>No specific suspicious flow examples to display.</p>"
-    
+
     html_table = "<h3>Một số luồng nguy hiểm đã được phát hiện:</h3>"
     try:
         html_table += suspicious_df_sample.to_html(index=False, border=1, classes="dataframe", escape=True)
@@ -32,22 +59,13 @@ def format_suspicious_flows_for_email_html(suspicious_df_sample):
     html_table += "<p><em>Note: Only a sample of suspicious flows is shown. Check CSV output for full details.</em></p>"
     return html_table
 
-def send_prediction_results_email(subject, body_html, suspicious_df_sample_for_email=None):
-    """
-    Sends an email with the prediction results.
-    Args:
-        subject (str): Email subject.
-        body_html (str): Main HTML body content.
-        suspicious_df_sample_for_email (pd.DataFrame, optional): A sample of suspicious flows to include.
-    """
-    if not all([EMAIL_SENDER_ADDRESS, EMAIL_SENDER_PASSWORD, EMAIL_RECEIVER_ADDRESS, SMTP_SERVER]):
-        logger.error("Email configuration incomplete. Skipping email notification. Please check .env variables: EMAIL_SENDER_ADDRESS, EMAIL_SENDER_PASSWORD, EMAIL_RECEIVER_ADDRESS, SMTP_SERVER, SMTP_PORT.")
-        return False
 
+def build_email_message(subject, body_html, settings, suspicious_df_sample_for_email=None):
+    """Builds the multipart (plain text + HTML) email."""
     msg = MIMEMultipart('alternative')
     msg['Subject'] = subject
-    msg['From'] = EMAIL_SENDER_ADDRESS
-    msg['To'] = EMAIL_RECEIVER_ADDRESS
+    msg['From'] = settings.sender
+    msg['To'] = settings.receiver
 
     # Base HTML structure
     full_html_content = f"""
@@ -66,10 +84,10 @@ def send_prediction_results_email(subject, body_html, suspicious_df_sample_for_e
       <body>
         {body_html}
     """
-    
+
     if suspicious_df_sample_for_email is not None and not suspicious_df_sample_for_email.empty:
         full_html_content += format_suspicious_flows_for_email_html(suspicious_df_sample_for_email)
-    
+
     full_html_content += """
       </body>
     </html>
@@ -82,28 +100,105 @@ def send_prediction_results_email(subject, body_html, suspicious_df_sample_for_e
         text_part_content += "\n\nSuspicious flows detected. Sample:\n"
         text_part_content += suspicious_df_sample_for_email.to_string(index=False)
 
-
     part1 = MIMEText(text_part_content, 'plain', 'utf-8')
     part2 = MIMEText(full_html_content, 'html', 'utf-8')
 
     msg.attach(part1)
     msg.attach(part2)
+    return msg
 
-    try:
-        logger.info(f"Attempting to send email via {SMTP_SERVER}:{SMTP_PORT} to {EMAIL_RECEIVER_ADDRESS}")
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
+
+class SMTPConnection:
+    """
+    One SMTP connection kept open (EHLO, STARTTLS and login done once) and
+    reused for every email. A send on a connection the server has dropped
+    reconnects and retries once; the connection is closed after
+    EMAIL_SMTP_IDLE_TIMEOUT seconds without mail or when the settings change.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.server = None
+        self.settings = None
+        self.last_used = 0.0
+        self.connects = 0
+
+    def _connect(self, settings):
+        logger.info(f"Connecting to SMTP server {settings.server}:{settings.port}...")
+        server = smtplib.SMTP(settings.server, settings.port, timeout=config.EMAIL_SMTP_TIMEOUT)
+        try:
             server.ehlo()
-            if SMTP_PORT == 587: # Standard for TLS
+            if settings.port == 587: # Standard for TLS
                 server.starttls()
                 server.ehlo()
-            
-            if EMAIL_SENDER_PASSWORD: # Only login if password is provided
-                 logger.info(f"Logging into SMTP server as {EMAIL_SENDER_ADDRESS}...")
-                 server.login(EMAIL_SENDER_ADDRESS, EMAIL_SENDER_PASSWORD)
-            
-            logger.info(f"Sending email to {EMAIL_RECEIVER_ADDRESS}...")
-            server.sendmail(EMAIL_SENDER_ADDRESS, EMAIL_RECEIVER_ADDRESS.split(','), msg.as_string()) # Allow multiple receivers
-            logger.info("Email notification sent successfully.")
+            if settings.password: # Only login if password is provided
+                logger.info(f"Logging into SMTP server as {settings.sender}...")
+                server.login(settings.sender, settings.password)
+        except Exception:
+            server.close()
+            raise
+        self.server, self.settings = server, settings
+        self.connects += 1
+
+    def send(self, msg, settings):
+        """Sends msg with the given settings, (re)connecting as needed. Raises smtplib errors."""
+        with self.lock:
+            if self.server is not None and (self.settings != settings or
+                                            time.monotonic() - self.last_used > config.EMAIL_SMTP_IDLE_TIMEOUT):
+                self._close()
+            for attempt in (1, 2):
+                reused = self.server is not None
+                if not reused:
+                    self._connect(settings)
+                try:
+                    self.server.sendmail(settings.sender, settings.receiver.split(','), msg.as_string()) # Allow multiple receivers
+                    self.last_used = time.monotonic()
+                    return
+                except (smtplib.SMTPServerDisconnected, ConnectionError, OSError) as e:
+                    self._close()
+                    if not reused or attempt == 2:
+                        raise
+                    logger.info(f"SMTP connection was dropped ({e}); reconnecting.")
+
+    def close_if_idle(self):
+        with self.lock:
+            if self.server is not None and time.monotonic() - self.last_used > config.EMAIL_SMTP_IDLE_TIMEOUT:
+                self._close()
+
+    def close(self):
+        with self.lock:
+            self._close()
+
+    def _close(self):
+        if self.server is None:
+            return
+        try:
+            self.server.quit()
+        except (smtplib.SMTPException, OSError):
+            self.server.close()
+        self.server = None
+
+
+_smtp_connection = SMTPConnection()
+
+
+def send_prediction_results_email(subject, body_html, suspicious_df_sample_for_email=None, settings=None):
+    """
+    Sends an email with the prediction results over the shared SMTP connection (blocking).
+    Args:
+        subject (str): Email subject.
+        body_html (str): Main HTML body content.
+        suspicious_df_sample_for_email (pd.DataFrame, optional): A sample of suspicious flows to include.
+        settings (EmailSettings, optional): Settings to use; defaults to the current module settings.
+    """
+    settings = settings or current_email_settings()
+    if settings is None:
+        return False
+    msg = build_email_message(subject, body_html, settings, suspicious_df_sample_for_email)
+
+    try:
+        logger.info(f"Sending email via {settings.server}:{settings.port} to {settings.receiver}...")
+        _smtp_connection.send(msg, settings)
+        logger.info("Email notification sent successfully.")
         return True
     except smtplib.SMTPAuthenticationError as e:
         logger.error(f"SMTP Authentication Error: {e}. Check sender email/password. If using Gmail with 2FA, an App Password is required.")
@@ -118,35 +213,179 @@ def send_prediction_results_email(subject, body_html, suspicious_df_sample_for_e
         logger.error(f"Failed to send email: {e}", exc_info=True)
         return False
 
-def notify_by_email_on_prediction_completion(all_flows_df, suspicious_flows_df):
+
+def build_report_email(reports):
     """
-    Prepares and sends an email notification based on prediction results.
-    Args:
-        all_flows_df (pd.DataFrame): DataFrame containing all flows with their predictions.
-        suspicious_flows_df (pd.DataFrame): DataFrame containing only suspicious flows.
+    Builds (subject, body_html, sample) for one or more prediction reports;
+    several reports become one digest email.
     """
-    num_suspicious = len(suspicious_flows_df)
-    num_total = len(all_flows_df)
-    
-    # Define paths to output files, ensuring they are accessible from config
-    predictions_csv = config.PREDICTIONS_OUTPUT_CSV_PATH if hasattr(config, 'PREDICTIONS_OUTPUT_CSV_PATH') else "predictions.csv"
-    suspicious_csv = config.SUSPICIOUS_OUTPUT_CSV_PATH if hasattr(config, 'SUSPICIOUS_OUTPUT_CSV_PATH') else "suspicious_flows.csv"
-
+    num_total = sum(report.num_total for report in reports)
+    num_suspicious = sum(report.num_suspicious for report in reports)
+    email_sample_size = getattr(config, 'EMAIL_ALERT_SAMPLE_SIZE', 5)
+    samples = [report.sample for report in reports if report.sample is not None and not report.sample.empty]
+    sample = pd.concat(samples, ignore_index=True).head(email_sample_size) if samples else None
+    runs = f" in {len(reports)} scans" if len(reports) > 1 else ""
 
     if num_suspicious > 0:
-        subject = f"🚨 Security Alert: {num_suspicious} Suspicious Network Flows Detected"
+        subject = f"🚨 Security Alert: {num_suspicious} Suspicious Network Flows Detected{runs}"
         body_html = f"""
         <p>Quét an ninh mạng đã xác định được <strong>{num_suspicious} luồng đáng ngờ</strong> trong tổng số {num_total} luồng được phân tích.</p>
-        
+
         """
-        # Take a small sample for the email body
-        email_sample_size = getattr(config, 'EMAIL_ALERT_SAMPLE_SIZE', 5)
-        suspicious_flows_sample_for_email = suspicious_flows_df.head(email_sample_size)
-        send_prediction_results_email(subject, body_html, suspicious_flows_sample_for_email)
     else:
-        subject = "✅ Security Scan Completed: No Suspicious Activity Detected"
+        subject = f"✅ Security Scan Completed: No Suspicious Activity Detected{runs}"
         body_html = f"""
         <p>Network security scan has completed. <strong>No suspicious network flows</strong> were detected out of {num_total} total flows analyzed.</p>
-        <p>The full prediction report has been saved to: <code>{predictions_csv}</code></p>
+        <p>The full prediction report has been saved to: <code>{reports[-1].predictions_csv}</code></p>
         """
-        send_prediction_results_email(subject, body_html)
\ No newline at end of file
+    if len(reports) > 1:
+        body_html += "<h3>Scans:</h3><ul>" + "".join(
+            f"<li>{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(report.finished_at))}: "
+            f"{report.num_suspicious} suspicious of {report.num_total} flows</li>" for report in reports) + "</ul>"
+    return subject, body_html, sample
+
+
+class EmailNotificationWorker:
+    """
+    Sends prediction emails from a background thread so the pipeline never waits
+    on SMTP. Reports arriving within EMAIL_DEBOUNCE_SECONDS of the first pending
+    one (per settings) are merged into one digest email.
+    """
+    def __init__(self, debounce_seconds=None, queue_size=None):
+        self.debounce_seconds = config.EMAIL_DEBOUNCE_SECONDS if debounce_seconds is None else debounce_seconds
+        self.report_queue = queue.Queue(maxsize=queue_size or config.EMAIL_QUEUE_SIZE)
+        self.pending = {} # EmailSettings -> (deadline, [PredictionReport])
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self.send_seconds = 0.0
+        self._thread = threading.Thread(target=self._run, name="email-notifier", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def is_alive(self):
+        return self._thread.is_alive()
+
+    def submit(self, report, settings):
+        """Queues a report without blocking. Returns False if the queue is full."""
+        try:
+            self.report_queue.put_nowait((report, settings))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            logger.warning("Email notification queue is full; this run's report is not emailed.")
+            return False
+
+    def close(self, timeout=None):
+        """Sends the pending digests now, stops the thread and waits up to `timeout` seconds."""
+        if not self._thread.is_alive():
+            return
+        try:
+            self.report_queue.put(None, timeout=timeout)
+        except queue.Full:
+            logger.warning("Email notification queue did not drain in time; pending reports are discarded.")
+            return
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.warning("Email notification still being sent after the shutdown timeout; giving up on it.")
+
+    def _run(self):
+        while True:
+            next_deadline = min((deadline for deadline, _ in self.pending.values()), default=None)
+            # With nothing pending, wake up once the SMTP connection may have gone idle
+            wait = config.EMAIL_SMTP_IDLE_TIMEOUT if next_deadline is None else max(next_deadline - time.monotonic(), 0)
+            try:
+                item = self.report_queue.get(timeout=wait)
+            except queue.Empty:
+                item = ()
+            if item is None: # Shutdown
+                self._flush(force=True)
+                break
+            if item:
+                report, settings = item
+                deadline, reports = self.pending.setdefault(settings, (time.monotonic() + self.debounce_seconds, []))
+                reports.append(report)
+            self._flush()
+            if not self.pending:
+                _smtp_connection.close_if_idle()
+        _smtp_connection.close()
+
+    def _flush(self, force=False):
+        now = time.monotonic()
+        for settings in [settings for settings, (deadline, _) in self.pending.items() if force or deadline <= now]:
+            _, reports = self.pending.pop(settings)
+            subject, body_html, sample = build_report_email(reports)
+            started = time.perf_counter()
+            if send_prediction_results_email(subject, body_html, sample, settings):
+                self.sent += 1
+            else:
+                self.failed += 1
+            send_seconds = time.perf_counter() - started
+            self.send_seconds += send_seconds
+            logger.info(f"Email for {len(reports)} prediction run(s) handled in {send_seconds * 1000:.0f} ms, "
+                        f"{time.time() - reports[0].finished_at:.1f}s after the first run finished.")
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def get_email_worker():
+    """Returns the running EmailNotificationWorker, starting it if needed."""
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = EmailNotificationWorker().start()
+        return _worker
+
+
+def flush_email_notifications(timeout=None):
+    """Sends pending notifications now and stops the worker (waits up to EMAIL_SHUTDOWN_TIMEOUT)."""
+    global _worker
+    with _worker_lock:
+        worker, _worker = _worker, None
+    if worker is not None:
+        worker.close(config.EMAIL_SHUTDOWN_TIMEOUT if timeout is None else timeout)
+
+
+atexit.register(flush_email_notifications) # One-shot runs (main.py, run_prediction.py) deliver their email before exiting
+
+
+def notify_by_email_on_prediction_completion(all_flows_df, suspicious_flows_df, num_total=None, num_suspicious=None):
+    """
+    Prepares and sends an email notification based on prediction results. With
+    EMAIL_ASYNC_NOTIFICATIONS the email is queued for the background worker and
+    this returns immediately.
+    Args:
+        all_flows_df (pd.DataFrame): DataFrame containing all flows with their predictions (may be None if num_total is given).
+        suspicious_flows_df (pd.DataFrame): DataFrame containing only suspicious flows, or a sample of them.
+        num_total (int): Total flow count, for results written in chunks (defaults to len(all_flows_df)).
+        num_suspicious (int): Suspicious flow count when suspicious_flows_df is only a sample.
+    """
+    if num_suspicious is None:
+        num_suspicious = len(suspicious_flows_df)
+    if num_total is None:
+        num_total = len(all_flows_df)
+    settings = current_email_settings()
+    if settings is None:
+        return
+
+    # Define paths to output files, ensuring they are accessible from config
+    predictions_csv = config.PREDICTIONS_OUTPUT_CSV_PATH if hasattr(config, 'PREDICTIONS_OUTPUT_CSV_PATH') else "predictions.csv"
+    if config.RESULTS_DB_ENABLED and not config.PREDICTIONS_CSV_OUTPUT:
+        predictions_csv = config.RESULTS_DB_PATH # Every flow is in the results store instead
+    # Take a small sample for the email body (copied: the caller's frames may change before the email is sent)
+    email_sample_size = getattr(config, 'EMAIL_ALERT_SAMPLE_SIZE', 5)
+    sample = suspicious_flows_df.head(email_sample_size).copy() if num_suspicious > 0 else None
+    report = PredictionReport(time.time(), num_total, num_suspicious, sample, predictions_csv)
+
+    if not config.EMAIL_ASYNC_NOTIFICATIONS:
+        send_prediction_results_email(*build_report_email([report]), settings)
+        return
+    started = time.perf_counter()
+    if get_email_worker().submit(report, settings):
+        logger.info(f"Email notification queued in {(time.perf_counter() - started) * 1000:.1f} ms; "
+                    f"it is sent in the background.")
+
@@ -1,33 +1,312 @@
-from dotenv import load_dotenv
+# prediction_module/send_telegram_messege.py
+"""
+Telegram alerts for suspicious flows. process_attack_detection only queues the
+flows and returns; a background TelegramAlertDispatcher groups them per
+(Src IP, Prediction) into digest messages and sends those over one pooled HTTP
+session, rate limited by a token bucket.
+"""
+import atexit
+import logging
 import os
+import queue
+import threading
+import time
+
 import requests
+from dotenv import load_dotenv
+
+from . import config
+
 load_dotenv()
 
 bot_token = os.getenv("BOT_TOKEN")
 chat_id = os.getenv("CHAT_ID")
 
+# Flow columns carried by each queued alert
+ALERT_FIELDS = ('Timestamp', 'Flow ID', 'Src IP', 'Src Port', 'Dst IP', 'Dst Port', 'Protocol', 'Prediction')
+_STOP = object() # Queue sentinel: flush every digest and stop the worker
+
+
+class TokenBucket:
+    """Allows `rate` events per second on average, with bursts of up to `capacity`."""
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def acquire(self):
+        """Takes one token, sleeping until one is available."""
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            time.sleep((1 - self.tokens) / self.rate)
+
+
+class _Digest:
+    """Suspicious flows of one (Src IP, Prediction) collected during one digest window."""
+    __slots__ = ('src_ip', 'prediction', 'deadline', 'count', 'first', 'last', 'destinations')
+
+    def __init__(self, src_ip, prediction, deadline):
+        self.src_ip = src_ip
+        self.prediction = prediction
+        self.deadline = deadline
+        self.count = 0
+        self.first = None # Field tuple of the first flow
+        self.last = None
+        self.destinations = {} # "Dst IP:Dst Port" -> flows, insertion ordered
+
+    def add(self, alert):
+        self.count += 1
+        self.first = self.first or alert
+        self.last = alert
+        destination = f"{alert[4]}:{alert[5]}"
+        self.destinations[destination] = self.destinations.get(destination, 0) + 1
+
+
+def format_attack_message(alert):
+    """Message for a single suspicious flow (field tuple in ALERT_FIELDS order)."""
+    timestamp, flow_id, src_ip, src_port, dst_ip, dst_port, protocol, prediction = alert
+    message = "*Phát hiện dòng tấn công nghi ngờ!*\n\n"
+    message += f"Thời gian: {timestamp}\n"
+    message += f"Flow ID: {flow_id}\n"
+    message += f"Src: {src_ip}:{src_port}\n"
+    message += f"Dst: {dst_ip}:{dst_port}\n"
+    message += f"Protocol: {protocol}\n"
+    message += f"Prediction: {prediction}\n"
+    return message
+
+
+def format_digest_message(digest, max_destinations=5):
+    """Message summarizing every flow of a digest."""
+    if digest.count == 1:
+        return format_attack_message(digest.first)
+    message = f"*Phát hiện {digest.count} dòng tấn công nghi ngờ!*\n\n"
+    message += f"Prediction: {digest.prediction}\n"
+    message += f"Src IP: {digest.src_ip}\n"
+    message += f"Thời gian: {digest.first[0]} → {digest.last[0]}\n"
+    destinations = sorted(digest.destinations.items(), key=lambda item: -item[1])
+    message += "Dst: " + ", ".join(f"{destination} ({count})" for destination, count in destinations[:max_destinations])
+    if len(destinations) > max_destinations:
+        message += f" và {len(destinations) - max_destinations} đích khác"
+    return message + "\n"
+
+
+def format_overflow_message(digests):
+    """One message for the digests beyond TELEGRAM_MAX_MESSAGES_PER_FLUSH, counted per prediction."""
+    flows_per_prediction = {}
+    sources = set()
+    for digest in digests:
+        flows_per_prediction[digest.prediction] = flows_per_prediction.get(digest.prediction, 0) + digest.count
+        sources.add(digest.src_ip)
+    message = f"*Thêm {sum(flows_per_prediction.values())} dòng nghi ngờ từ {len(sources)} nguồn khác*\n\n"
+    for prediction, count in sorted(flows_per_prediction.items(), key=lambda item: -item[1]):
+        message += f"{prediction}: {count}\n"
+    return message
+
+
+class TelegramAlertDispatcher:
+    """
+    Sends Telegram alerts from a background thread so scoring and reporting never
+    wait on the network. Alerts go through a bounded queue (extra ones are dropped
+    and counted when it is full) and are coalesced per (Src IP, Prediction) for
+    `digest_window` seconds. At most `max_messages_per_flush` digests are sent per
+    window; the rest are summarized in one message. Requests share one
+    requests.Session, have a timeout, are paced by a token bucket and honour
+    Telegram's retry_after on HTTP 429.
+    """
+    def __init__(self, bot_token, chat_id, api_base=None, queue_size=None, digest_window=None,
+                 rate_per_second=None, burst=None, timeout=None, max_messages_per_flush=None):
+        self.bot_token = bot_token
+        self.chat_id = chat_id
+        self.api_url = f"{(api_base or config.TELEGRAM_API_BASE).rstrip('/')}/bot{bot_token}/sendMessage"
+        self.digest_window = config.TELEGRAM_DIGEST_WINDOW if digest_window is None else digest_window
+        self.timeout = timeout or config.TELEGRAM_HTTP_TIMEOUT
+        self.max_messages_per_flush = max_messages_per_flush or config.TELEGRAM_MAX_MESSAGES_PER_FLUSH
+        self.rate_limiter = TokenBucket(rate_per_second or config.TELEGRAM_RATE_PER_SECOND,
+                                        burst or config.TELEGRAM_BURST)
+        self.alert_queue = queue.Queue(maxsize=queue_size or config.TELEGRAM_QUEUE_SIZE)
+        self.session = requests.Session()
+        self.session.mount('https://', requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        self.session.mount('http://', requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        self.digests = {} # (Src IP, Prediction) -> _Digest, oldest first
+        self.queued = 0
+        self.dropped = 0
+        self.sent = 0
+        self.failed = 0
+        self._thread = threading.Thread(target=self._run, name="telegram-alerts", daemon=True)
+
+    def start(self):
+        """Starts the sender thread."""
+        self._thread.start()
+        return self
+
+    def is_alive(self):
+        return self._thread.is_alive()
+
+    def submit(self, suspicious_df):
+        """
+        Queues the suspicious flows of a DataFrame without blocking.
+
+        Returns:
+            Number of flows queued (the rest were dropped because the queue is full).
+        """
+        queued = 0
+        for alert in suspicious_df.reindex(columns=list(ALERT_FIELDS)).itertuples(index=False, name=None):
+            try:
+                self.alert_queue.put_nowait(alert)
+                queued += 1
+            except queue.Full:
+                break
+        dropped = len(suspicious_df) - queued
+        self.queued += queued
+        if dropped:
+            self.dropped += dropped
+            logging.warning(f"Telegram alert queue is full: {dropped} suspicious flows not alerted "
+                            f"({self.dropped} dropped so far).")
+        return queued
+
+    def close(self, wait=True, timeout=None):
+        """
+        Sends the pending digests without waiting for their window, then stops the thread.
+
+        Args:
+            wait: Wait for the thread to finish (up to `timeout` seconds).
+            timeout: Seconds to wait; None waits until every digest was sent.
+        """
+        if not self._thread.is_alive():
+            return
+        try:
+            self.alert_queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            logging.warning("Telegram alert queue did not drain in time; pending alerts are discarded.")
+            return
+        if wait:
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                logging.warning("Telegram alerts still being sent after the shutdown timeout; giving up on them.")
+
+    def _run(self):
+        while True:
+            next_deadline = min((digest.deadline for digest in self.digests.values()), default=None)
+            wait = None if next_deadline is None else max(next_deadline - time.monotonic(), 0)
+            try:
+                alert = self.alert_queue.get(timeout=wait)
+            except queue.Empty:
+                alert = None
+            if alert is _STOP:
+                self._flush(force=True)
+                break
+            if alert is not None:
+                key = (alert[2], alert[7])
+                digest = self.digests.get(key)
+                if digest is None:
+                    digest = self.digests[key] = _Digest(alert[2], alert[7], time.monotonic() + self.digest_window)
+                digest.add(alert)
+            self._flush()
+        self.session.close()
+        logging.info(f"Telegram alerts: {self.queued} flows queued, {self.sent} messages sent, "
+                     f"{self.failed} failed, {self.dropped} flows dropped.")
+
+    def _flush(self, force=False):
+        """Sends the digests whose window has closed (all of them if force)."""
+        now = time.monotonic()
+        due = [key for key, digest in self.digests.items() if force or digest.deadline <= now]
+        if not due:
+            return
+        digests = sorted((self.digests.pop(key) for key in due), key=lambda digest: -digest.count)
+        if len(digests) > self.max_messages_per_flush:
+            messages = [format_digest_message(digest) for digest in digests[:self.max_messages_per_flush - 1]]
+            messages.append(format_overflow_message(digests[self.max_messages_per_flush - 1:]))
+        else:
+            messages = [format_digest_message(digest) for digest in digests]
+        for message in messages:
+            self.rate_limiter.acquire()
+            if self._send(message):
+                self.sent += 1
+            else:
+                self.failed += 1
+
+    def _send(self, message):
+        for _ in range(config.TELEGRAM_MAX_RETRIES + 1):
+            try:
+                response = self.session.post(self.api_url, data={'chat_id': self.chat_id, 'text': message},
+                                             timeout=self.timeout)
+                if response.status_code == 429: # Flood control: wait as long as Telegram asks
+                    try:
+                        retry_after = float(response.json().get('parameters', {}).get('retry_after', 1))
+                    except ValueError:
+                        retry_after = 1.0
+                    logging.warning(f"Telegram rate limit hit; retrying in {retry_after:.0f}s.")
+                    time.sleep(retry_after)
+                    continue
+                response.raise_for_status()
+                return True
+            except requests.exceptions.RequestException as e:
+                logging.error(f"Lỗi khi gửi tin nhắn Telegram: {e}")
+                return False
+        logging.error("Lỗi khi gửi tin nhắn Telegram: still rate limited after retries.")
+        return False
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_alert_dispatcher():
+    """
+    Returns the running dispatcher for the current bot_token/chat_id, starting
+    one if needed (server.py changes them per scan). None if Telegram is not configured.
+    """
+    global _dispatcher
+    with _dispatcher_lock:
+        if not bot_token or not chat_id:
+            return None
+        if _dispatcher is None or not _dispatcher.is_alive() or \
+                (_dispatcher.bot_token, _dispatcher.chat_id) != (bot_token, chat_id):
+            if _dispatcher is not None:
+                _dispatcher.close(wait=False, timeout=0) # Drains for the old chat in the background
+            _dispatcher = TelegramAlertDispatcher(bot_token, chat_id).start()
+        return _dispatcher
+
+
+def flush_alerts(timeout=None):
+    """Sends every pending alert now and stops the dispatcher (waits up to TELEGRAM_SHUTDOWN_TIMEOUT)."""
+    global _dispatcher
+    with _dispatcher_lock:
+        dispatcher, _dispatcher = _dispatcher, None
+    if dispatcher is not None:
+        dispatcher.close(timeout=config.TELEGRAM_SHUTDOWN_TIMEOUT if timeout is None else timeout)
+
+
+atexit.register(flush_alerts) # One-shot runs (main.py, run_prediction.py) deliver their digests before exiting
+
+
 def process_attack_detection(suspicious_df):
-    for _, attack_data in suspicious_df.iterrows():
-        message = "*Phát hiện dòng tấn công nghi ngờ!*\n\n"
-        message += f"Thời gian: {attack_data['Timestamp']}\n"
-        message += f"Flow ID: {attack_data['Flow ID']}\n"
-        message += f"Src: {attack_data['Src IP']}:{attack_data['Src Port']}\n"
-        message += f"Dst: {attack_data['Dst IP']}:{attack_data['Dst Port']}\n"
-        message += f"Protocol: {attack_data['Protocol']}\n"
-        message += f"Prediction: {attack_data['Prediction']}\n"
-
-        send_telegram_message(bot_token, chat_id, message)
-
-    
+    """Queues Telegram alerts for the suspicious flows and returns immediately."""
+    if suspicious_df is None or suspicious_df.empty:
+        return
+    dispatcher = get_alert_dispatcher()
+    if dispatcher is None:
+        logging.warning("Telegram BOT_TOKEN/CHAT_ID not configured. Skipping Telegram alerts.")
+        return
+    dispatcher.submit(suspicious_df)
+
+
 def send_telegram_message(bot_token, chat_id, message):
-    api_url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
-    params = {
-        'chat_id': chat_id,
-        'text': message
-    }
+    """Sends one message right away (blocking). Alerts should go through process_attack_detection."""
+    api_url = f"{config.TELEGRAM_API_BASE.rstrip('/')}/bot{bot_token}/sendMessage"
     try:
-        response = requests.post(api_url, params=params)
-        response.raise_for_status()  # Báo lỗi nếu request không thành công
-        print("Tin nhắn Telegram đã được gửi thành công!")
+        response = requests.post(api_url, data={'chat_id': chat_id, 'text': message},
+                                 timeout=config.TELEGRAM_HTTP_TIMEOUT)
+        response.raise_for_status() # Báo lỗi nếu request không thành công
+        logging.info("Tin nhắn Telegram đã được gửi thành công!")
+        return True
     except requests.exceptions.RequestException as e:
-        print(f"Lỗi khi gửi tin nhắn Telegram: {e}")
\ No newline at end of file
+        logging.error(f"Lỗi khi gửi tin nhắn Telegram: {e}")
+        return False
+
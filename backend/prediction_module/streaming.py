@@ -0,0 +1,107 @@
+# prediction_module/streaming.py
+import logging
+import queue
+import threading
+import time
+
+import pandas as pd
+
+from . import config
+from .alert_suppression import suppress_alerts
+from .feature_engineer import create_feature_engine
+from .run_prediction import score_flows
+from .reporter import ChunkedResultWriter, suspicious_mask
+from .send_telegram_messege import process_attack_detection
+
+ALERT_DISPLAY_COLS = ['Timestamp', 'Flow ID', 'Src IP', 'Src Port', 'Dst IP', 'Dst Port', 'Protocol', 'Prediction']
+
+
+class StreamingPredictor:
+    """
+    Scores flows while the capture is still running. The capture side puts
+    micro-batches (dicts of column lists, see capture_module.flow_sink.QueueFlowSink)
+    on `batch_queue`; a background thread scores each batch with the already
+    loaded model and scaler, reports suspicious flows right away and appends
+    the batch to the scan's results (see reporter.ChunkedResultWriter), so
+    only counts and incident aggregates are kept for the whole capture.
+    """
+    def __init__(self, model, scaler, expected_features, fieldnames, report_latency=True, on_suspicious=None):
+        self.model = model
+        self.scaler = scaler
+        self.expected_features = expected_features
+        self.fieldnames = list(fieldnames)
+        self.report_latency = report_latency # Meaningless when replaying an old capture file
+        self.on_suspicious = on_suspicious # Optional callback(DataFrame) for each batch with new/escalated incidents
+        self.batch_queue = queue.Queue(maxsize=config.STREAM_QUEUE_DEPTH)
+        self.results = None # ChunkedResultWriter, created with the first scored batch
+        self.flows_scored = 0
+        self.suspicious_count = 0
+        self.failed_batches = 0
+        self.feature_engine = create_feature_engine() # Per-source rolling state across micro-batches
+        self._thread = threading.Thread(target=self._run, name="stream-scorer", daemon=True)
+
+    def start(self):
+        """Starts the scoring thread."""
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while True:
+            columns = self.batch_queue.get()
+            if columns is None: # End of capture
+                break
+            try:
+                self._score_batch(pd.DataFrame(columns, columns=self.fieldnames))
+            except Exception as e:
+                self.failed_batches += 1
+                logging.error(f"Error scoring streamed flow batch: {e}", exc_info=True)
+
+    def _score_batch(self, df):
+        started = time.perf_counter()
+        predictions, probabilities = score_flows(df, self.model, self.scaler, self.expected_features, self.feature_engine)
+        if predictions is None or len(predictions) != len(df):
+            self.failed_batches += 1
+            logging.error(f"Scoring a streamed batch of {len(df)} flows failed; the batch is skipped.")
+            return
+        df['Prediction'] = predictions
+        self.flows_scored += len(df)
+
+        suspicious = df[suspicious_mask(df['Prediction'])]
+        self.suspicious_count += len(suspicious)
+        message = f"Scored {len(df)} streamed flows in {(time.perf_counter() - started) * 1000:.1f} ms: {len(suspicious)} suspicious"
+        if self.report_latency:
+            # Flow 'Timestamp' is when its last packet was seen: the delay since then is the detection latency
+            last_seen = pd.to_datetime(df['Timestamp'], errors='coerce').max()
+            if pd.notna(last_seen):
+                message += f", newest flow ended {(pd.Timestamp.now() - last_seen).total_seconds():.1f}s ago"
+        logging.info(message + ".")
+        # Only new or escalated incidents are printed and alerted (see ALERT_SUPPRESSION)
+        incidents = suppress_alerts(suspicious)
+        # Store the batch and fold it into the scan totals now; the flows themselves are not kept
+        if self.results is None:
+            self.results = ChunkedResultWriter()
+        self.results.add_chunk(df, probabilities)
+        if not incidents.empty:
+            display_cols = [col for col in ALERT_DISPLAY_COLS + ['Hit Count'] if col in incidents.columns]
+            print(incidents[display_cols].to_string(index=False))
+            if config.STREAM_TELEGRAM_ALERTS:
+                process_attack_detection(incidents[display_cols])
+            if self.on_suspicious is not None:
+                self.on_suspicious(incidents)
+
+    def finish(self):
+        """
+        Waits for the remaining batches to be scored, then finishes the results
+        exactly like the batch pipeline (incident CSV, UI summary, email).
+
+        Returns:
+            True if every batch was scored, False otherwise.
+        """
+        self._thread.join()
+        logging.info(f"Streaming prediction finished: {self.flows_scored} flows scored, "
+                     f"{self.suspicious_count} suspicious, {self.failed_batches} failed batches.")
+        if self.results is not None:
+            self.results.finish()
+        else:
+            logging.warning("No flows were streamed to the predictor. Nothing to report.")
+        return self.failed_batches == 0
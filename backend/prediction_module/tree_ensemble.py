@@ -0,0 +1,269 @@
+# prediction_module/tree_ensemble.py
+"""
+Pure-NumPy evaluator for tree-ensemble classifiers (XGBoost and sklearn
+RandomForest / ExtraTrees). Models are exported once to flat node arrays in a
+.npz file, which loads without xgboost, sklearn or pickle.
+
+Usage (from backend/):
+    python -m prediction_module.tree_ensemble --export ../model/xgboost_model.npz
+    python -m prediction_module.tree_ensemble --export ../model/rf.npz --model dataset/working2/random_forest_model.pkl
+"""
+import argparse
+import json
+import logging
+import sys
+
+import numpy as np
+
+from . import config
+
+# Rows traversed at once are capped so the (rows x trees) node-index matrix stays near this many entries
+_MAX_BATCH_CELLS = 1 << 22
+
+# XGBoost objectives whose base_score is a probability (stored margin is its logit)
+_LOGISTIC_OBJECTIVES = ('binary:logistic', 'reg:logistic')
+
+
+class TreeEnsemble:
+    """
+    All trees of a classifier stored as flat node arrays (feature index,
+    threshold, left, right, leaf value). Leaves point to themselves, so a batch
+    is evaluated by stepping every (row, tree) node index max_depth times with
+    NumPy indexing.
+
+    kind is 'xgboost' (leaf values are margins summed per class group, then
+    softmax/sigmoid) or 'forest' (leaf values are class probabilities averaged
+    over the trees).
+    """
+    ARRAYS = ('feature', 'threshold', 'left', 'right', 'default_left', 'value', 'roots', 'tree_group', 'classes')
+
+    def __init__(self, kind, objective, feature, threshold, left, right, default_left, value, roots,
+                 tree_group, classes, num_features, base_margin=0.0, max_depth=None):
+        self.kind = kind
+        self.num_features = int(num_features)
+        self.objective = objective
+        self.feature = np.asarray(feature, dtype=np.int32)
+        self.threshold = np.asarray(threshold, dtype=np.float64)
+        self.left = np.asarray(left, dtype=np.int32)
+        self.right = np.asarray(right, dtype=np.int32)
+        self.default_left = np.asarray(default_left, dtype=bool)
+        self.value = np.asarray(value, dtype=np.float32 if kind == 'xgboost' else np.float64)
+        self.roots = np.asarray(roots, dtype=np.int32)
+        self.tree_group = np.asarray(tree_group, dtype=np.int32)
+        self.classes_ = _portable_classes(classes)
+        self.base_margin = float(base_margin)
+        self.max_depth = int(max_depth) if max_depth is not None else self._depth()
+
+    @property
+    def nbytes(self):
+        """Memory held by the node arrays."""
+        return sum(getattr(self, name if name != 'classes' else 'classes_').nbytes for name in self.ARRAYS)
+
+    def _depth(self):
+        depth = 0
+        nodes = self.roots
+        while True:
+            internal = nodes[self.left[nodes] != nodes]
+            if not len(internal):
+                return depth
+            nodes = np.concatenate((self.left[internal], self.right[internal]))
+            depth += 1
+
+    def _leaves(self, X):
+        """Returns the leaf node index reached in every tree, shape (rows, trees)."""
+        nodes = np.broadcast_to(self.roots, (len(X), len(self.roots))).copy()
+        row_offsets = (np.arange(len(X), dtype=np.intp) * X.shape[1])[:, None]
+        X_flat = X.ravel()
+        for _ in range(self.max_depth):
+            x = X_flat[row_offsets + self.feature[nodes]]
+            threshold = self.threshold[nodes]
+            # XGBoost splits on x < threshold, sklearn on x <= threshold; missing values follow default_left
+            go_left = x < threshold if self.kind == 'xgboost' else x <= threshold
+            missing = np.isnan(x)
+            if missing.any():
+                go_left = np.where(missing, self.default_left[nodes], go_left)
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        return nodes
+
+    def predict_proba(self, X):
+        """Returns class probabilities, shape (rows, classes)."""
+        # Both libraries compare float32 features (sklearn against float64 thresholds)
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        batch_rows = max(1, _MAX_BATCH_CELLS // max(1, len(self.roots)))
+        return np.concatenate([self._predict_proba_batch(X[start:start + batch_rows])
+                               for start in range(0, len(X), batch_rows)] or [self._predict_proba_batch(X)])
+
+    def _predict_proba_batch(self, X):
+        leaf_values = self.value[self._leaves(X)] # (rows, trees) or (rows, trees, classes)
+        if self.kind == 'forest':
+            return leaf_values.mean(axis=1)
+        num_groups = int(self.tree_group.max()) + 1
+        margin = np.full((len(X), num_groups), self.base_margin, dtype=np.float32)
+        for group in range(num_groups):
+            margin[:, group] += leaf_values[:, self.tree_group == group].sum(axis=1, dtype=np.float32)
+        if num_groups == 1: # Binary logistic
+            positive = 1.0 / (1.0 + np.exp(-margin[:, 0]))
+            return np.column_stack((1.0 - positive, positive))
+        margin -= margin.max(axis=1, keepdims=True)
+        exp_margin = np.exp(margin)
+        return exp_margin / exp_margin.sum(axis=1, keepdims=True)
+
+    def predict(self, X):
+        """Returns class labels (entries of classes_)."""
+        return self.classes_.take(np.argmax(self.predict_proba(X), axis=1))
+
+    def save(self, path):
+        """Writes the node arrays to an .npz file (no pickled objects)."""
+        meta = {'kind': self.kind, 'objective': self.objective, 'num_features': self.num_features,
+                'base_margin': self.base_margin, 'max_depth': self.max_depth}
+        np.savez(path, meta=np.array(json.dumps(meta)),
+                 **{name: getattr(self, name if name != 'classes' else 'classes_') for name in self.ARRAYS})
+
+    @classmethod
+    def load(cls, path):
+        """Reads a TreeEnsemble written by save()."""
+        with np.load(path, allow_pickle=False) as arrays:
+            meta = json.loads(str(arrays['meta']))
+            return cls(meta['kind'], meta['objective'], *(arrays[name] for name in cls.ARRAYS),
+                       num_features=meta['num_features'], base_margin=meta['base_margin'], max_depth=meta['max_depth'])
+
+
+def _portable_classes(classes):
+    """
+    Returns the class labels as a numeric or fixed-width unicode array, which
+    np.savez stores without pickling (a forest fit on a pandas string column
+    has object-dtype classes_).
+
+    Raises:
+        ValueError: If the labels cannot be stored that way without changing them.
+    """
+    classes = np.asarray(classes)
+    if classes.dtype.kind != 'O':
+        return classes
+    labels = classes.tolist()
+    converted = np.asarray(labels)
+    if converted.dtype.kind not in 'biufU' or converted.tolist() != labels:
+        raise ValueError(f"Class labels {labels!r} cannot be stored without pickling; "
+                         "use all-string or all-numeric labels.")
+    return converted
+
+
+def _from_xgboost(model):
+    booster = model.get_booster()
+    learner = json.loads(booster.save_raw('json'))['learner']
+    objective = learner['objective']['name']
+    gbtree = learner['gradient_booster']
+    if 'model' not in gbtree: # dart wraps the gbtree
+        gbtree = gbtree['gbtree']
+    trees = gbtree['model']['trees']
+    base_score = float(learner['learner_model_param']['base_score'].strip('[]'))
+    base_margin = np.log(base_score / (1 - base_score)) if objective in _LOGISTIC_OBJECTIVES else base_score
+
+    feature, threshold, left, right, default_left, value, roots = [], [], [], [], [], [], []
+    for tree in trees:
+        if any(tree['split_type']):
+            raise ValueError("Categorical splits are not supported.")
+        offset = len(feature)
+        roots.append(offset)
+        for node, left_child in enumerate(tree['left_children']):
+            is_leaf = left_child == -1
+            feature.append(0 if is_leaf else tree['split_indices'][node])
+            threshold.append(0.0 if is_leaf else np.float32(tree['split_conditions'][node]))
+            left.append(offset + node if is_leaf else offset + left_child)
+            right.append(offset + node if is_leaf else offset + tree['right_children'][node])
+            default_left.append(bool(tree['default_left'][node]))
+            value.append(tree['split_conditions'][node] if is_leaf else 0.0)
+    classes = getattr(model, 'classes_', None)
+    if classes is None:
+        classes = np.arange(max(int(learner['learner_model_param']['num_class']), 2))
+    return TreeEnsemble('xgboost', objective, feature, threshold, left, right, default_left, value, roots,
+                        gbtree['model']['tree_info'], classes, booster.num_features(), base_margin)
+
+
+def _from_forest(model):
+    feature, threshold, left, right, default_left, value, roots = [], [], [], [], [], [], []
+    offset = 0
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        roots.append(offset)
+        nodes = np.arange(tree.node_count)
+        is_leaf = tree.children_left == -1
+        feature.append(np.where(is_leaf, 0, tree.feature))
+        threshold.append(np.where(is_leaf, 0.0, tree.threshold))
+        left.append(offset + np.where(is_leaf, nodes, tree.children_left))
+        right.append(offset + np.where(is_leaf, nodes, tree.children_right))
+        default_left.append(getattr(tree, 'missing_go_to_left', np.zeros(tree.node_count, dtype=bool)).astype(bool))
+        counts = tree.value[:, 0, :] # Class counts (or fractions in newer sklearn) per node
+        value.append(counts / counts.sum(axis=1, keepdims=True))
+        offset += tree.node_count
+    return TreeEnsemble('forest', type(model).__name__, np.concatenate(feature), np.concatenate(threshold),
+                        np.concatenate(left), np.concatenate(right), np.concatenate(default_left),
+                        np.concatenate(value), roots, np.zeros(len(roots)), model.classes_, model.n_features_in_)
+
+
+def export_tree_ensemble(model):
+    """
+    Converts a fitted XGBoost classifier or sklearn forest classifier into a TreeEnsemble.
+
+    Raises:
+        ValueError: If the model type is not supported.
+    """
+    if hasattr(model, 'get_booster'):
+        return _from_xgboost(model)
+    if hasattr(model, 'estimators_') and hasattr(model.estimators_[0], 'tree_'):
+        if getattr(model, 'n_outputs_', 1) != 1:
+            raise ValueError("Multi-output forests are not supported.")
+        return _from_forest(model)
+    raise ValueError(f"Unsupported model type {type(model).__name__}: expected an XGBoost or sklearn forest classifier.")
+
+
+def compare_with_model(ensemble, model, X):
+    """
+    Compares the ensemble's outputs with the original model's on X.
+
+    Returns:
+        Tuple (number of rows with a different label, max absolute probability difference).
+    """
+    expected = model.predict_proba(X)
+    actual = ensemble.predict_proba(X)
+    differing = int(np.count_nonzero(np.argmax(expected, axis=1) != np.argmax(actual, axis=1)))
+    return differing, float(np.max(np.abs(expected - actual))) if len(X) else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a tree-ensemble model to NumPy node arrays (.npz).")
+    parser.add_argument('--export', metavar='PATH', required=True, help="Output .npz file.")
+    parser.add_argument('--model', metavar='PKL', help="Model to export (default: MODEL_PATH).")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING, format=config.LOGGING_FORMAT)
+
+    from .native_model import load_model_file
+    model = load_model_file(args.model or config.MODEL_PATH)
+    try:
+        ensemble = export_tree_ensemble(model)
+    except ValueError as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        return 1
+    ensemble.save(args.export)
+    print(f"Exported {len(ensemble.roots)} trees ({len(ensemble.feature)} nodes, max depth {ensemble.max_depth}, "
+          f"{ensemble.nbytes / 1e6:.1f} MB) to {args.export}")
+
+    # Check against the original model on rows made of split thresholds and the values just below them,
+    # so every feature sits on both sides of real decision boundaries whatever its scale
+    internal = ensemble.left != np.arange(len(ensemble.left))
+    rng = np.random.default_rng(0)
+    X = np.zeros((5000, ensemble.num_features), dtype=np.float32)
+    for feature in range(ensemble.num_features):
+        thresholds = ensemble.threshold[internal & (ensemble.feature == feature)].astype(np.float32)
+        if len(thresholds):
+            probes = np.concatenate((thresholds, np.nextafter(thresholds, np.float32(-np.inf)),
+                                     np.nextafter(thresholds, np.float32(np.inf))))
+            X[:, feature] = rng.choice(probes, size=len(X))
+    differing, max_difference = compare_with_model(ensemble, model, X)
+    print(f"Check on {len(X)} split-boundary rows: {differing} labels differ, "
+          f"max probability difference {max_difference:.2e}")
+    return 0 if differing == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,410 @@
+# backend/server.py
+import argparse
+import hmac
+import json
+import logging
+import os
+import secrets
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+try:
+    # Importing main also imports pandas, scapy and the model libraries once for the whole service
+    from main import main_pipeline
+    from capture_module.capture_manager import request_stop
+    from prediction_module import config as prediction_config
+    from prediction_module import send_email_notification, send_telegram_messege
+    from prediction_module.loader import load_model_scaler
+    from prediction_module.results_store import get_results_store
+    from prediction_module.run_prediction import run_prediction_pipeline
+except ImportError as e:
+    logging.error(f"Error importing modules in server.py: {e}", exc_info=True)
+    sys.exit(1)
+
+logger = logging.getLogger(__name__)
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Notification settings Electron passes for each scan (see AnalysisRunner.start in main.js), per notifier.
+# A notifier the scan sets nothing for falls back to the values the service started with (.env / environment).
+# Its keys are never mixed with startup values, so a scan cannot pair its own SMTP server or chat with the
+# stored password or bot token.
+NOTIFICATION_ENV_GROUPS = (
+    ('EMAIL_SENDER_ADDRESS', 'EMAIL_SENDER_PASSWORD', 'EMAIL_RECEIVER_ADDRESS', 'SMTP_SERVER', 'SMTP_PORT'),
+    ('BOT_TOKEN', 'CHAT_ID'),
+)
+NOTIFICATION_ENV_KEYS = tuple(key for group in NOTIFICATION_ENV_GROUPS for key in group)
+_startup_env = {key: os.environ.get(key) for key in NOTIFICATION_ENV_KEYS}
+
+
+def apply_notification_env(env):
+    """Applies one scan's notification settings to the environment and the notifier modules."""
+    for group in NOTIFICATION_ENV_GROUPS:
+        source = env if any(env.get(key) for key in group) else _startup_env
+        for key in group:
+            value = source.get(key)
+            if value:
+                os.environ[key] = str(value)
+            else:
+                os.environ.pop(key, None)
+    # Both notifier modules read their settings once at import time
+    send_email_notification.EMAIL_SENDER_ADDRESS = os.getenv("EMAIL_SENDER_ADDRESS")
+    send_email_notification.EMAIL_SENDER_PASSWORD = os.getenv("EMAIL_SENDER_PASSWORD")
+    send_email_notification.EMAIL_RECEIVER_ADDRESS = os.getenv("EMAIL_RECEIVER_ADDRESS")
+    send_email_notification.SMTP_SERVER = os.getenv("SMTP_SERVER", "smtp.gmail.com")
+    send_email_notification.SMTP_PORT = int(os.getenv("SMTP_PORT", 587))
+    send_telegram_messege.bot_token = os.getenv("BOT_TOKEN")
+    send_telegram_messege.chat_id = os.getenv("CHAT_ID")
+
+
+class ScanManager:
+    """
+    Runs one scan (capture + prediction) at a time in a background thread and keeps
+    its state and alerts. Scoring a flow file (/score) takes the same single slot:
+    runs share the result files, the results store scan and the alert suppressor.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.thread = None
+        self.scoring = False # A /score request is running in its handler thread
+        self.scan_id = 0
+        self.state = {'status': 'idle'}
+        self.alerts = []
+        self.stop_requested = False
+
+    def _scan_running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def is_running(self):
+        """True while a scan or a /score run is active."""
+        return self.scoring or self._scan_running()
+
+    def start(self, pcap_path=None, streaming=False, env=None):
+        """
+        Starts a scan unless one is already running.
+
+        Returns:
+            The new scan id, or None if a scan or /score run is already active.
+        """
+        with self.lock:
+            if self.is_running():
+                return None
+            self.scan_id += 1
+            self.alerts = []
+            self.stop_requested = False
+            self.state = {'scan_id': self.scan_id, 'status': 'running', 'pcap': pcap_path,
+                          'stream': streaming, 'started': time.time()}
+            self.thread = threading.Thread(target=self._run, args=(pcap_path, streaming, env or {}),
+                                           name=f"scan-{self.scan_id}", daemon=True)
+            self.thread.start()
+            return self.scan_id
+
+    def _run(self, pcap_path, streaming, env):
+        apply_notification_env(env)
+        try:
+            success = main_pipeline(pcap_path=pcap_path, streaming=streaming, on_suspicious=self._add_alerts)
+        except Exception as e:
+            logger.error(f"Scan {self.scan_id} failed: {e}", exc_info=True)
+            success = False
+        with self.lock:
+            finished = time.time()
+            status = 'stopped' if self.stop_requested else 'finished' if success else 'failed'
+            self.state.update(status=status, success=bool(success), finished=finished,
+                              duration=round(finished - self.state['started'], 3))
+        print(f"Scan {self.scan_id} {status}.", flush=True)
+
+    def _add_alerts(self, suspicious_df):
+        # Called from the streaming scorer for each batch that has suspicious flows
+        records = json.loads(suspicious_df.to_json(orient='records', date_format='iso'))
+        with self.lock:
+            self.alerts.extend(records)
+
+    def score(self, flows_path=None, data_format=None):
+        """
+        Scores an existing flow file in the calling thread, unless a run is already active.
+
+        Returns:
+            Tuple (success, seconds), or None if a scan or another /score run is active.
+        """
+        with self.lock: # Checked and claimed together, so two requests cannot both start
+            if self.is_running():
+                return None
+            self.scoring = True
+        try:
+            started = time.perf_counter()
+            success = run_prediction_pipeline(flows_path=flows_path, data_format=data_format)
+            return success, time.perf_counter() - started
+        finally:
+            with self.lock:
+                self.scoring = False
+
+    def stop(self):
+        """Asks the running scan to stop. Returns False if no scan is running."""
+        with self.lock:
+            if not self._scan_running():
+                return False
+            self.stop_requested = True
+        request_stop()
+        return True
+
+    def status(self):
+        with self.lock:
+            return dict(self.state, alerts=len(self.alerts))
+
+    def alerts_since(self, since):
+        with self.lock:
+            return self.alerts[since:], len(self.alerts), self.state.get('status')
+
+
+class BackendRequestHandler(BaseHTTPRequestHandler):
+    """
+    JSON API of the backend service:
+
+        GET  /health              service and model state
+        GET  /status              state of the current/last scan
+        GET  /alerts?since=N&wait=S
+                                  suspicious flows streamed by the current scan from index N,
+                                  waiting up to S seconds for new ones (long poll)
+        GET  /flows?page_size=N&before=CURSOR&src_ip=&dst_ip=&label=&scan_id=&since=&until=&suspicious=1&features=1
+                                  one page of stored flows, newest first; pass the returned 'next'
+                                  as `before` for the following page (results store)
+        GET  /scans?limit=N&status=finished
+                                  latest scan runs with their totals (results store)
+        POST /scan     {"pcap": path, "stream": bool, "env": {...}}
+                                  start a scan in the background
+        POST /stop                stop the running scan
+        POST /score    {"path": file, "format": "csv"|"parquet"|"arrow"}
+                                  score an existing flow file with the resident model
+        POST /shutdown            stop the service
+
+    Every request must carry the service token in the SERVICE_TOKEN_HEADER header
+    and a localhost Host; browser requests (a foreign Origin) are rejected, and POST
+    bodies must be application/json, so web pages cannot drive the service.
+    """
+    server_version = "APTDetectionBackend/1.0"
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, default=str).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _authorize(self, require_json=False):
+        """Sends an error response and returns False unless the request is from the service's own client."""
+        port = self.server.server_address[1]
+        local_hosts = {f"{host}:{port}" for host in ('127.0.0.1', 'localhost', self.server.server_address[0])}
+        origin = self.headers.get('Origin')
+        if self.headers.get('Host') not in local_hosts or (origin and origin.replace('http://', '', 1) not in local_hosts):
+            self._send_json(403, {'error': "Requests from other hosts or origins are not allowed."})
+            return False
+        token = self.headers.get(prediction_config.SERVICE_TOKEN_HEADER, '')
+        if not hmac.compare_digest(token.encode('utf-8'), self.server.token.encode('utf-8')):
+            self._send_json(401, {'error': "Missing or invalid service token."})
+            return False
+        content_type = self.headers.get('Content-Type', '').split(';')[0].strip().lower()
+        if require_json and content_type != 'application/json':
+            self._send_json(415, {'error': "Request body must be application/json."})
+            return False
+        return True
+
+    def _read_json(self):
+        """Returns the request's JSON object ({} without a body); raises ValueError for anything else."""
+        length = int(self.headers.get('Content-Length') or 0)
+        if not length:
+            return {}
+        body = json.loads(self.rfile.read(length).decode('utf-8'))
+        if not isinstance(body, dict):
+            raise ValueError(f"expected a JSON object, got {type(body).__name__}")
+        if not isinstance(body.get('env') or {}, dict):
+            raise ValueError("'env' must be a JSON object")
+        return body
+
+    def do_GET(self):
+        if not self._authorize():
+            return
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        scans = self.server.scans
+        if url.path == '/health':
+            model, _, _ = load_model_scaler()
+            self._send_json(200, {'status': 'ok', 'model_loaded': model is not None,
+                                  'uptime': round(time.time() - self.server.started, 1),
+                                  'scan_running': scans.is_running()})
+        elif url.path == '/status':
+            self._send_json(200, scans.status())
+        elif url.path == '/alerts':
+            since = int(query.get('since', ['0'])[0])
+            deadline = time.time() + min(float(query.get('wait', ['0'])[0]), 60.0)
+            alerts, total, status = scans.alerts_since(since)
+            while not alerts and status == 'running' and time.time() < deadline:
+                time.sleep(0.2)
+                alerts, total, status = scans.alerts_since(since)
+            self._send_json(200, {'alerts': alerts, 'next': total, 'status': status})
+        elif url.path in ('/flows', '/scans'):
+            store = get_results_store()
+            if store is None:
+                self._send_json(503, {'error': "The results store is disabled or could not be opened."})
+                return
+            param = lambda name, default=None: query.get(name, [default])[0]
+            try:
+                if url.path == '/flows':
+                    numeric = lambda name, kind=float: kind(param(name)) if param(name) else None
+                    page = store.query_flows(int(param('page_size', '100')), before=param('before'),
+                                             suspicious_only=param('suspicious') in ('1', 'true'),
+                                             include_features=param('features') in ('1', 'true'),
+                                             src_ip=param('src_ip'), dst_ip=param('dst_ip'), label=param('label'),
+                                             scan_id=numeric('scan_id', int), since=numeric('since'), until=numeric('until'))
+                    self._send_json(200, page)
+                else:
+                    self._send_json(200, {'scans': store.list_scans(int(param('limit', '20')), param('status'))})
+            except ValueError as e:
+                self._send_json(400, {'error': f"Invalid query: {e}"})
+        else:
+            self._send_json(404, {'error': f"Unknown endpoint {url.path}"})
+
+    def do_POST(self):
+        if not self._authorize(require_json=True):
+            return
+        url = urlparse(self.path)
+        try:
+            body = self._read_json()
+        except (ValueError, UnicodeDecodeError) as e:
+            self._send_json(400, {'error': f"Invalid JSON body: {e}"})
+            return
+        scans = self.server.scans
+        if url.path == '/scan':
+            scan_id = scans.start(pcap_path=body.get('pcap'), streaming=bool(body.get('stream')), env=body.get('env'))
+            if scan_id is None:
+                self._send_json(409, {'error': "A scan or scoring run is already active.", **scans.status()})
+            else:
+                self._send_json(202, {'scan_id': scan_id, 'status': 'running'})
+        elif url.path == '/stop':
+            self._send_json(200, {'stopping': scans.stop()})
+        elif url.path == '/score':
+            result = scans.score(flows_path=body.get('path'), data_format=body.get('format'))
+            if result is None:
+                self._send_json(409, {'error': "A scan or scoring run is already active; its results would be overwritten."})
+                return
+            success, duration = result
+            self._send_json(200 if success else 500, {'success': success, 'duration': round(duration, 4)})
+        elif url.path == '/shutdown':
+            self._send_json(200, {'status': 'shutting down'})
+            scans.stop()
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+        else:
+            self._send_json(404, {'error': f"Unknown endpoint {url.path}"})
+
+
+def create_server(host=None, port=None, token=None):
+    """
+    Creates the service with the model already loaded (port 0 picks a free port).
+    Clients must send `token`; it defaults to the SERVICE_TOKEN_ENV variable
+    (set by Electron for each launch), or a new random one.
+    """
+    model, scaler, expected_features = load_model_scaler()
+    if model is None:
+        logger.error("Model could not be loaded; /score and scans will fail until it is fixed.")
+    server = ThreadingHTTPServer((host or prediction_config.SERVICE_HOST,
+                                  prediction_config.SERVICE_PORT if port is None else port), BackendRequestHandler)
+    server.daemon_threads = True
+    server.scans = ScanManager()
+    server.started = time.time()
+    # Removed from the environment so capture/scan child processes do not inherit it
+    server.token = token or os.environ.pop(prediction_config.SERVICE_TOKEN_ENV, None) or secrets.token_hex(32)
+    return server
+
+
+def _request(base_url, token, path, payload=None):
+    """GET (payload None) or POST a JSON payload to the service with its token; returns the decoded reply."""
+    headers = {prediction_config.SERVICE_TOKEN_HEADER: token}
+    data = None
+    if payload is not None:
+        headers['Content-Type'] = 'application/json'
+        data = json.dumps(payload).encode('utf-8')
+    request = urllib.request.Request(base_url + path, data=data, headers=headers, method='POST' if data else 'GET')
+    with urllib.request.urlopen(request, timeout=600) as response:
+        return json.loads(response.read())
+
+
+def run_benchmark(flows_path=None, data_format=None, repeats=3):
+    """
+    Compares a fresh `python` process per scan (what Electron used to spawn) with
+    requests to a resident service, for startup alone and for scoring a flow file.
+    Scoring writes the usual results files.
+    """
+    score_args = f"flows_path={flows_path!r}, data_format={data_format!r}"
+    cold_startup_code = ("import main; from prediction_module.loader import load_model_scaler; "
+                         "load_model_scaler()")
+    cold_score_code = ("import main; from prediction_module.run_prediction import run_prediction_pipeline; "
+                       f"sys.exit(0 if run_prediction_pipeline({score_args}) else 1)")
+
+    def time_process(code):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, '-c', f"import sys; {code}"], cwd=BACKEND_DIR, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        return time.perf_counter() - started
+
+    server = create_server(port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://{server.server_address[0]}:{server.server_address[1]}"
+    logging.getLogger().setLevel(logging.WARNING) # Keep the per-request pipeline logs out of the table
+
+    results = {'cold startup': [], 'warm startup': [], 'cold score': [], 'warm score': []}
+    for _ in range(repeats):
+        results['cold startup'].append(time_process(cold_startup_code))
+        started = time.perf_counter()
+        _request(base_url, server.token, '/health')
+        results['warm startup'].append(time.perf_counter() - started)
+        results['cold score'].append(time_process(cold_score_code))
+        started = time.perf_counter()
+        _request(base_url, server.token, '/score', {'path': flows_path, 'format': data_format})
+        results['warm score'].append(time.perf_counter() - started)
+    server.shutdown()
+
+    print(f"{'':14}{'mean':>10}{'min':>10}  (seconds, {repeats} runs)")
+    for name, samples in results.items():
+        print(f"{name:14}{sum(samples) / len(samples):10.4f}{min(samples):10.4f}")
+    cold = sum(results['cold score']) / repeats
+    warm = sum(results['warm score']) / repeats
+    print(f"Warm scan is {cold / warm:.1f}x faster than starting a new process.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Long-running APT detection backend service (localhost JSON API).")
+    parser.add_argument('--host', default=None, help=f"Bind address (default {prediction_config.SERVICE_HOST}).")
+    parser.add_argument('--port', type=int, default=None, help=f"Port (default {prediction_config.SERVICE_PORT}).")
+    parser.add_argument('--benchmark', action='store_true',
+                        help="Compare cold (new process) and warm (resident service) latency, then exit.")
+    parser.add_argument('--flows', help="Flow file scored by --benchmark (default: the configured flow file).")
+    parser.add_argument('--format', help="Format of --flows: csv, parquet or arrow.")
+    parser.add_argument('--repeats', type=int, default=3, help="Runs per measurement for --benchmark.")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        run_benchmark(args.flows, args.format, args.repeats)
+        sys.exit(0)
+
+    token_from_env = bool(os.environ.get(prediction_config.SERVICE_TOKEN_ENV))
+    server = create_server(args.host, args.port)
+    host, port = server.server_address[:2]
+    print(f"Backend service listening on http://{host}:{port}", flush=True)
+    if not token_from_env: # Started by hand: the caller needs the generated token
+        print(f"Send header {prediction_config.SERVICE_TOKEN_HEADER}: {server.token}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.scans.stop()
+        server.server_close()
+        print("Backend service stopped.", flush=True)
@@ -0,0 +1,88 @@
+# backend/tests/test_alert_suppression.py
+import numpy as np
+import pandas as pd
+
+from prediction_module.alert_suppression import INCIDENT_COLUMNS, AlertSuppressor
+
+
+def _flows(*incidents):
+    """One flow per hit: incidents are (Src IP, Dst Port, Prediction, hits)."""
+    rows = [(src_ip, '192.168.1.10', dst_port, prediction)
+            for src_ip, dst_port, prediction, hits in incidents for _ in range(hits)]
+    df = pd.DataFrame(rows, columns=['Src IP', 'Dst IP', 'Dst Port', 'Prediction'])
+    df['Timestamp'] = [f'2024-01-01 00:00:{second:02d}' for second in range(len(df) % 60)] + \
+                      ['2024-01-01 00:01:00'] * (len(df) - len(df) % 60)
+    return df
+
+
+def _hit_counts(emitted):
+    return dict(zip(emitted['Src IP'], emitted['Hit Count']))
+
+
+def test_first_batch_emits_one_row_per_incident():
+    suppressor = AlertSuppressor()
+
+    emitted = suppressor.observe(_flows(('10.0.0.1', 22, 'SSH-Patator', 3), ('10.0.0.2', 80, 'DDoS', 1)), now=0)
+
+    assert list(emitted.columns[-len(INCIDENT_COLUMNS):]) == list(INCIDENT_COLUMNS)
+    assert _hit_counts(emitted) == {'10.0.0.1': 3, '10.0.0.2': 1}
+    assert emitted['First Seen'].tolist() == ['2024-01-01 00:00:00', '2024-01-01 00:00:03']
+    assert emitted['Last Seen'].tolist() == ['2024-01-01 00:00:02', '2024-01-01 00:00:03']
+    assert (suppressor.flows_seen, suppressor.rows_emitted) == (4, 2)
+
+
+def test_open_incident_is_suppressed_until_it_escalates():
+    suppressor = AlertSuppressor(escalation_factor=10)
+    suppressor.observe(_flows(('10.0.0.1', 22, 'SSH-Patator', 3)), now=0)
+
+    assert suppressor.observe(_flows(('10.0.0.1', 22, 'SSH-Patator', 26)), now=1).empty # 29 hits < 3 x 10
+    escalated = suppressor.observe(_flows(('10.0.0.1', 22, 'SSH-Patator', 1)), now=2) # 30 hits
+    assert _hit_counts(escalated) == {'10.0.0.1': 30}
+    assert escalated['First Seen'].tolist() == ['2024-01-01 00:00:00']
+    assert suppressor.observe(_flows(('10.0.0.1', 22, 'SSH-Patator', 269)), now=3).empty # 299 hits < 30 x 10
+
+
+def test_incident_idle_past_the_window_starts_over():
+    suppressor = AlertSuppressor(window_seconds=60)
+    suppressor.observe(_flows(('10.0.0.1', 22, 'SSH-Patator', 5)), now=0)
+
+    assert suppressor.observe(_flows(('10.0.0.1', 22, 'SSH-Patator', 1)), now=60).empty # Hits keep it open
+    reopened = suppressor.observe(_flows(('10.0.0.1', 22, 'SSH-Patator', 2)), now=121)
+
+    assert _hit_counts(reopened) == {'10.0.0.1': 2}
+    assert len(suppressor.incidents) == 1
+
+
+def test_least_recently_active_incident_is_evicted():
+    suppressor = AlertSuppressor(max_incidents=2)
+    suppressor.observe(_flows(('10.0.0.1', 22, 'SSH-Patator', 1), ('10.0.0.2', 22, 'SSH-Patator', 1)), now=0)
+    suppressor.observe(_flows(('10.0.0.1', 22, 'SSH-Patator', 1)), now=1) # 10.0.0.2 is now the oldest
+
+    suppressor.observe(_flows(('10.0.0.3', 22, 'SSH-Patator', 1)), now=2)
+
+    assert suppressor.evicted == 1
+    assert [key[0] for key in suppressor.incidents] == ['10.0.0.1', '10.0.0.3']
+    assert _hit_counts(suppressor.observe(_flows(('10.0.0.2', 22, 'SSH-Patator', 1)), now=3)) == {'10.0.0.2': 1}
+
+
+def test_missing_key_values_form_one_incident_across_batches():
+    suppressor = AlertSuppressor()
+    batch = _flows(('10.0.0.1', 22, 'PortScan', 2))
+    batch['Dst Port'] = [np.nan, float('nan')] # Distinct NaN objects
+
+    assert _hit_counts(suppressor.observe(batch, now=0)) == {'10.0.0.1': 2}
+    assert suppressor.observe(batch.copy(), now=1).empty
+    assert len(suppressor.incidents) == 1
+    assert next(iter(suppressor.incidents.values())).hits == 4
+
+
+def test_kept_rows_are_released_with_their_incidents():
+    suppressor = AlertSuppressor(window_seconds=60, max_incidents=3, keep_rows=True)
+    for batch in range(200):
+        suppressor.observe(_flows((f'10.0.{batch}.1', 22, 'SSH-Patator', batch % 4 + 1),
+                                  (f'10.0.{batch}.2', 80, 'DDoS', 1)), now=batch * 10)
+
+    assert sum(len(frame) for frame in suppressor._row_frames) <= 2 * len(suppressor.incidents) + 2
+    incidents = suppressor.incidents_frame()
+    assert incidents['Src IP'].tolist() == ['10.0.199.1', '10.0.198.2', '10.0.199.2']
+    assert incidents['Hit Count'].tolist() == [4, 1, 1]
@@ -0,0 +1,152 @@
+# backend/tests/test_email_notifier.py
+import socket
+import socketserver
+import threading
+import time
+from email import message_from_string
+from email.header import decode_header, make_header
+
+import pandas as pd
+import pytest
+
+from prediction_module import config
+from prediction_module import send_email_notification as notifier
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    """Minimal local SMTP server: accepts AUTH PLAIN and every message, optionally replying slowly."""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, reply_delay=0.0):
+        super().__init__(('127.0.0.1', 0), _SMTPSinkHandler)
+        self.reply_delay = reply_delay
+        self.connections = 0
+        self.messages = []
+        self.open_sockets = []
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def drop_connections(self):
+        """Closes every open client connection from the server side, like an idle timeout would."""
+        for sock in self.open_sockets:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        self.open_sockets.clear()
+
+    def wait_for_messages(self, count, timeout=5.0):
+        deadline = time.monotonic() + timeout
+        while len(self.messages) < count and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return len(self.messages)
+
+
+class _SMTPSinkHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        time.sleep(self.server.reply_delay)
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        self.server.connections += 1
+        self.server.open_sockets.append(self.connection)
+        self.reply("220 sink ESMTP")
+        while True:
+            line = self.rfile.readline().decode(errors='replace').strip()
+            command = line.split(' ', 1)[0].upper()
+            if not line or command == 'QUIT':
+                if line:
+                    self.reply("221 Bye")
+                return
+            if command == 'EHLO':
+                self.reply("250-sink")
+                self.reply("250 AUTH PLAIN")
+            elif command == 'AUTH':
+                self.reply("235 Authentication successful")
+            elif command == 'DATA':
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                lines = []
+                while (data_line := self.rfile.readline()) not in (b".\r\n", b""):
+                    lines.append(data_line)
+                self.server.messages.append(b"".join(lines).decode(errors='replace'))
+                self.reply("250 OK")
+            else: # HELO, MAIL, RCPT, RSET, NOOP
+                self.reply("250 OK")
+
+
+@pytest.fixture
+def smtp_sink(monkeypatch):
+    """Points the notifier at a local SMTP sink, with a fresh shared connection and worker."""
+    sink = SMTPSink()
+    threading.Thread(target=sink.serve_forever, daemon=True).start()
+    monkeypatch.setattr(notifier, 'EMAIL_SENDER_ADDRESS', 'ids@localhost')
+    monkeypatch.setattr(notifier, 'EMAIL_SENDER_PASSWORD', 'secret')
+    monkeypatch.setattr(notifier, 'EMAIL_RECEIVER_ADDRESS', 'admin@localhost')
+    monkeypatch.setattr(notifier, 'SMTP_SERVER', '127.0.0.1')
+    monkeypatch.setattr(notifier, 'SMTP_PORT', sink.port)
+    monkeypatch.setattr(notifier, '_smtp_connection', notifier.SMTPConnection())
+    monkeypatch.setattr(notifier, '_worker', None)
+    yield sink
+    notifier.flush_email_notifications(timeout=5)
+    notifier._smtp_connection.close()
+    sink.drop_connections()
+    sink.shutdown()
+    sink.server_close()
+
+
+def _subject(message):
+    return str(make_header(decode_header(message_from_string(message)['Subject'])))
+
+
+def _report(num_suspicious=0):
+    sample = pd.DataFrame({'Src IP': ['10.0.0.1'], 'Dst IP': ['10.0.0.2'], 'Prediction': ['PortScan']})
+    return notifier.PredictionReport(time.time(), 1000, num_suspicious, sample if num_suspicious else None, 'flows.csv')
+
+
+def test_reports_within_the_debounce_window_share_one_digest(smtp_sink):
+    settings = notifier.current_email_settings()
+    worker = notifier.EmailNotificationWorker(debounce_seconds=0.3).start()
+
+    for run in range(5):
+        assert worker.submit(_report(run), settings)
+    assert smtp_sink.wait_for_messages(1) == 1
+    time.sleep(0.5) # Past the window: nothing else is sent
+    worker.close(timeout=5)
+
+    assert (worker.sent, worker.failed) == (1, 0)
+    assert len(smtp_sink.messages) == 1
+    assert _subject(smtp_sink.messages[0]).endswith('in 5 scans')
+
+
+def test_smtp_connection_is_reused_and_reconnected_after_a_drop(smtp_sink):
+    settings = notifier.current_email_settings()
+    connection = notifier._smtp_connection
+
+    assert notifier.send_prediction_results_email('first', '<p>1</p>', settings=settings)
+    assert notifier.send_prediction_results_email('second', '<p>2</p>', settings=settings)
+    assert (connection.connects, smtp_sink.connections) == (1, 1)
+
+    smtp_sink.drop_connections()
+    assert notifier.send_prediction_results_email('third', '<p>3</p>', settings=settings)
+
+    assert len(smtp_sink.messages) == 3
+    assert (connection.connects, smtp_sink.connections) == (2, 2)
+
+
+def test_notification_returns_before_the_smtp_round_trip(smtp_sink, monkeypatch):
+    smtp_sink.reply_delay = 0.1 # Each SMTP reply takes 100 ms: a synchronous send would take about a second
+    monkeypatch.setattr(config, 'EMAIL_ASYNC_NOTIFICATIONS', True)
+    monkeypatch.setattr(config, 'EMAIL_DEBOUNCE_SECONDS', 0.0)
+    suspicious = pd.DataFrame({'Src IP': ['10.0.0.1'], 'Prediction': ['DDoS']})
+
+    started = time.perf_counter()
+    notifier.notify_by_email_on_prediction_completion(None, suspicious, num_total=10)
+    elapsed = time.perf_counter() - started
+
+    assert elapsed < 0.1
+    assert not smtp_sink.messages
+    notifier.flush_email_notifications(timeout=10)
+    assert len(smtp_sink.messages) == 1
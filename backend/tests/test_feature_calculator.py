@@ -0,0 +1,104 @@
+# backend/tests/test_feature_calculator.py
+import random
+import statistics
+from collections import OrderedDict
+
+import pytest
+
+from capture_module import config
+from capture_module.feature_calculator import calculate_final_features
+from capture_module.packet_decoder import TCP_ACK, TCP_PSH, PacketInfo
+from capture_module.packet_processor import update_flow
+
+CLIENT = ('10.0.0.1', 49152)
+SERVER = ('192.168.1.10', 443)
+
+
+@pytest.fixture(autouse=True)
+def single_record(monkeypatch):
+    monkeypatch.setattr(config, 'ACTIVE_TIMEOUT', 3600) # Keep the long replay in one flow record
+
+
+def _replay(num_packets, seed):
+    """
+    Replays one synthetic TCP flow through update_flow, recording every packet's
+    direction, length and time, and returns (features, recorded packets).
+    """
+    rng = random.Random(seed)
+    active_flows = OrderedDict()
+    packets = []
+    now_us = 1_700_000_000_000_000 # Integer microseconds, so recorded gaps are exact
+    for index in range(num_packets):
+        if index:
+            # Mostly sub-second gaps, with a few silences longer than ACTIVITY_TIMEOUT
+            now_us += rng.randint(6_000_000, 9_000_000) if rng.random() < 0.01 else rng.randint(1, 200_000)
+        forward = index == 0 or rng.random() < 0.6
+        (src_ip, src_port), (dst_ip, dst_port) = (CLIENT, SERVER) if forward else (SERVER, CLIENT)
+        length = rng.randint(40, 1500)
+        timestamp = now_us / 1_000_000
+        info = PacketInfo(src_ip, dst_ip, 6, src_port, dst_port, length, 40, TCP_ACK | TCP_PSH, 1024)
+        assert update_flow(info, timestamp, active_flows) is None
+        packets.append((forward, length, timestamp))
+    (key, flow_state), = active_flows.items()
+    return calculate_final_features(flow_state, key), packets
+
+
+def _reference_stats(values, prefix, suffixes=('Mean', 'Std', 'Max', 'Min')):
+    """Expected statistics from the recorded values (sample std/var, 0 when undefined)."""
+    computed = {
+        'Mean': statistics.fmean(values) if values else 0,
+        'Std': statistics.stdev(values) if len(values) > 1 else 0,
+        'Var': statistics.variance(values) if len(values) > 1 else 0,
+        'Max': max(values, default=0),
+        'Min': min(values, default=0),
+        'Tot': sum(values),
+    }
+    return {f'{prefix} {suffix}': computed[suffix] for suffix in suffixes}
+
+
+def _expected_features(packets):
+    lengths = [length for _, length, _ in packets]
+    fwd_lengths = [length for forward, length, _ in packets if forward]
+    bwd_lengths = [length for forward, length, _ in packets if not forward]
+    times = [timestamp for _, _, timestamp in packets]
+    iat = lambda stamps: [(later - earlier) * 1_000_000 for earlier, later in zip(stamps, stamps[1:])]
+
+    # Active/idle periods: silences longer than ACTIVITY_TIMEOUT end an active period
+    active, idle, active_start = [], [], times[0]
+    for earlier, later in zip(times, times[1:]):
+        if later - earlier > config.ACTIVITY_TIMEOUT:
+            if earlier > active_start:
+                active.append((earlier - active_start) * 1_000_000)
+            idle.append((later - earlier) * 1_000_000)
+            active_start = later
+    if times[-1] > active_start:
+        active.append((times[-1] - active_start) * 1_000_000)
+
+    expected = {}
+    expected.update(_reference_stats(fwd_lengths, 'Fwd Pkt Len'))
+    expected.update(_reference_stats(bwd_lengths, 'Bwd Pkt Len'))
+    expected.update(_reference_stats(lengths, 'Pkt Len', ('Mean', 'Std', 'Var', 'Max', 'Min')))
+    expected.update(_reference_stats(iat(times), 'Flow IAT'))
+    expected.update(_reference_stats(iat([t for (forward, _, t) in packets if forward]), 'Fwd IAT',
+                                     ('Tot', 'Mean', 'Std', 'Max', 'Min')))
+    expected.update(_reference_stats(iat([t for (forward, _, t) in packets if not forward]), 'Bwd IAT',
+                                     ('Tot', 'Mean', 'Std', 'Max', 'Min')))
+    expected.update(_reference_stats(active, 'Active'))
+    expected.update(_reference_stats(idle, 'Idle'))
+    expected.update({
+        'Tot Fwd Pkts': len(fwd_lengths), 'Tot Bwd Pkts': len(bwd_lengths),
+        'TotLen Fwd Pkts': sum(fwd_lengths), 'TotLen Bwd Pkts': sum(bwd_lengths),
+        'Flow Duration': (times[-1] - times[0]) * 1_000_000,
+    })
+    return expected
+
+
+@pytest.mark.parametrize('num_packets, seed', [(1, 0), (2, 1), (40, 2), (3000, 3)])
+def test_running_statistics_match_recorded_packets(num_packets, seed):
+    features, packets = _replay(num_packets, seed)
+
+    expected = _expected_features(packets)
+
+    assert {name: features[name] for name in expected} == pytest.approx(expected, rel=1e-9, abs=1e-6)
+    if num_packets > 1000:
+        assert expected['Idle Mean'] > 0 and expected['Active Std'] > 0 # The long flow has several active periods
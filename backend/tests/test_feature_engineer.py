@@ -0,0 +1,92 @@
+# backend/tests/test_feature_engineer.py
+import numpy as np
+import pandas as pd
+import pytest
+
+from prediction_module import config
+from prediction_module.feature_engineer import RollingFeatureEngine, calculate_dynamic_features
+
+WINDOW_MINUTES = 2
+ROLL_COUNT = f'flow_count_roll{WINDOW_MINUTES}m_src'
+ROLL_SUM = f'sum_fwd_pkts_roll{WINDOW_MINUTES}m_src'
+FEATURES = ['time_since_last_flow_src_sec', ROLL_COUNT, ROLL_SUM]
+
+
+@pytest.fixture(autouse=True)
+def rolling_config(monkeypatch):
+    monkeypatch.setattr(config, 'CALCULATE_DYNAMIC_FEATURES', True)
+    monkeypatch.setattr(config, 'ROLLING_WINDOW_MINUTES', WINDOW_MINUTES)
+    monkeypatch.setattr(config, 'EXPECTED_FEATURES', ['Dst Port', ROLL_COUNT, ROLL_SUM])
+
+
+def _flows(rows=600, seed=0):
+    """Flows of a few sources over ten minutes, in shuffled order, with many whole-second timestamp ties."""
+    rng = np.random.default_rng(seed)
+    seconds = np.sort(rng.integers(0, 600, rows))
+    df = pd.DataFrame({
+        'Src IP': rng.choice(['10.0.0.1', '10.0.0.2', '10.0.0.3', '10.0.0.4'], rows),
+        'Timestamp': pd.Timestamp('2024-01-01') + pd.to_timedelta(seconds, unit='s'),
+        'Total Fwd Packets': rng.integers(1, 50, rows),
+    })
+    return df.sample(frac=1, random_state=seed).reset_index(drop=True)
+
+
+def _batch_reference(df):
+    """The batch computation the engine replaced: groupby diff and time-based rolling(closed='left')."""
+    ordered = df.sort_values('Timestamp', kind='stable')
+    reference = pd.DataFrame(0.0, index=df.index, columns=FEATURES)
+    reference[FEATURES[0]] = ordered.groupby('Src IP')['Timestamp'].diff().dt.total_seconds().fillna(0).clip(lower=0)
+    for _, group in ordered.groupby('Src IP'):
+        rolling = group.set_index('Timestamp')['Total Fwd Packets'].rolling(f'{WINDOW_MINUTES}min', closed='left')
+        reference.loc[group.index, ROLL_COUNT] = rolling.count().fillna(0).to_numpy()
+        reference.loc[group.index, ROLL_SUM] = rolling.sum().fillna(0).to_numpy()
+    return reference.to_numpy()
+
+
+def _features(df, engine=None):
+    return calculate_dynamic_features(df.copy(), 'Timestamp', {}, engine=engine)[FEATURES].to_numpy()
+
+
+def test_one_pass_matches_the_batch_computation():
+    df = _flows()
+    assert df['Timestamp'].duplicated().any()
+
+    np.testing.assert_array_equal(_features(df), _batch_reference(df))
+
+
+def test_state_carries_across_batches():
+    df = _flows(seed=1)
+    in_time_order = df.sort_values('Timestamp', kind='stable')
+    engine = RollingFeatureEngine(WINDOW_MINUTES * 60, max_sources=100, max_events=1000)
+
+    # Splits at row positions, so flows sharing a timestamp can land in different batches
+    batches = [_features(in_time_order.iloc[start:start + 97], engine) for start in range(0, len(df), 97)]
+
+    expected = pd.DataFrame(_batch_reference(df), index=df.index).loc[in_time_order.index].to_numpy()
+    np.testing.assert_array_equal(np.vstack(batches), expected)
+
+
+def test_late_flow_is_counted_against_the_held_window():
+    engine = RollingFeatureEngine(60, max_sources=10, max_events=100)
+    for second in (0, 10, 20, 30, 70):
+        engine.update('10.0.0.1', second * 10**9, 1.0)
+
+    # 25 s is older than the newest flow (70 s): its window [-35 s, 25 s) holds 0, 10 and 20 s,
+    # but 0 s already left the window [10 s, 70 s) of the newest flow and is no longer held
+    assert engine.update('10.0.0.1', 25 * 10**9, 5.0) == (0.0, 2, 2.0)
+    # Later flows see the late flow in place
+    assert engine.update('10.0.0.1', 80 * 10**9, 1.0) == (10.0, 4, 8.0) # 20, 25, 30 and 70 s are in [20 s, 80 s)
+
+
+def test_least_recently_active_source_is_evicted():
+    engine = RollingFeatureEngine(60, max_sources=2, max_events=100)
+    engine.update('10.0.0.1', 0, 1.0)
+    engine.update('10.0.0.2', 1 * 10**9, 1.0)
+    engine.update('10.0.0.1', 2 * 10**9, 1.0) # 10.0.0.2 is now the oldest
+
+    engine.update('10.0.0.3', 3 * 10**9, 1.0)
+
+    assert engine.evicted_sources == 1
+    assert list(engine.sources) == ['10.0.0.1', '10.0.0.3']
+    assert engine.update('10.0.0.2', 4 * 10**9, 1.0) == (0.0, 0, 0.0) # Starts over as a new source
+    assert engine.update('10.0.0.3', 5 * 10**9, 1.0) == (2.0, 1, 1.0) # Evicted 10.0.0.1 in turn, kept 10.0.0.3
@@ -0,0 +1,37 @@
+# backend/tests/test_loader.py
+import pandas as pd
+
+from prediction_module.loader import _read_csv
+
+
+def _write_flows(path, src_ports):
+    pd.DataFrame({
+        'Src IP': ['10.0.0.1'] * len(src_ports),
+        'Src Port': src_ports,
+        'Protocol': [6] * len(src_ports),
+        'Flow Duration': [1000] * len(src_ports),
+    }).to_csv(path, index=False)
+
+
+def test_chunked_csv_with_missing_integer_in_later_chunk(tmp_path):
+    path = tmp_path / 'flows.csv'
+    src_ports = [float(port) for port in range(1000, 1030)]
+    src_ports[25] = None
+    _write_flows(path, src_ports)
+
+    chunks = list(_read_csv(path, chunk_rows=10))
+
+    assert [len(chunk) for chunk in chunks] == [10, 10, 10]
+    assert [str(chunk['Src Port'].dtype) for chunk in chunks] == ['int32', 'int32', 'float32']
+    assert all(str(chunk['Protocol'].dtype) == 'int32' for chunk in chunks)
+    assert chunks[2]['Src Port'].isna().sum() == 1
+
+
+def test_csv_integer_out_of_int32_range_is_read_as_float(tmp_path):
+    path = tmp_path / 'flows.csv'
+    _write_flows(path, [80, 5_000_000_000])
+
+    df = _read_csv(path)
+
+    assert str(df['Src Port'].dtype) == 'float32'
+    assert df['Src Port'].iloc[1] == 5_000_000_000
@@ -0,0 +1,60 @@
+# backend/tests/test_model_fusion.py
+import copy
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.preprocessing import MinMaxScaler
+from xgboost import XGBClassifier
+
+from prediction_module.model_fusion import (build_validation_set, check_fusable, fuse_scaler_into_model,
+                                            verify_fused_model)
+
+FEATURES = ['Dst Port', 'Flow Duration', 'Flow Byts/s', 'Pkt Len Mean']
+
+
+@pytest.fixture(scope='module')
+def scaled_model():
+    rng = np.random.default_rng(3)
+    rows = 500
+    # Raw features on very different scales, like the real flow features
+    X_raw = pd.DataFrame({
+        'Dst Port': rng.integers(0, 65536, rows),
+        'Flow Duration': rng.exponential(1e6, rows),
+        'Flow Byts/s': rng.exponential(1e4, rows) - 50,
+        'Pkt Len Mean': rng.normal(500, 200, rows),
+    }).astype(np.float32)
+    y = ((X_raw['Dst Port'] < 1024) | (X_raw['Flow Byts/s'] > 2e4)).astype(int)
+    scaler = MinMaxScaler().fit(X_raw)
+    X_scaled = scaler.transform(X_raw).astype(np.float32)
+    model = XGBClassifier(n_estimators=15, max_depth=4).fit(X_scaled, y)
+    return model, scaler, X_raw.to_numpy()
+
+
+def test_fused_model_matches_scaler_and_model_on_boundary_probes(scaled_model):
+    model, scaler, X_raw = scaled_model
+
+    fused = fuse_scaler_into_model(model, scaler)
+    X = build_validation_set(model, scaler, fused, X_real=X_raw, num_rows=5000)
+
+    assert verify_fused_model(model, scaler, fused, X) == (True, 0)
+    # Outside the fitted range too: scaled values beyond [0, 1] must split the same way
+    X_outside = np.vstack([X_raw.min(axis=0) - 1e6, X_raw.max(axis=0) + 1e6]).astype(np.float32)
+    assert verify_fused_model(model, scaler, fused, X_outside) == (True, 0)
+
+
+def test_check_fusable_rejects_clipping_and_non_positive_scales(scaled_model):
+    model, scaler, _ = scaled_model
+    assert check_fusable(model, scaler) is None
+
+    clipping = copy.deepcopy(scaler)
+    clipping.clip = True
+    assert 'clip=True' in check_fusable(model, clipping)
+
+    for bad_scale in (0.0, -1.0):
+        flipped = copy.deepcopy(scaler)
+        flipped.scale_ = flipped.scale_.copy()
+        flipped.scale_[1] = bad_scale
+        assert 'non-positive' in check_fusable(model, flipped)
+        with pytest.raises(ValueError, match='non-positive'):
+            fuse_scaler_into_model(model, flipped)
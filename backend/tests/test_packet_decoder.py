@@ -0,0 +1,61 @@
+# backend/tests/test_packet_decoder.py
+from scapy.all import (ARP, ICMP, IP, IPOption_RR, IPv6, IPv6ExtHdrFragment, IPv6ExtHdrHopByHop,
+                       IPv6ExtHdrRouting, TCP, UDP, Dot1Q, Ether, Padding, fragment, raw, wrpcap)
+
+from capture_module.packet_decoder import PacketInfo, compare_decoders, decode_raw_packet
+
+
+def _frames():
+    eth = Ether(src='00:11:22:33:44:55', dst='66:77:88:99:aa:bb')
+    tcp = TCP(sport=49152, dport=443, flags='PA', window=1024) / (b'x' * 40)
+    udp = UDP(sport=5353, dport=53) / (b'q' * 20)
+    frames = [
+        eth / IP(src='10.0.0.1', dst='10.0.0.2') / tcp,
+        eth / IP(src='10.0.0.1', dst='10.0.0.2') / udp,
+        # IPv4 options: a 28-byte header instead of 20
+        eth / IP(src='10.0.0.1', dst='10.0.0.2', options=[IPOption_RR(routers=['1.2.3.4'])]) / tcp,
+        eth / IPv6(src='2001:db8::1', dst='2001:db8::2') / tcp,
+        eth / IPv6(src='2001:db8::1', dst='2001:db8::2') / udp,
+        # IPv6 extension headers before the transport header
+        eth / IPv6(src='2001:db8::1', dst='2001:db8::2') / IPv6ExtHdrHopByHop() / tcp,
+        eth / IPv6(src='2001:db8::1', dst='2001:db8::2') / IPv6ExtHdrRouting() / udp,
+        eth / IPv6(src='2001:db8::1', dst='2001:db8::2') / IPv6ExtHdrFragment(offset=0, m=1) / tcp,
+        # Single and double (QinQ) VLAN tags
+        eth / Dot1Q(vlan=10) / IP(src='10.0.1.1', dst='10.0.1.2') / tcp,
+        eth / Dot1Q(vlan=10) / IPv6(src='2001:db8::1', dst='2001:db8::2') / udp,
+        Ether(src='00:11:22:33:44:55', dst='66:77:88:99:aa:bb', type=0x88A8)
+        / Dot1Q(vlan=100) / Dot1Q(vlan=10) / IP(src='10.0.2.1', dst='10.0.2.2') / udp,
+        # Ethernet padding up to the 60-byte minimum frame
+        eth / IP(src='10.0.0.1', dst='10.0.0.2') / TCP(sport=49152, dport=80, flags='S') / Padding(b'\x00' * 6),
+        eth / IP(src='10.0.0.1', dst='10.0.0.2') / UDP(sport=1234, dport=5678) / Padding(b'\x00' * 18),
+        # Ignored by both decoders
+        eth / ARP(psrc='10.0.0.1', pdst='10.0.0.2'),
+        eth / IP(src='10.0.0.1', dst='10.0.0.2') / ICMP(),
+    ]
+    # IPv4 fragments: the first carries the TCP header, the others are skipped
+    frames += [eth / frag for frag in fragment(IP(src='10.0.3.1', dst='10.0.3.2') / TCP(sport=1, dport=2) / (b'f' * 120),
+                                               fragsize=48)]
+    return frames
+
+
+def test_raw_decoder_matches_scapy(tmp_path):
+    frames = _frames()
+    pcap_path = tmp_path / 'decoder_parity.pcap'
+    wrpcap(str(pcap_path), frames)
+
+    checked, mismatches = compare_decoders(str(pcap_path))
+
+    assert checked == len(frames)
+    assert mismatches == []
+
+
+def test_raw_decoder_reads_options_vlans_and_padding():
+    tcp = TCP(sport=49152, dport=443, flags='PA', window=1024)
+    with_options = Ether() / Dot1Q(vlan=100) / Dot1Q(vlan=10) / IP(
+        src='10.0.0.1', dst='10.0.0.2', options=[IPOption_RR(routers=['1.2.3.4'])]) / tcp
+    padded = Ether() / IP(src='10.0.0.1', dst='10.0.0.2') / UDP(sport=1234, dport=5678) / Padding(b'\x00' * 18)
+
+    assert decode_raw_packet(raw(with_options)) == PacketInfo(
+        '10.0.0.1', '10.0.0.2', 6, 49152, 443, len(with_options), 28 + 20, 0x18, 1024)
+    assert decode_raw_packet(raw(padded)) == PacketInfo(
+        '10.0.0.1', '10.0.0.2', 17, 1234, 5678, 60, 20 + 8, None, -1)
@@ -0,0 +1,56 @@
+# backend/tests/test_predictor.py
+import numpy as np
+import pandas as pd
+
+from prediction_module.predictor import align_features, get_alignment_plan
+
+EXPECTED_FEATURES = ['Dst Port', 'Flow Byts/s', 'Tot Fwd Pkts', 'Fwd Pkt Len Max', 'Flow IAT Mean']
+RENAMED_COLS_MAP = {'Flow Byts/s': 'Flow_Byts_s', 'Flow IAT Mean': 'Flow_IAT_Mean'}
+
+
+def _reference_alignment(df, expected_features, renamed_cols_map):
+    """Column-by-column selection the plan replaced: renamed lookup, 0 for missing, Inf/NaN -> 0."""
+    columns = {}
+    for name in expected_features:
+        cleaned_name = renamed_cols_map.get(name, name)
+        columns[name] = df[cleaned_name].astype(float) if cleaned_name in df.columns else 0.0
+    aligned = pd.DataFrame(columns, index=df.index).replace([np.inf, -np.inf], np.nan).fillna(0)
+    return aligned.to_numpy(dtype=np.float32)
+
+
+def _flows(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    # Reordered relative to EXPECTED_FEATURES, one renamed column, 'Fwd Pkt Len Max' missing, plus extras
+    df = pd.DataFrame({
+        'Src IP': ['10.0.0.1'] * rows,
+        'Flow_IAT_Mean': rng.random(rows) * 1e6,
+        'Tot Fwd Pkts': rng.integers(1, 100, rows).astype(np.int32),
+        'Dst Port': rng.integers(1, 65535, rows),
+        'Flow_Byts_s': rng.random(rows).astype(np.float32),
+        'Protocol': np.full(rows, 6),
+    })
+    df.loc[df.index[::7], 'Flow_Byts_s'] = np.inf
+    df.loc[df.index[::5], 'Flow_IAT_Mean'] = np.nan
+    return df
+
+
+def test_alignment_plan_matches_column_selection():
+    for rows, seed in ((200, 0), (50, 1), (300, 2)): # Grow, shrink and grow the reused buffer again
+        df = _flows(rows, seed)
+        aligned = align_features(df, EXPECTED_FEATURES, RENAMED_COLS_MAP)
+
+        assert list(aligned.columns) == EXPECTED_FEATURES
+        assert aligned.shape == (rows, len(EXPECTED_FEATURES))
+        assert (aligned.dtypes == np.float32).all()
+        np.testing.assert_array_equal(aligned.to_numpy(), _reference_alignment(df, EXPECTED_FEATURES, RENAMED_COLS_MAP))
+
+
+def test_alignment_plan_is_cached_and_fills_caller_buffer():
+    df = _flows(20).replace([np.inf, -np.inf], 0).fillna(0)
+    plan = get_alignment_plan(df, EXPECTED_FEATURES, RENAMED_COLS_MAP)
+    assert get_alignment_plan(_flows(30, 1), EXPECTED_FEATURES, RENAMED_COLS_MAP) is plan
+    assert plan.missing_features == ['Fwd Pkt Len Max']
+
+    out = np.full((len(df), len(EXPECTED_FEATURES)), -1, dtype=np.float32)
+    assert plan.apply(df, out) is out
+    np.testing.assert_array_equal(out, _reference_alignment(df, EXPECTED_FEATURES, RENAMED_COLS_MAP))
@@ -0,0 +1,50 @@
+# backend/tests/test_reporter.py
+import pandas as pd
+
+from prediction_module.reporter import ResultSummary, suspicious_mask
+
+
+def _flows(src_ips, dst_ips, predictions, categories):
+    """Flows with categorical IP columns, as the loader returns them."""
+    return pd.DataFrame({
+        'Src IP': pd.Categorical(src_ips, categories=categories),
+        'Dst IP': pd.Categorical(dst_ips, categories=categories),
+        'Protocol': [6] * len(predictions),
+        'TotLen Fwd Pkts': [100.0] * len(predictions),
+        'TotLen Bwd Pkts': [50.0] * len(predictions),
+        'Prediction': predictions,
+    })
+
+
+def test_summary_ignores_unobserved_ip_categories():
+    categories = ['10.0.0.1', '10.0.0.2', '172.16.0.3', '192.168.1.4', '8.8.8.8']
+    df = _flows(categories, list(reversed(categories)), ['Benign', 'Benign', 'PortScan', 'Benign', 'Benign'], categories)
+
+    summary = ResultSummary()
+    summary.add(df, suspicious_mask(df['Prediction']))
+    result = summary.to_dict()
+
+    assert result['totalThreats'] == 1
+    assert result['globalThreatMap']['activeAttacks'] == 1
+    assert result['globalThreatMap']['countries'] == 1
+    assert result['topSourceAPTIPs'] == {'172.16.0.3': 1}
+    assert result['topDestAPTIPs'] == {'172.16.0.3': 1}
+
+
+def test_summary_counts_across_chunks_with_categorical_ips():
+    categories = ['10.0.0.1', '10.0.0.2', '10.0.0.3']
+    chunks = [
+        _flows(['10.0.0.1', '10.0.0.2'], ['10.0.0.3', '10.0.0.3'], ['DDoS', 'Benign'], categories),
+        _flows(['10.0.0.1', '10.0.0.3'], ['10.0.0.2', '10.0.0.2'], ['DDoS', 'Benign'], categories),
+    ]
+
+    summary = ResultSummary()
+    for chunk in chunks:
+        summary.add(chunk, suspicious_mask(chunk['Prediction']))
+    result = summary.to_dict()
+
+    assert result['totalFlows'] == 4
+    assert result['topSourceAPTIPs'] == {'10.0.0.1': 2}
+    assert result['topDestAPTIPs'] == {'10.0.0.3': 1, '10.0.0.2': 1}
+    assert result['globalThreatMap']['activeAttacks'] == 1
+    assert result['aptTypeCounts'] == {'DDoS': 2}
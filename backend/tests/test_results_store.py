@@ -0,0 +1,106 @@
+# backend/tests/test_results_store.py
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from prediction_module import config
+from prediction_module.results_store import ResultsStore, flow_epoch_seconds
+
+
+@pytest.fixture
+def store(tmp_path):
+    results_store = ResultsStore(tmp_path / 'results.db')
+    yield results_store
+    results_store.close()
+
+
+@pytest.fixture
+def berlin_time(monkeypatch):
+    """Runs the test in a time zone with DST changes (local Timestamp strings depend on it)."""
+    monkeypatch.setenv('TZ', 'Europe/Berlin')
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def _flows(epochs, labels=None, src_ip='10.0.0.1'):
+    labels = labels or ['BENIGN'] * len(epochs)
+    return pd.DataFrame({
+        'Flow ID': [f'flow-{i}' for i in range(len(epochs))],
+        'Src IP': src_ip,
+        'Dst IP': '192.168.1.1',
+        'Dst Port': 443,
+        'Protocol': 6,
+        'Timestamp Epoch': np.asarray(epochs, dtype=np.float64),
+        'Prediction': labels,
+    })
+
+
+def _add_scan(store, epochs, labels=None, src_ip='10.0.0.1', started=None):
+    scan_id = store.begin_scan(started)
+    df = _flows(epochs, labels, src_ip)
+    store.add_flows(scan_id, df, df['Prediction'] != 'BENIGN')
+    return scan_id
+
+
+def test_local_timestamps_around_dst_changes_convert_to_epoch(berlin_time):
+    # Every minute from an hour before to two hours after the spring change, and of the hour
+    # after the autumn change's repeated hour (whose local times are ambiguous)
+    spring = 1711846800 # 2024-03-31 01:00 UTC: 02:00 CET -> 03:00 CEST
+    autumn = 1729990800 # 2024-10-27 01:00 UTC: 03:00 CEST -> 02:00 CET
+    epochs = np.concatenate([np.arange(spring - 3600, spring + 7200, 60), np.arange(autumn + 3600, autumn + 7200, 60)])
+    strings = [time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(epoch)) for epoch in epochs]
+    df = pd.DataFrame({'Timestamp': strings + ['not a time']})
+
+    seconds = flow_epoch_seconds(df, default=123.0)
+
+    np.testing.assert_array_equal(seconds[:-1], epochs)
+    assert seconds[-1] == 123.0
+
+
+def test_keyset_pages_cover_tied_timestamps_once(store):
+    epochs = [1000.0] * 7 + [999.0, 1001.0, 1001.0]
+    _add_scan(store, epochs)
+
+    seen, cursor = [], None
+    while True:
+        page = store.query_flows(page_size=3, before=cursor)
+        seen.extend((row['id'], row['Flow ID']) for row in page['rows'])
+        cursor = page['next']
+        if cursor is None:
+            break
+
+    assert len(seen) == len(epochs)
+    assert len(set(seen)) == len(epochs)
+    expected_order = sorted(range(len(epochs)), key=lambda i: (-epochs[i], -i))
+    assert [flow_id for _, flow_id in seen] == [f'flow-{i}' for i in expected_order]
+
+
+def test_query_filters_are_validated_and_combined(store):
+    _add_scan(store, [1000.0, 1001.0, 1002.0], ['BENIGN', 'PortScan', 'PortScan'], src_ip='10.0.0.1')
+    scan_id = _add_scan(store, [1003.0, 1004.0], ['DDoS', 'BENIGN'], src_ip='10.0.0.2')
+
+    with pytest.raises(ValueError, match='Unknown flow filter'):
+        store.query_flows(protocol=6)
+    assert len(store.query_flows(src_ip=None, label='')['rows']) == 5 # Empty filters are ignored
+    assert [row['Flow ID'] for row in store.query_flows(label='PortScan', since=1002.0)['rows']] == ['flow-2']
+    assert [row['Flow ID'] for row in store.query_flows(scan_id=scan_id, suspicious_only=True)['rows']] == ['flow-0']
+    assert [row['Flow ID'] for row in store.query_flows(src_ip='10.0.0.1', until=1001.0)['rows']] == ['flow-0']
+
+
+def test_retention_deletes_old_scans_in_batches(store, monkeypatch):
+    monkeypatch.setattr(config, 'RESULTS_DB_DELETE_BATCH_ROWS', 2)
+    now = time.time()
+    _add_scan(store, np.arange(5.0), started=now - 40 * 86400) # Never finished: aged by its start
+    # Stored recently although its flows are old (a replayed capture): kept
+    new_scan = _add_scan(store, np.arange(3.0), started=now)
+
+    flows_deleted, scans_deleted = store.apply_retention(max_age_days=30, now=now)
+
+    assert (flows_deleted, scans_deleted) == (5, 1)
+    assert [scan['id'] for scan in store.list_scans()] == [new_scan]
+    assert store.stats()['flows'] == 3
+    assert store.apply_retention(max_age_days=30, now=now) == (0, 0)
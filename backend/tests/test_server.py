@@ -0,0 +1,98 @@
+# backend/tests/test_server.py
+import http.client
+import json
+import threading
+
+import pytest
+
+import server as backend_server
+from prediction_module import config
+
+TOKEN = 'test-token'
+
+
+@pytest.fixture
+def service():
+    service = backend_server.create_server(port=0, token=TOKEN)
+    threading.Thread(target=service.serve_forever, daemon=True).start()
+    yield service
+    service.shutdown()
+    service.server_close()
+
+
+def _call(service, method, path, body=None, headers=None, token=TOKEN):
+    """Sends one request (a non-str body is JSON-encoded) and returns (status, decoded JSON reply)."""
+    host, port = service.server_address[:2]
+    request_headers = {'Host': f'{host}:{port}'}
+    if token is not None:
+        request_headers[config.SERVICE_TOKEN_HEADER] = token
+    if body is not None:
+        request_headers['Content-Type'] = 'application/json'
+        body = body if isinstance(body, str) else json.dumps(body)
+    request_headers.update(headers or {})
+    connection = http.client.HTTPConnection(host, port, timeout=10)
+    try:
+        connection.request(method, path, body=body, headers=request_headers)
+        response = connection.getresponse()
+        return response.status, json.loads(response.read())
+    finally:
+        connection.close()
+
+
+def test_requests_without_the_service_token_are_rejected(service):
+    assert _call(service, 'GET', '/status')[0] == 200
+    assert _call(service, 'GET', '/status', token=None)[0] == 401
+    assert _call(service, 'GET', '/status', token='wrong-token')[0] == 401
+    assert _call(service, 'POST', '/stop', {}, token=None)[0] == 401
+
+
+def test_foreign_hosts_and_origins_are_rejected(service):
+    port = service.server_address[1]
+    assert _call(service, 'GET', '/status', headers={'Host': f'localhost:{port}'})[0] == 200
+    assert _call(service, 'GET', '/status', headers={'Host': f'attacker.example:{port}'})[0] == 403 # DNS rebinding
+    assert _call(service, 'GET', '/status', headers={'Origin': 'http://attacker.example'})[0] == 403
+    assert _call(service, 'GET', '/status', headers={'Origin': f'http://127.0.0.1:{port}'})[0] == 200
+
+
+@pytest.mark.parametrize('body', ['[]', '"x"', '3', 'null', '{"env": ["BOT_TOKEN"]}', '{not json'])
+def test_post_body_must_be_a_json_object(service, body):
+    status, reply = _call(service, 'POST', '/scan', body)
+
+    assert status == 400
+    assert reply['error'].startswith('Invalid JSON body')
+    assert service.scans.status()['status'] == 'idle'
+
+
+def test_post_body_must_be_declared_as_json(service):
+    assert _call(service, 'POST', '/stop', '{}', headers={'Content-Type': 'text/plain'})[0] == 415
+
+
+def test_only_one_scan_or_scoring_run_at_a_time(service, monkeypatch):
+    release = threading.Event()
+    scoring_started = threading.Event()
+
+    def blocking_pipeline(**kwargs):
+        scoring_started.set()
+        return release.wait(10)
+
+    monkeypatch.setattr(backend_server, 'run_prediction_pipeline', blocking_pipeline)
+    monkeypatch.setattr(backend_server, 'main_pipeline', lambda **kwargs: release.wait(10))
+
+    first_score = []
+    thread = threading.Thread(target=lambda: first_score.append(_call(service, 'POST', '/score', {'path': 'flows.csv'})))
+    thread.start()
+    assert scoring_started.wait(10)
+    assert _call(service, 'POST', '/score', {'path': 'flows.csv'})[0] == 409
+    assert _call(service, 'POST', '/scan', {'pcap': 'capture.pcap'})[0] == 409
+    release.set()
+    thread.join(10)
+    assert first_score[0][0] == 200
+
+    release.clear()
+    status, reply = _call(service, 'POST', '/scan', {'pcap': 'capture.pcap'})
+    assert (status, reply['status']) == (202, 'running')
+    assert _call(service, 'POST', '/score', {'path': 'flows.csv'})[0] == 409
+    assert _call(service, 'POST', '/scan', {})[0] == 409
+    release.set()
+    service.scans.thread.join(10)
+    assert _call(service, 'GET', '/status')[1]['status'] == 'finished'
@@ -0,0 +1,110 @@
+# backend/tests/test_telegram_dispatcher.py
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+import pandas as pd
+import pytest
+
+from prediction_module.send_telegram_messege import TelegramAlertDispatcher
+
+
+class StubBotAPI(ThreadingHTTPServer):
+    """Local stand-in for the Bot API: records each sendMessage and replies with queued statuses (default 200)."""
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), _StubBotAPIHandler)
+        self.messages = [] # (client address, text)
+        self.statuses = [] # Status codes for the next requests, e.g. [429]
+
+    @property
+    def api_base(self):
+        return f"http://127.0.0.1:{self.server_port}"
+
+
+class _StubBotAPIHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1' # Keep-alive, so session reuse is visible in the client addresses
+
+    def do_POST(self):
+        form = parse_qs(self.rfile.read(int(self.headers.get('Content-Length', 0))).decode())
+        self.server.messages.append((self.client_address, form['text'][0]))
+        status = self.server.statuses.pop(0) if self.server.statuses else 200
+        reply = {'ok': status == 200}
+        if status == 429:
+            reply['parameters'] = {'retry_after': 0.2}
+        body = json.dumps(reply).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def bot_api():
+    server = StubBotAPI()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _dispatcher(bot_api, **options):
+    options = {'digest_window': 0.2, 'rate_per_second': 100, 'burst': 100, **options}
+    return TelegramAlertDispatcher('TEST', 'TEST', api_base=bot_api.api_base, **options)
+
+
+def _flows(num_flows, num_sources=3):
+    return pd.DataFrame({
+        'Timestamp': pd.date_range('2024-01-01', periods=num_flows, freq='s').astype(str),
+        'Flow ID': [f'flow-{i}' for i in range(num_flows)],
+        'Src IP': [f'10.0.0.{i % num_sources}' for i in range(num_flows)],
+        'Src Port': 40000,
+        'Dst IP': '192.168.1.10',
+        'Dst Port': [i % 7 for i in range(num_flows)],
+        'Protocol': 6,
+        'Prediction': ['PortScan' if i % 2 else 'DDoS' for i in range(num_flows)],
+    })
+
+
+def test_flows_are_coalesced_per_source_and_prediction(bot_api):
+    dispatcher = _dispatcher(bot_api).start()
+
+    started = time.perf_counter()
+    assert dispatcher.submit(_flows(600)) == 600
+    assert time.perf_counter() - started < 0.5 # Queued, not sent inline
+    dispatcher.close()
+
+    # 3 sources x 2 predictions, one digest each, over one pooled connection
+    assert dispatcher.sent == len(bot_api.messages) == 6
+    assert len({address for address, _ in bot_api.messages}) == 1
+    assert all(text.startswith('*Phát hiện 100 dòng') for _, text in bot_api.messages)
+    assert (dispatcher.failed, dispatcher.dropped) == (0, 0)
+
+
+def test_rate_limited_message_is_retried_after_retry_after(bot_api):
+    bot_api.statuses = [429]
+    dispatcher = _dispatcher(bot_api).start()
+
+    dispatcher.submit(_flows(1))
+    started = time.perf_counter()
+    dispatcher.close()
+
+    assert time.perf_counter() - started >= 0.2
+    assert len(bot_api.messages) == 2 # The rejected attempt, then the retry
+    assert (dispatcher.sent, dispatcher.failed) == (1, 0)
+
+
+def test_full_queue_drops_and_counts_flows(bot_api):
+    dispatcher = _dispatcher(bot_api, queue_size=5) # Not started yet: nothing drains the queue
+
+    assert dispatcher.submit(_flows(8)) == 5
+    assert dispatcher.submit(_flows(2)) == 0
+    assert (dispatcher.queued, dispatcher.dropped) == (5, 5)
+
+    dispatcher.start().close()
+    assert dispatcher.sent == len(bot_api.messages) == 5 # 5 flows over 3 sources x 2 predictions
@@ -0,0 +1,68 @@
+# backend/tests/test_tree_ensemble.py
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+from xgboost import XGBClassifier
+
+from prediction_module.tree_ensemble import TreeEnsemble, export_tree_ensemble
+
+
+def _dataset(num_classes, rows=400, features=6):
+    rng = np.random.default_rng(1)
+    X = rng.normal(size=(rows, features)).astype(np.float32)
+    y = (X[:, 0] * 2 + X[:, 1] - X[:, 2] > 0).astype(int)
+    if num_classes > 2:
+        y += (X[:, 3] > 0.5).astype(int)
+    X[rng.random(X.shape) < 0.05] = np.nan # Exercise the missing-value branches
+    return X, y
+
+
+def _round_trip(model, tmp_path):
+    path = tmp_path / 'model.npz'
+    export_tree_ensemble(model).save(path)
+    return TreeEnsemble.load(path)
+
+
+@pytest.mark.parametrize('num_classes', [2, 3])
+def test_xgboost_probabilities_match(tmp_path, num_classes):
+    X, y = _dataset(num_classes)
+    model = XGBClassifier(n_estimators=20, max_depth=4).fit(X, y)
+
+    ensemble = _round_trip(model, tmp_path)
+
+    np.testing.assert_allclose(ensemble.predict_proba(X), model.predict_proba(X), atol=1e-6)
+    np.testing.assert_array_equal(ensemble.predict(X), model.predict(X))
+
+
+def test_random_forest_probabilities_match(tmp_path):
+    X, y = _dataset(3)
+    X = np.nan_to_num(X)
+    model = RandomForestClassifier(n_estimators=5, max_depth=6, random_state=0).fit(X, y)
+
+    ensemble = _round_trip(model, tmp_path)
+
+    np.testing.assert_allclose(ensemble.predict_proba(X), model.predict_proba(X), atol=1e-12)
+    np.testing.assert_array_equal(ensemble.predict(X), model.predict(X))
+
+
+def test_random_forest_with_string_labels_round_trips(tmp_path):
+    X, y = _dataset(3)
+    X = np.nan_to_num(X)
+    labels = pd.Series(np.array(['BENIGN', 'DDoS', 'PortScan'], dtype=object)[y], name='Label')
+    model = RandomForestClassifier(n_estimators=5, max_depth=6, random_state=0).fit(X, labels)
+    assert model.classes_.dtype == object
+
+    ensemble = _round_trip(model, tmp_path)
+
+    np.testing.assert_allclose(ensemble.predict_proba(X), model.predict_proba(X), atol=1e-12)
+    assert ensemble.predict(X).tolist() == model.predict(X).tolist()
+
+
+def test_export_rejects_labels_that_need_pickling():
+    X, y = _dataset(2)
+    model = RandomForestClassifier(n_estimators=2, random_state=0).fit(np.nan_to_num(X), y)
+    model.classes_ = np.array([0, 'attack'], dtype=object)
+
+    with pytest.raises(ValueError, match='pickling'):
+        export_tree_ensemble(model)
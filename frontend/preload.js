@@ -10,6 +10,9 @@ contextBridge.exposeInMainWorld('electronAPI', {
     onClearResults: (callback) => ipcRenderer.on('clear-results', () => callback()),
     onAnalysisProcessTerminated: (callback) => ipcRenderer.on('analysis-process-terminated', () => callback()),
 
+    // Stored flows (backend results store), one page per call: resolves to { rows, next }
+    queryFlows: (params) => ipcRenderer.invoke('query-flows', params),
+
     // System Metrics
     onSystemMetrics: (callback) => ipcRenderer.on('system-metrics', (_event, value) => callback(value)),
 
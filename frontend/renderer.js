@@ -617,6 +617,7 @@ const PageInitializers = {
             logOutputArea.value = IPCManager.logBuffer.join('\n');
             logOutputArea.scrollTop = logOutputArea.scrollHeight;
         }
+        FlowLog.init();
     },
 
     alert: function () {
@@ -642,6 +643,82 @@ const PageInitializers = {
     }
 };
 
+// --- FLOW LOG (stored flows, paged from the backend results store) ---
+const FlowLog = {
+    PAGE_SIZE: 50,
+    cursors: [null], // cursors[i] is the `before` cursor of page i; page 0 starts at the newest flow
+    page: 0,
+    filters: {},
+
+    init: function () {
+        this.tableBody = document.getElementById('flowLogTableBody');
+        this.pageInfo = document.getElementById('flowLogPageInfo');
+        this.newerButton = document.getElementById('flowLogNewerButton');
+        this.olderButton = document.getElementById('flowLogOlderButton');
+        if (!this.tableBody) return;
+        document.getElementById('flowLogSearchButton')?.addEventListener('click', () => {
+            this.filters = {
+                src_ip: document.getElementById('flowLogSrcIp')?.value.trim(),
+                dst_ip: document.getElementById('flowLogDstIp')?.value.trim(),
+                label: document.getElementById('flowLogLabel')?.value.trim(),
+                suspicious: document.getElementById('flowLogSuspicious')?.checked ? 1 : ''
+            };
+            this.load(0, true);
+        });
+        this.newerButton?.addEventListener('click', () => this.load(this.page - 1));
+        this.olderButton?.addEventListener('click', () => this.load(this.page + 1));
+        this.load(0, true);
+    },
+
+    load: async function (page, reset = false) {
+        if (!window.electronAPI || !this.tableBody || page < 0) return;
+        if (reset) this.cursors = [null];
+        if (page >= this.cursors.length) return;
+        try {
+            const result = await window.electronAPI.queryFlows({ ...this.filters, page_size: this.PAGE_SIZE, before: this.cursors[page] });
+            this.page = page;
+            this.cursors[page + 1] = result.next;
+            this.cursors.length = page + 2; // Drop cursors of pages past this one (they change as flows are added)
+            this.render(result.rows);
+        } catch (error) {
+            console.error('Failed to load stored flows:', error);
+            this.renderMessage('Could not load stored flows (backend service unavailable).');
+        }
+        if (this.pageInfo) this.pageInfo.textContent = `Page ${this.page + 1}`;
+        if (this.newerButton) this.newerButton.disabled = this.page === 0;
+        if (this.olderButton) this.olderButton.disabled = !this.cursors[this.page + 1];
+    },
+
+    renderMessage: function (text) {
+        UIUpdater.clearTable(this.tableBody);
+        const cell = this.tableBody.insertRow().insertCell();
+        cell.colSpan = 8;
+        cell.textContent = text;
+        cell.style.textAlign = 'center'; cell.style.color = 'var(--text-muted)';
+    },
+
+    render: function (rows) {
+        if (!rows || rows.length === 0) {
+            this.renderMessage('No stored flows match.');
+            return;
+        }
+        UIUpdater.clearTable(this.tableBody);
+        const protocolNames = { 6: 'TCP', 17: 'UDP', 1: 'ICMP' };
+        rows.forEach(flow => {
+            const row = this.tableBody.insertRow();
+            if (flow.Suspicious) row.classList.add('suspicious-row');
+            row.insertCell().textContent = flow.Timestamp ? new Date(flow.Timestamp).toLocaleString() : 'N/A';
+            row.insertCell().textContent = flow['Src IP'] || 'N/A';
+            row.insertCell().textContent = flow['Src Port'] ?? 'N/A';
+            row.insertCell().textContent = flow['Dst IP'] || 'N/A';
+            row.insertCell().textContent = flow['Dst Port'] ?? 'N/A';
+            row.insertCell().textContent = protocolNames[flow.Protocol] || flow.Protocol || 'N/A';
+            row.insertCell().textContent = flow.Prediction ?? 'N/A';
+            row.insertCell().textContent = typeof flow.Prediction_Probability === 'number' ? flow.Prediction_Probability.toFixed(3) : 'N/A';
+        });
+    }
+};
+
 // --- UI UPDATE UTILITIES ---
 const UIUpdater = {
     updateDetectionStatus: function (isActive, text) {
@@ -2,15 +2,24 @@
 const { app, BrowserWindow, ipcMain } = require('electron');
 const path = require('path');
 const { spawn } = require('child_process');
+const http = require('http');
+const crypto = require('crypto');
 const fs = require('fs');
-const csv = require('csv-parser');
 const si = require('systeminformation');
 // const Store = require('electron-store');
 
 // --- PATHS AND CONSTANTS ---
 const BASE_DIR = __dirname;
 const BACKEND_DIR = path.join(BASE_DIR, 'backend');
-const PYTHON_SCRIPT_PATH = path.join(BACKEND_DIR, 'main.py');
+const BACKEND_SERVICE_SCRIPT = path.join(BACKEND_DIR, 'server.py');
+const BACKEND_SERVICE_HOST = '127.0.0.1'; // Must match SERVICE_HOST in backend/prediction_module/config.py
+const BACKEND_SERVICE_PORT = 8765;
+const BACKEND_SERVICE_STARTUP_TIMEOUT_MS = 60000;
+// Per-launch secret the service requires on every request, so other local programs and web pages cannot drive it.
+// Env var and header names must match SERVICE_TOKEN_ENV / SERVICE_TOKEN_HEADER in backend/prediction_module/config.py
+const BACKEND_SERVICE_TOKEN = crypto.randomBytes(32).toString('hex');
+const BACKEND_SERVICE_TOKEN_ENV = 'APT_BACKEND_TOKEN';
+const BACKEND_SERVICE_TOKEN_HEADER = 'X-Backend-Token';
 const RESULTS_DIR = path.join(BACKEND_DIR, 'results');
 const VENV_DIR = path.join(BASE_DIR, '.venv'); // Ensure this matches your venv path
 const PYTHON_EXECUTABLE = process.platform === 'win32'
@@ -19,13 +28,14 @@ const PYTHON_EXECUTABLE = process.platform === 'win32'
 
 const PREDICTIONS_FILE = path.join(RESULTS_DIR, 'network_flows_Predictions.csv');
 const SUSPICIOUS_FILE = path.join(RESULTS_DIR, 'Suspicious_network_flows_Predictions.csv');
-const TRAFFIC_ANALYSIS_FILE = path.join(RESULTS_DIR, 'traffic_analysis.csv');
-const GLOBAL_THREAT_MAP_FILE = path.join(RESULTS_DIR, 'global_threat_map.csv');
+const SUMMARY_FILE = path.join(RESULTS_DIR, 'summary.json'); // Must match SUMMARY_JSON_PATH in backend/prediction_module/config.py
 const MAX_SCAN_HISTORY_LENGTH = 7;
 
 // --- GLOBAL VARIABLES ---
 let mainWindow;
-let pythonProcess = null;
+let backendService = null; // Long-running backend service process (server.py)
+let scanRunning = false;
+let scanPollTimer = null;
 let analysisManuallyStopped = false;
 let systemMetricsInterval = null;
 let store;
@@ -214,11 +224,8 @@ const AppWindow = {
 
         mainWindow.on('closed', () => {
             SystemMonitor.stop();
-            if (pythonProcess) {
-                analysisManuallyStopped = true;
-                pythonProcess.kill('SIGTERM'); // Or SIGKILL if necessary
-                pythonProcess = null;
-            }
+            if (scanRunning) analysisManuallyStopped = true;
+            BackendService.stop(); // Stops the running scan and the service
             mainWindow = null;
         });
 
@@ -276,92 +283,65 @@ const SystemMonitor = {
 
 // --- RESULTS PROCESSOR MODULE ---
 const ResultsProcessor = {
-    _readFilePromise: (filePath, dataArray, onDataCallback) => {
-        return new Promise((resolve, reject) => {
-            if (!fs.existsSync(filePath)) {
-                resolve(); return; // File not found is not an error for this function's purpose
-            }
-            const stream = fs.createReadStream(filePath);
-            stream.pipe(csv())
-                .on('data', (row) => {
-                    if (dataArray) dataArray.push(row);
-                    if (onDataCallback) onDataCallback(row);
-                })
-                .on('end', () => resolve())
-                .on('error', (error) => {
-                    if (mainWindow && !mainWindow.isDestroyed()) mainWindow.webContents.send('status-update', `Lỗi đọc ${path.basename(filePath)}.`);
-                    reject(error);
-                });
-        });
+    // summary.json is written by the backend reporter (prediction_module/reporter.py ResultSummary) with every
+    // aggregate the UI shows, so the result CSVs are not parsed here.
+    _readSummary: async () => {
+        try {
+            return JSON.parse(await fs.promises.readFile(SUMMARY_FILE, 'utf-8'));
+        } catch (error) {
+            if (error.code === 'ENOENT') return null; // No scan finished yet
+            throw error;
+        }
     },
 
-    _aggregateAPTStatistics: (suspiciousFlows) => {
-        let aptTypeCounts = {}, topSourceAPTIPs = {}, topDestAPTIPs = {}, aptProtocolCounts = {};
-        suspiciousFlows.forEach(flow => {
-            const predictionType = flow.Prediction || "Unknown";
-            aptTypeCounts[predictionType] = (aptTypeCounts[predictionType] || 0) + 1;
-            const srcIp = flow['Src IP'] || "Unknown";
-            topSourceAPTIPs[srcIp] = (topSourceAPTIPs[srcIp] || 0) + 1;
-            const dstIp = flow['Dst IP'] || "Unknown";
-            topDestAPTIPs[dstIp] = (topDestAPTIPs[dstIp] || 0) + 1;
-            let protocolName = String(flow.Protocol || "Unknown");
-            if (flow.Protocol === '6') protocolName = 'TCP';
-            else if (flow.Protocol === '17') protocolName = 'UDP';
-            else if (flow.Protocol === '1') protocolName = 'ICMP'; // Added ICMP
-            aptProtocolCounts[protocolName] = (aptProtocolCounts[protocolName] || 0) + 1;
-        });
-        const getTopN = (obj, n) => Object.entries(obj).sort(([, a], [, b]) => b - a).slice(0, n).reduce((r, [k, v]) => ({ ...r, [k]: v }), {});
-        return {
-            aptTypeCounts,
-            topSourceAPTIPs: getTopN(topSourceAPTIPs, 5),
-            topDestAPTIPs: getTopN(topDestAPTIPs, 5),
-            aptProtocolCounts
-        };
+    // Latest finished scans from the backend's results store (GET /scans), oldest first; null if unavailable,
+    // in which case the history kept in the local settings store is shown.
+    _loadScanHistory: async () => {
+        try {
+            const { statusCode, body } = await BackendService.request('GET', `/scans?limit=${MAX_SCAN_HISTORY_LENGTH}&status=finished`);
+            if (statusCode !== 200) return null;
+            return body.scans.reverse().map(scan => ({
+                timestamp: Math.round(scan.started * 1000),
+                normal: scan.normal_mb || 0,
+                suspicious: scan.suspicious_mb || 0,
+                malicious: scan.suspicious_mb || 0,
+                threatsDetected: scan.suspicious_flows || 0
+            }));
+        } catch (error) {
+            console.error('Failed to load scan history from the backend service:', error);
+            return null;
+        }
     },
 
-    _getCurrentScanTrafficSummary: (trafficDataFromFile) => {
-        let summary = { normal: 0, suspicious: 0, malicious: 0 };
-        if (trafficDataFromFile.length > 0 && trafficDataFromFile[0]) {
-            summary.normal = parseFloat(trafficDataFromFile[0].normal) || 0;
-            summary.suspicious = parseFloat(trafficDataFromFile[0].suspicious) || 0;
-            summary.malicious = parseFloat(trafficDataFromFile[0].malicious) || 0;
-        }
-        return summary;
+    // One page of stored flows for the log view (GET /flows: indexed query, newest first).
+    // params: page_size, before (the previous page's `next`), src_ip, dst_ip, label, scan_id, since, until, suspicious
+    queryFlows: async (params = {}) => {
+        BackendService.start(); // No-op when the service is already running
+        await BackendService.waitUntilReady(BACKEND_SERVICE_STARTUP_TIMEOUT_MS);
+        const query = new URLSearchParams(Object.entries(params).filter(([, value]) => value !== undefined && value !== null && value !== ''));
+        const { statusCode, body } = await BackendService.request('GET', `/flows?${query}`);
+        if (statusCode !== 200) throw new Error(body.error || `HTTP ${statusCode}`);
+        return body;
     },
 
     processAndSend: async (isSuccess) => {
         if (!mainWindow || mainWindow.isDestroyed()) return;
 
-        const allPredictions = [], suspiciousFlows = [], trafficData = [], globalThreatMapData = [];
-        let totalThreats = 0, criticalAlerts = 0;
-
-        const readPromises = [
-            ResultsProcessor._readFilePromise(PREDICTIONS_FILE, allPredictions),
-            ResultsProcessor._readFilePromise(SUSPICIOUS_FILE, suspiciousFlows, (data) => {
-                totalThreats++;
-                const prediction = data.Prediction ? String(data.Prediction).toLowerCase() : '';
-                const probability = parseFloat(data.Prediction_Probability);
-                if (prediction.includes('critical') || (probability && probability > 0.9)) criticalAlerts++;
-            }),
-            ResultsProcessor._readFilePromise(TRAFFIC_ANALYSIS_FILE, trafficData),
-            ResultsProcessor._readFilePromise(GLOBAL_THREAT_MAP_FILE, globalThreatMapData)
-        ];
-
         try {
-            await Promise.all(readPromises);
-            const currentScanTraffic = ResultsProcessor._getCurrentScanTrafficSummary(trafficData);
-            const aptStats = ResultsProcessor._aggregateAPTStatistics(suspiciousFlows);
-            const updatedScanHistory = SettingsHandler.updateScanHistory(currentScanTraffic, isSuccess, suspiciousFlows.length);
+            const summary = await ResultsProcessor._readSummary() || {};
+            const currentScanTraffic = summary.trafficAnalysis || { normal: 0, suspicious: 0, malicious: 0 };
+            const localScanHistory = SettingsHandler.updateScanHistory(currentScanTraffic, isSuccess, summary.totalThreats || 0);
+            const updatedScanHistory = await ResultsProcessor._loadScanHistory() || localScanHistory;
 
             mainWindow.webContents.send('results-data', {
-                suspicious: suspiciousFlows,
-                totalThreats: totalThreats, criticalAlerts: criticalAlerts,
+                suspicious: summary.alerts || [],
+                totalThreats: summary.totalThreats || 0, criticalAlerts: summary.criticalAlerts || 0,
                 trafficAnalysisDataForCurrentScan: currentScanTraffic,
-                globalThreatMap: globalThreatMapData[0] || { activeAttacks: 0, countries: 0, totalToday: 0 },
-                aptTypeCounts: aptStats.aptTypeCounts,
-                topSourceAPTIPs: aptStats.topSourceAPTIPs,
-                topDestAPTIPs: aptStats.topDestAPTIPs,
-                aptProtocolCounts: aptStats.aptProtocolCounts,
+                globalThreatMap: summary.globalThreatMap || { activeAttacks: 0, countries: 0, totalToday: 0 },
+                aptTypeCounts: summary.aptTypeCounts || {},
+                topSourceAPTIPs: summary.topSourceAPTIPs || {},
+                topDestAPTIPs: summary.topDestAPTIPs || {},
+                aptProtocolCounts: summary.aptProtocolCounts || {},
                 scanHistory: updatedScanHistory
             });
             if (mainWindow && !mainWindow.isDestroyed()) mainWindow.webContents.send('status-update', 'Đã tải và xử lý kết quả.');
@@ -372,10 +352,74 @@ const ResultsProcessor = {
     }
 };
 
+// --- BACKEND SERVICE MODULE ---
+// Long-running `python server.py`: keeps pandas/scapy/xgboost imported and the model loaded
+// between scans, so a new scan starts in milliseconds instead of seconds.
+const BackendService = {
+    start: () => {
+        if (backendService) return;
+        backendService = spawn(PYTHON_EXECUTABLE, [BACKEND_SERVICE_SCRIPT, '--port', String(BACKEND_SERVICE_PORT)], {
+            cwd: BACKEND_DIR,
+            env: { ...process.env, [BACKEND_SERVICE_TOKEN_ENV]: BACKEND_SERVICE_TOKEN } // Not in argv: visible to other users
+        });
+        backendService.stdout.on('data', (data) => {
+            const message = data.toString();
+            if (mainWindow && !mainWindow.isDestroyed()) mainWindow.webContents.send('status-update', message);
+        });
+        backendService.stderr.on('data', (data) => {
+            const message = data.toString();
+            console.error(`Python stderr: ${message.trim()}`);
+            if (mainWindow && !mainWindow.isDestroyed()) mainWindow.webContents.send('status-update', `PYTHON_ERR: ${message}`);
+        });
+        backendService.on('close', (code, signal) => {
+            console.log(`Backend service exited (code ${code}, signal ${signal}).`);
+            backendService = null;
+            if (scanRunning) AnalysisRunner.finish({ status: 'failed' });
+        });
+        backendService.on('error', (err) => {
+            console.error('Failed to start backend service:', err);
+            backendService = null;
+        });
+    },
+    request: (method, route, body) => new Promise((resolve, reject) => {
+        const payload = method === 'POST' ? JSON.stringify(body || {}) : null; // The service only accepts JSON POSTs
+        const headers = { [BACKEND_SERVICE_TOKEN_HEADER]: BACKEND_SERVICE_TOKEN };
+        if (payload) Object.assign(headers, { 'Content-Type': 'application/json', 'Content-Length': Buffer.byteLength(payload) });
+        const req = http.request({
+            host: BACKEND_SERVICE_HOST, port: BACKEND_SERVICE_PORT, path: route, method, headers
+        }, (res) => {
+            let data = '';
+            res.on('data', (chunk) => { data += chunk; });
+            res.on('end', () => {
+                try { resolve({ statusCode: res.statusCode, body: data ? JSON.parse(data) : {} }); }
+                catch (error) { reject(error); }
+            });
+        });
+        req.on('error', reject);
+        if (payload) req.write(payload);
+        req.end();
+    }),
+    waitUntilReady: async (timeoutMs) => {
+        const deadline = Date.now() + timeoutMs;
+        while (Date.now() < deadline) {
+            try {
+                const { statusCode } = await BackendService.request('GET', '/health');
+                if (statusCode === 200) return;
+            } catch (error) { /* Not listening yet */ }
+            if (!backendService) throw new Error('Backend service exited during startup.');
+            await new Promise((resolve) => setTimeout(resolve, 250));
+        }
+        throw new Error('Backend service did not start in time.');
+    },
+    stop: () => {
+        if (backendService) backendService.kill('SIGTERM'); // Same as stopping the old per-scan process
+    }
+};
+
 // --- ANALYSIS RUNNER MODULE ---
 const AnalysisRunner = {
-    start: () => {
-        if (pythonProcess) {
+    start: async () => {
+        if (scanRunning) {
             if (mainWindow && !mainWindow.isDestroyed()) mainWindow.webContents.send('status-update', 'Phân tích đang chạy.');
             return;
         }
@@ -385,84 +429,87 @@ const AnalysisRunner = {
         }
 
         analysisManuallyStopped = false;
+        scanRunning = true;
         if (mainWindow && !mainWindow.isDestroyed()) {
             mainWindow.webContents.send('status-update', 'Bắt đầu phân tích...');
             mainWindow.webContents.send('clear-results');
         }
 
         if (!fs.existsSync(RESULTS_DIR)) fs.mkdirSync(RESULTS_DIR, { recursive: true });
-        [PREDICTIONS_FILE, SUSPICIOUS_FILE, TRAFFIC_ANALYSIS_FILE, GLOBAL_THREAT_MAP_FILE].forEach(file => {
+        [PREDICTIONS_FILE, SUSPICIOUS_FILE, SUMMARY_FILE].forEach(file => {
             if (fs.existsSync(file)) fs.unlinkSync(file);
         });
 
         // --- BẮT ĐẦU THAY ĐỔI ĐỂ TRUYỀN CONFIG ---
         const currentSettings = SettingsHandler.load(); // Lấy tất cả settings
-        const pythonEnv = { ...process.env }; // Sao chép biến môi trường hiện tại
+        const scanEnv = {}; // Notification settings for this scan, applied by server.py
 
         if (currentSettings.enableEmailNotifications) {
-            console.log("Email notifications enabled by settings. Passing config to Python via ENV.");
-            if (currentSettings.emailSenderAddress) pythonEnv.EMAIL_SENDER_ADDRESS = currentSettings.emailSenderAddress;
-            if (currentSettings.emailSenderPassword) pythonEnv.EMAIL_SENDER_PASSWORD = currentSettings.emailSenderPassword; // QUAN TRỌNG: Mật khẩu được truyền
-            if (currentSettings.emailReceiverAddress) pythonEnv.EMAIL_RECEIVER_ADDRESS = currentSettings.emailReceiverAddress;
-            if (currentSettings.emailSmtpServer) pythonEnv.SMTP_SERVER = currentSettings.emailSmtpServer;
-            if (currentSettings.emailSmtpPort) pythonEnv.SMTP_PORT = String(currentSettings.emailSmtpPort); // Chuyển sang string cho ENV
+            console.log("Email notifications enabled by settings. Passing config to the backend service.");
+            if (currentSettings.emailSenderAddress) scanEnv.EMAIL_SENDER_ADDRESS = currentSettings.emailSenderAddress;
+            if (currentSettings.emailSenderPassword) scanEnv.EMAIL_SENDER_PASSWORD = currentSettings.emailSenderPassword; // QUAN TRỌNG: Mật khẩu được truyền
+            if (currentSettings.emailReceiverAddress) scanEnv.EMAIL_RECEIVER_ADDRESS = currentSettings.emailReceiverAddress;
+            if (currentSettings.emailSmtpServer) scanEnv.SMTP_SERVER = currentSettings.emailSmtpServer;
+            if (currentSettings.emailSmtpPort) scanEnv.SMTP_PORT = String(currentSettings.emailSmtpPort); // Chuyển sang string cho ENV
         } else {
             console.log("Email notifications disabled by settings.");
         }
 
         if (currentSettings.enableTelegramNotifications) {
-            console.log("Telegram notifications enabled by settings. Passing config to Python via ENV.");
-            if (currentSettings.telegramBotToken) pythonEnv.BOT_TOKEN = currentSettings.telegramBotToken; // QUAN TRỌNG: Token được truyền
-            if (currentSettings.telegramChatId) pythonEnv.CHAT_ID = currentSettings.telegramChatId;
+            console.log("Telegram notifications enabled by settings. Passing config to the backend service.");
+            if (currentSettings.telegramBotToken) scanEnv.BOT_TOKEN = currentSettings.telegramBotToken; // QUAN TRỌNG: Token được truyền
+            if (currentSettings.telegramChatId) scanEnv.CHAT_ID = currentSettings.telegramChatId;
         } else {
             console.log("Telegram notifications disabled by settings.");
         }
         // --- KẾT THÚC THAY ĐỔI ĐỂ TRUYỀN CONFIG ---
 
-        // Sử dụng pythonEnv khi spawn
-        pythonProcess = spawn(PYTHON_EXECUTABLE, [PYTHON_SCRIPT_PATH], {
-            cwd: BACKEND_DIR,
-            env: pythonEnv // Truyền các biến môi trường đã được tùy chỉnh
-        });
-
-        pythonProcess.stdout.on('data', (data) => {
-            const message = data.toString();
-            if (mainWindow && !mainWindow.isDestroyed()) mainWindow.webContents.send('status-update', message);
-        });
-        pythonProcess.stderr.on('data', (data) => {
-            const message = data.toString();
-            console.error(`Python stderr: ${message.trim()}`);
-            if (mainWindow && !mainWindow.isDestroyed()) mainWindow.webContents.send('status-update', `PYTHON_ERR: ${message}`);
-        });
-        pythonProcess.on('close', (code, signal) => {
-            const wasKilledByUser = analysisManuallyStopped || signal === 'SIGTERM' || signal === 'SIGINT';
-            let statusMsg = '', processSuccess = false;
-
-            if (wasKilledByUser) statusMsg = 'Phân tích dừng bởi người dùng.';
-            else if (code !== 0) statusMsg = `Phân tích thất bại (mã ${code}).`;
-            else { statusMsg = `Phân tích hoàn tất.`; processSuccess = true; }
-
-            if (mainWindow && !mainWindow.isDestroyed()) {
-                mainWindow.webContents.send('status-update', statusMsg);
-                if (wasKilledByUser || code !==0 ) mainWindow.webContents.send('analysis-process-terminated');
-            }
-            ResultsProcessor.processAndSend(processSuccess);
-            pythonProcess = null;
-            analysisManuallyStopped = false;
-        });
-        pythonProcess.on('error', (err) => {
-            console.error('Failed to start Python process:', err);
+        try {
+            BackendService.start(); // No-op when the service is already running
+            await BackendService.waitUntilReady(BACKEND_SERVICE_STARTUP_TIMEOUT_MS);
+            const { statusCode, body } = await BackendService.request('POST', '/scan', { env: scanEnv });
+            if (statusCode !== 202) throw new Error(body.error || `HTTP ${statusCode}`);
+            scanPollTimer = setInterval(AnalysisRunner.poll, 1000);
+        } catch (err) {
+            console.error('Failed to start analysis:', err);
+            scanRunning = false;
             if (mainWindow && !mainWindow.isDestroyed()) {
                 mainWindow.webContents.send('status-update', `LỖI KHỞI CHẠY PYTHON: ${err.message}`);
                 mainWindow.webContents.send('analysis-process-terminated');
             }
-            pythonProcess = null;
-        });
+        }
+    },
+    poll: async () => {
+        try {
+            const { body } = await BackendService.request('GET', '/status');
+            if (body.status !== 'running') AnalysisRunner.finish(body);
+        } catch (error) {
+            console.error('Failed to poll backend service:', error);
+        }
+    },
+    finish: (scanState) => {
+        if (!scanRunning) return;
+        clearInterval(scanPollTimer);
+        scanPollTimer = null;
+        const wasKilledByUser = analysisManuallyStopped || scanState.status === 'stopped';
+        let statusMsg = '', processSuccess = false;
+
+        if (wasKilledByUser) statusMsg = 'Phân tích dừng bởi người dùng.';
+        else if (scanState.status !== 'finished') statusMsg = `Phân tích thất bại (${scanState.status}).`;
+        else { statusMsg = `Phân tích hoàn tất.`; processSuccess = true; }
+
+        if (mainWindow && !mainWindow.isDestroyed()) {
+            mainWindow.webContents.send('status-update', statusMsg);
+            if (!processSuccess) mainWindow.webContents.send('analysis-process-terminated');
+        }
+        ResultsProcessor.processAndSend(processSuccess);
+        scanRunning = false;
+        analysisManuallyStopped = false;
     },
     stop: () => {
-        if (pythonProcess) {
+        if (scanRunning) {
             analysisManuallyStopped = true;
-            pythonProcess.kill('SIGTERM');
+            BackendService.request('POST', '/stop').catch((error) => console.error('Failed to stop analysis:', error));
             if (mainWindow && !mainWindow.isDestroyed()) mainWindow.webContents.send('status-update', 'Đang dừng phân tích...');
         } else {
             if (mainWindow && !mainWindow.isDestroyed()) {
@@ -492,6 +539,8 @@ app.whenReady().then(async () => {
         SettingsHandler.save(settings);
     });
 
+    ipcMain.handle('query-flows', (event, params) => ResultsProcessor.queryFlows(params));
+
     ipcMain.handle('load-settings', async () => { // Có thể để async nếu có gì đó bất đồng bộ
         if (!store) {
             console.error("Attempted to load settings, but store is not initialized.");